@@ -4,7 +4,9 @@ from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user, login_required
 from flask import redirect, url_for, flash
 from app.models.models import (db, User, Transaction, MoneyAccount, 
-                             GoldAccount, GoldBar, NobleRank, NobleRelation)
+                             GoldAccount, GoldBar, NobleRank, NobleRelation,
+                             BonusRate, Parameter)
+from app.services.config_cache import config_cache, bump_version
 
 class SecureModelView(ModelView):
     def is_accessible(self):
@@ -14,6 +16,20 @@ class SecureModelView(ModelView):
         flash('Please log in with admin privileges', 'error')
         return redirect(url_for('auth.login'))
 
+class ConfigModelView(SecureModelView):
+    """Tabelle di configurazione: ogni modifica incrementa la versione della cache"""
+    def on_model_change(self, form, model, is_created):
+        bump_version(self.session)
+
+    def on_model_delete(self, model):
+        bump_version(self.session)
+
+    def after_model_change(self, form, model, is_created):
+        config_cache.invalidate()
+
+    def after_model_delete(self, model):
+        config_cache.invalidate()
+
 class AdminHomeView(AdminIndexView):
     @expose('/')
     @login_required
@@ -36,6 +52,8 @@ admin.add_view(SecureModelView(User, db.session, name='Users'))
 admin.add_view(SecureModelView(MoneyAccount, db.session, name='Money Accounts'))
 admin.add_view(SecureModelView(GoldAccount, db.session, name='Gold Accounts'))
 admin.add_view(SecureModelView(GoldBar, db.session, name='Gold Bars'))
-admin.add_view(SecureModelView(NobleRank, db.session, name='Noble Ranks'))
+admin.add_view(ConfigModelView(NobleRank, db.session, name='Noble Ranks'))
+admin.add_view(ConfigModelView(BonusRate, db.session, name='Bonus Rates'))
+admin.add_view(ConfigModelView(Parameter, db.session, name='Parameters'))
 admin.add_view(SecureModelView(NobleRelation, db.session, name='Noble Relations'))
 admin.add_view(SecureModelView(Transaction, db.session, name='Transactions'))
@@ -5,9 +5,12 @@ from app.models import db, User, Transaction, Parameter
 from app.services.blockchain_service import BlockchainService
 from app.utils.monitoring import monitor_performance # Added import
 from app.services.noble_rank_service import NobleRankService
+from app.services.config_cache import config_cache, bump_version
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin') # Blueprint name simplified
 
+PARAMETER_DEFAULTS = {'transformation_rate': '1.0', 'commission_rate': '0.01'}
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -46,17 +49,22 @@ def system_status():
 @admin_required
 def parameters():
     if request.method == 'POST':
-        param = Parameter.query.first()
-        if not param:
-            param = Parameter()
-            db.session.add(param)
-        param.transformation_rate = request.form.get('transformation_rate', 1.0)
-        param.commission_rate = request.form.get('commission_rate', 0.01)
+        for key, default in PARAMETER_DEFAULTS.items():
+            param = Parameter.query.filter_by(key=key).first()
+            if not param:
+                param = Parameter(key=key)
+                db.session.add(param)
+            param.value = str(request.form.get(key, default))
+        # Stessa transazione: gli altri worker vedono la nuova versione al prossimo controllo
+        bump_version(db.session)
         db.session.commit()
+        config_cache.invalidate()
         flash('Parameters updated successfully', 'success')
         return redirect(url_for('admin.parameters'))
-    
-    params = Parameter.query.first()
+
+    config_cache.ensure_fresh_sync(db.session)
+    params = {key: config_cache.parameter(key, default)
+              for key, default in PARAMETER_DEFAULTS.items()}
     return render_template('admin/parameters.html', params=params)
 
 @admin_bp.route('/noble-system')
@@ -89,10 +97,11 @@ def refresh_cache():
 @admin_required
 def generate_report():
     # Generate system report
+    config_cache.ensure_fresh_sync(db.session)
     report_data = {
         'users': User.query.count(),
         'transactions': Transaction.query.count(),
-        'parameters': Parameter.query.first().to_dict()
+        'parameters': dict(config_cache.snapshot.parameters)
     }
     return jsonify(report_data)
 
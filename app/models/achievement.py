@@ -0,0 +1,23 @@
+from datetime import datetime
+from app.models import db
+
+
+class AchievementAward(db.Model):
+    """Soglia di volume già premiata: al massimo una riga per utente e livello"""
+    __tablename__ = 'achievement_awards'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'level', name='unique_user_achievement'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    level = db.Column(db.String(20), nullable=False)
+    threshold = db.Column(db.Numeric(15, 2), nullable=False)
+    reward_amount = db.Column(db.Numeric(10, 4), nullable=False)
+    volume = db.Column(db.Numeric(15, 2), nullable=False)
+    # Distribuzione settimanale che ha pagato il premio (vedi discard_effects)
+    distribution_id = db.Column(db.Integer, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AchievementAward {self.level} for user {self.user_id}>'
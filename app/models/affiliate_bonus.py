@@ -0,0 +1,21 @@
+from datetime import datetime
+from app.models import db
+
+
+class AffiliateBonusWeek(db.Model):
+    """Bonus affiliato accreditati per utente, settimana e livello"""
+    __tablename__ = 'affiliate_bonus_weeks'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'week_start', 'level', name='unique_user_week_level'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    week_start = db.Column(db.DateTime, nullable=False)
+    level = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    bonuses = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AffiliateBonusWeek {self.amount} for user {self.user_id} level {self.level}>'
@@ -0,0 +1,14 @@
+from datetime import datetime
+from app.models import db
+
+
+class ConfigVersion(db.Model):
+    """Contatore di versione della configurazione (parameters, bonus_rates, noble_ranks)"""
+    __tablename__ = 'config_versions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ConfigVersion {self.version}>'
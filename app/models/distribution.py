@@ -1,5 +1,4 @@
-
-from app.database import db
+from app.models import db
 from datetime import datetime
 
 class WeeklyDistributionLog(db.Model):
@@ -14,6 +13,10 @@ class WeeklyDistributionLog(db.Model):
     users_processed = db.Column(db.Integer)
     status = db.Column(db.String)
     error_details = db.Column(db.JSON, nullable=True)
+    # Checkpoint: ultimo user_id del blocco committato, per riprendere la run
+    last_user_id = db.Column(db.Integer, default=0)
+    chunks_committed = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class DistributionSnapshot(db.Model):
     __tablename__ = 'distribution_snapshots'
@@ -22,3 +25,20 @@ class DistributionSnapshot(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     snapshot_data = db.Column(db.JSON)
     restored = db.Column(db.Boolean, default=False)
+    distribution_id = db.Column(db.Integer, nullable=True, index=True)
+
+class DistributionJournalEntry(db.Model):
+    """Saldo precedente di un conto toccato da una distribuzione"""
+    __tablename__ = 'distribution_journal'
+
+    id = db.Column(db.Integer, primary_key=True)
+    distribution_id = db.Column(db.Integer, nullable=False)
+    account_type = db.Column(db.String(10), nullable=False)  # money, gold
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    balance_before = db.Column(db.Numeric(precision=10, scale=4))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('distribution_id',
+                                          'account_type',
+                                          'user_id',
+                                          name='unique_journal_entry'), )
@@ -74,6 +74,10 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean,
                           default=True,
                           comment='Account active status')
+    noble_rank_id = db.Column(db.Integer,
+                              db.ForeignKey('noble_ranks.id'),
+                              nullable=True,
+                              comment='Current noble rank (see RankEngine)')
 
     # Timestamps
     created_at = db.Column(db.DateTime,
@@ -157,7 +161,10 @@ class GoldAccount(db.Model):
     __table_args__ = {'extend_existing': True}
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('users.id'),
+                        nullable=False,
+                        index=True)
     balance = db.Column(db.Numeric(precision=10, scale=4),
                         default=Decimal('0.0000'))
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
@@ -172,7 +179,11 @@ class GoldAccount(db.Model):
 @validate_class_names()
 class Transaction(db.Model):
     __tablename__ = 'transactions'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Paginazione keyset delle transazioni in attesa di ricevuta
+        db.Index('ix_transactions_status_id', 'status', 'id'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -184,6 +195,9 @@ class Transaction(db.Model):
     status = db.Column(db.String(20), default='pending')
     date = db.Column(db.DateTime, default=datetime.utcnow)
     description = db.Column(db.String(200))
+    distribution_id = db.Column(db.Integer, index=True)
+    blockchain_tx = db.Column(db.String(66), nullable=True)
+    confirmed_at = db.Column(db.DateTime, nullable=True)
 
     user = db.relationship('User', back_populates='transactions')
 
@@ -202,7 +216,10 @@ class MoneyAccount(db.Model):
     __tablename__ = 'money_accounts'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('users.id'),
+                        nullable=False,
+                        index=True)
     balance = db.Column(db.Numeric(precision=10, scale=2), default=0.00)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -281,8 +298,9 @@ class BonusRate(db.Model):
 
     @staticmethod
     def get_rate(level):
-        rate = BonusRate.query.filter_by(level=level).first()
-        return Decimal(str(rate.rate)) if rate else Decimal('0')
+        from app.services.config_cache import config_cache
+        config_cache.ensure_fresh_sync(db.session)
+        return config_cache.bonus_rate(level)
 
 
 @validate_class_names()
@@ -308,7 +326,23 @@ class NobleRelation(db.Model):
 
     __table_args__ = (db.UniqueConstraint('referrer_id',
                                           'referred_id',
-                                          name='unique_referral'), )
+                                          name='unique_referral'),
+                      db.Index('ix_noble_relations_referred_level',
+                               'referred_id', 'level'))
+
+    @staticmethod
+    def upline_select(purchasers, max_level=3):
+        """(purchaser_id, beneficiary_id, level) per i livelli 1..max_level.
+
+        `purchasers` è una lista di id o una select di id (es. una tabella
+        temporanea); la query usa l'indice (referred_id, level).
+        """
+        relations = NobleRelation.__table__
+        return (db.select(relations.c.referred_id.label('purchaser_id'),
+                          relations.c.referrer_id.label('beneficiary_id'),
+                          relations.c.level)
+                .where(relations.c.referred_id.in_(purchasers),
+                       relations.c.level.between(1, max_level)))
 
 
 @validate_class_names()
@@ -359,6 +393,7 @@ class GoldReward(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     reward_amount = db.Column(db.Numeric(precision=10, scale=4),
                               nullable=False)
+    distribution_id = db.Column(db.Integer, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', back_populates='gold_rewards')
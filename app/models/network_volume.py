@@ -0,0 +1,26 @@
+from datetime import datetime
+from decimal import Decimal
+from app.models import db
+
+
+class NetworkVolume(db.Model):
+    """Volume personale e di rete (fino al 3° livello) in euro per utente.
+
+    Aggiornato nella stessa transazione di ogni acquisto o trasformazione;
+    NetworkVolumeService.rebuild lo ricalcola dal ledger.
+    """
+    __tablename__ = 'network_volumes'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    personal_volume = db.Column(db.Numeric(15, 2), nullable=False, default=Decimal('0'))
+    network_volume = db.Column(db.Numeric(15, 2), nullable=False, default=Decimal('0'))
+    # Volume cambiato dall'ultimo ricalcolo del rango (vedi RankEngine)
+    rank_dirty = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def total_volume(self) -> Decimal:
+        return self.personal_volume + self.network_volume
+
+    def __repr__(self):
+        return f'<NetworkVolume user {self.user_id}: {self.personal_volume} + {self.network_volume}>'
@@ -0,0 +1,18 @@
+from datetime import datetime
+from app.models import db
+
+
+class RankChange(db.Model):
+    """Cambio di rango da pubblicare on-chain (pushed_at nullo = in attesa)"""
+    __tablename__ = 'rank_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    previous_rank = db.Column(db.Integer, nullable=False)
+    new_rank = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    pushed_at = db.Column(db.DateTime, nullable=True, index=True)
+    tx_hash = db.Column(db.String(66), nullable=True)
+
+    def __repr__(self):
+        return f'<RankChange user {self.user_id}: {self.previous_rank} -> {self.new_rank}>'
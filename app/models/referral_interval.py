@@ -0,0 +1,25 @@
+from app.models import db
+
+
+class ReferralInterval(db.Model):
+    """Intervallo annidato di un utente nel suo albero referral.
+
+    I discendenti di un utente sono le righe dello stesso root_id con
+    lft compreso tra il suo lft e il suo rgt. Gli intervalli lasciano
+    spazio libero (da next_child a rgt) per i figli futuri.
+    """
+    __tablename__ = 'referral_intervals'
+    __table_args__ = (
+        db.Index('ix_referral_intervals_root_lft', 'root_id', 'lft'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    root_id = db.Column(db.Integer, nullable=False)
+    parent_id = db.Column(db.Integer, nullable=True)
+    lft = db.Column(db.BigInteger, nullable=False)
+    rgt = db.Column(db.BigInteger, nullable=False)
+    next_child = db.Column(db.BigInteger, nullable=False)
+    depth = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ReferralInterval user {self.user_id} [{self.lft}, {self.rgt}] depth {self.depth}>'
@@ -0,0 +1,39 @@
+from datetime import datetime
+from app.models import db
+
+
+class TransformationBatch(db.Model):
+    """Lotto di trasformazioni registrato on-chain con la sola radice Merkle"""
+    __tablename__ = 'transformation_batches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    merkle_root = db.Column(db.String(66), nullable=False, unique=True)
+    leaf_count = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    blockchain_tx_hash = db.Column(db.String(66), nullable=True)
+    block_number = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    committed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<TransformationBatch {self.merkle_root} ({self.leaf_count} leaves)>'
+
+
+class TransformationLeaf(db.Model):
+    """Foglia di un lotto: dati firmati nell'albero e prova di inclusione"""
+    __tablename__ = 'transformation_leaves'
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('transformation_batches.id'),
+                         nullable=False, index=True)
+    transformation_id = db.Column(db.Integer, db.ForeignKey('gold_transformations.id'),
+                                  nullable=False, unique=True)
+    leaf_index = db.Column(db.Integer, nullable=False)
+    address = db.Column(db.String(42), nullable=False)
+    euro_cents = db.Column(db.BigInteger, nullable=False)
+    gold_units = db.Column(db.BigInteger, nullable=False)
+    leaf_hash = db.Column(db.String(66), nullable=False)
+    proof = db.Column(db.Text, nullable=False)  # JSON: hash fratelli dalla foglia alla radice
+
+    def __repr__(self):
+        return f'<TransformationLeaf {self.transformation_id} in batch {self.batch_id}>'
@@ -1,6 +1,5 @@
-
 from datetime import datetime
-from app.database import db
+from app.models import db
 
 class WeeklyAmount(db.Model):
     __tablename__ = 'weekly_amounts'
@@ -15,3 +14,24 @@ class WeeklyAmount(db.Model):
 
     def __repr__(self):
         return f'<WeeklyAmount {self.amount} for user {self.user_id}>'
+
+
+class WeeklyUserTotal(db.Model):
+    """Totale settimanale per utente, aggiornato a ogni versamento"""
+    __tablename__ = 'weekly_user_totals'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'week_start', name='unique_user_week'),
+        db.Index('ix_weekly_user_totals_week_processed', 'week_start', 'processed'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    week_start = db.Column(db.DateTime, nullable=False)
+    week_end = db.Column(db.DateTime, nullable=False)
+    total = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    deposits = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<WeeklyUserTotal {self.total} for user {self.user_id}>'
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from app.models.models import User
 from app.utils.auth import auth_required
+from app.services.affiliate_bonus_service import AffiliateBonusService
 from app import db
 
 affiliate_bp = Blueprint('affiliate_bp', __name__, url_prefix='/affiliate') # Added Blueprint definition
@@ -53,4 +54,14 @@ def get_stats():
         'total_earnings': float(total_earnings),
         'active_affiliates': active_affiliates,
         'total_volume': float(total_volume)
-    })
\ No newline at end of file
+    })
+
+@affiliate_bp.route('/earnings', methods=['GET'])
+@auth_required
+async def get_earnings():
+    """Get weekly affiliate earnings by level."""
+    weeks = request.args.get('weeks', 4, type=int)
+    result = await AffiliateBonusService.get_earnings(request.user_id, weeks)
+    if result['status'] != 'success':
+        return jsonify({'error': result['message']}), 500
+    return jsonify(result)
@@ -2,11 +2,13 @@
 from flask import Blueprint, request, jsonify, g
 from app.middleware.security import security
 from app.services.transformation_service import TransformationService
+from app.services.transformation_batch_service import MerkleBatchRecorder
 from app.schemas.transformation_schema import TransformationSchema
 from marshmallow import ValidationError
 
 transform_bp = Blueprint('transformations', __name__)
 transformation_service = TransformationService()
+batch_recorder = MerkleBatchRecorder()
 
 @transform_bp.route('/transform', methods=['POST'])
 @security.require_auth
@@ -46,3 +48,13 @@ async def transform_status(transaction_id):
         return jsonify(status), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 400
+
+@transform_bp.route('/transform/proof/<int:transformation_id>')
+@security.require_auth
+@security.rate_limit('api')
+async def transform_proof(transformation_id):
+    """Prova di inclusione della trasformazione nella radice Merkle del suo lotto"""
+    proof = await batch_recorder.get_proof(transformation_id, user_id=g.user_id)
+    if proof['status'] != 'success':
+        return jsonify({'error': proof['message']}), 404
+    return jsonify(proof), 200
@@ -0,0 +1,140 @@
+"""Premi achievement che scattano solo all'attraversamento di una soglia.
+
+Le soglie sono tenute ordinate: a ogni aggiornamento di volume bastano due
+bisect per trovare le soglie superate tra il volume precedente e quello
+nuovo, di solito nessuna. Ogni premio pagato lascia una riga in
+achievement_awards con vincolo unico (utente, livello), inserita con
+ON CONFLICT DO NOTHING prima dell'accredito: due processi che vedono lo
+stesso attraversamento pagano una sola volta.
+
+Il controllo parte da record_volumes: ogni aggiornamento dei contatori
+confronta il volume totale prima e dopo per l'acquirente e per i suoi
+referrer fino al 3° livello, nella stessa transazione. I premi pagati da
+una distribuzione settimanale portano il suo id, così il ripristino della
+distribuzione li può stornare.
+"""
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+import logging
+
+from sqlalchemy import bindparam, insert, text
+
+from app.models.achievement import AchievementAward
+from app.models.models import GoldAccount, GoldReward
+from app.services.weekly_amount_service import UPSERT_DIALECTS
+
+logger = logging.getLogger(__name__)
+
+achievement_awards = AchievementAward.__table__
+gold_rewards = GoldReward.__table__
+
+# Come CREDIT_GOLD della distribuzione settimanale, che però importa
+# network_volume_service: qui serve senza il ciclo di import
+CREDIT_REWARD = text("""UPDATE gold_accounts
+                        SET balance = balance + :gold
+                        WHERE user_id = :user_id""").bindparams(
+    bindparam('gold', type_=GoldAccount.__table__.c.balance.type))
+
+ACHIEVEMENT_THRESHOLDS = {
+    'bronze': Decimal('5000'),
+    'silver': Decimal('10000'),
+    'gold': Decimal('25000'),
+    'platinum': Decimal('50000')
+}
+
+ACHIEVEMENT_REWARDS = {
+    'bronze': Decimal('0.1000'),
+    'silver': Decimal('0.2500'),
+    'gold': Decimal('0.5000'),
+    'platinum': Decimal('1.0000')
+}
+
+
+class AchievementEngine:
+
+    def __init__(self, thresholds: Dict[str, Decimal], rewards: Dict[str, Decimal]):
+        if set(thresholds) != set(rewards):
+            raise ValueError("Every achievement threshold needs a reward")
+        ordered = sorted(thresholds.items(), key=lambda item: item[1])
+        if any(threshold <= 0 for _, threshold in ordered):
+            raise ValueError("Achievement thresholds must be positive")
+        self.levels = [level for level, _ in ordered]
+        self.bounds = [threshold for _, threshold in ordered]
+        self.rewards = dict(rewards)
+
+    def crossed(self, previous: Decimal, current: Decimal) -> List[str]:
+        """Livelli con previous < soglia <= current, dal più basso"""
+        if current <= previous:
+            return []
+        return self.levels[bisect_right(self.bounds, previous):
+                           bisect_right(self.bounds, current)]
+
+    def level_for(self, volume: Decimal) -> Optional[str]:
+        """Livello più alto raggiunto con questo volume"""
+        position = bisect_right(self.bounds, volume)
+        return self.levels[position - 1] if position else None
+
+    def _claim(self, dialect_name: str, user_id: int, level: str,
+               current: Decimal, now: datetime, distribution_id: Optional[int]):
+        return UPSERT_DIALECTS[dialect_name](achievement_awards).values(
+            user_id=user_id, level=level, threshold=self.bounds[self.levels.index(level)],
+            reward_amount=self.rewards[level], volume=current, created_at=now,
+            distribution_id=distribution_id
+        ).on_conflict_do_nothing(
+            index_elements=[achievement_awards.c.user_id, achievement_awards.c.level])
+
+    def _awarded(self, user_id: int, level: str) -> Dict:
+        reward = self.rewards[level]
+        logger.info(f"Achievement {level} awarded to user {user_id}: {reward}g")
+        return {'level': level, 'threshold': self.bounds[self.levels.index(level)],
+                'reward_amount': reward}
+
+    async def award(self, session, user_id: int, previous: Decimal,
+                    current: Decimal, distribution_id: Optional[int] = None) -> List[Dict]:
+        """Registra e accredita i livelli attraversati non ancora pagati.
+
+        Va chiamato nella transazione che aggiorna il volume; restituisce i
+        premi effettivamente accreditati.
+        """
+        now = datetime.utcnow()
+        awarded = []
+        for level in self.crossed(previous, current):
+            claim = self._claim(session.bind.dialect.name, user_id, level, current, now,
+                                distribution_id)
+            if (await session.execute(claim)).rowcount != 1:
+                continue
+            reward = self.rewards[level]
+            credited = await session.execute(CREDIT_REWARD, {'gold': reward, 'user_id': user_id})
+            if credited.rowcount != 1:
+                raise ValueError(f"Gold account not found for user {user_id}")
+            await session.execute(insert(gold_rewards).values(
+                user_id=user_id, reward_amount=reward, created_at=now,
+                distribution_id=distribution_id))
+            awarded.append(self._awarded(user_id, level))
+        return awarded
+
+    def award_sync(self, connection, user_id: int, previous: Decimal,
+                   current: Decimal, distribution_id: Optional[int] = None) -> List[Dict]:
+        """Come award, per connessioni sincrone (shard)"""
+        now = datetime.utcnow()
+        awarded = []
+        for level in self.crossed(previous, current):
+            claim = self._claim(connection.dialect.name, user_id, level, current, now,
+                                distribution_id)
+            if connection.execute(claim).rowcount != 1:
+                continue
+            reward = self.rewards[level]
+            credited = connection.execute(CREDIT_REWARD, {'gold': reward, 'user_id': user_id})
+            if credited.rowcount != 1:
+                raise ValueError(f"Gold account not found for user {user_id}")
+            connection.execute(insert(gold_rewards).values(
+                user_id=user_id, reward_amount=reward, created_at=now,
+                distribution_id=distribution_id))
+            awarded.append(self._awarded(user_id, level))
+        return awarded
+
+
+# Motore con le soglie di default, condiviso dai job che aggiornano i volumi
+achievement_engine = AchievementEngine(ACHIEVEMENT_THRESHOLDS, ACHIEVEMENT_REWARDS)
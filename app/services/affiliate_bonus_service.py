@@ -0,0 +1,114 @@
+"""Proiezione settimanale dei bonus affiliato.
+
+Ogni accredito di bonus somma importo e numero di bonus alla riga
+(utente, settimana, livello) di affiliate_bonus_weeks, nella stessa
+transazione dell'accredito. Le domande "quanto ho guadagnato questa
+settimana dal 2° livello" diventano letture di poche righe sull'indice
+unico, senza risalire la catena di accounting_entries.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import bindparam, select
+
+from app.database import db
+from app.models.affiliate_bonus import AffiliateBonusWeek
+from app.services.weekly_amount_service import UPSERT_DIALECTS, week_bounds
+
+logger = logging.getLogger(__name__)
+
+affiliate_bonus_weeks = AffiliateBonusWeek.__table__
+
+ZERO = Decimal('0')
+MAX_WEEKS = 52
+
+
+def _bonus_statement(dialect_name: str):
+    """Upsert che somma l'accredito alla riga (utente, settimana, livello)"""
+    statement = UPSERT_DIALECTS[dialect_name](affiliate_bonus_weeks).values(
+        user_id=bindparam('user_id'), week_start=bindparam('week_start'),
+        level=bindparam('level'),
+        amount=bindparam('amount', type_=affiliate_bonus_weeks.c.amount.type),
+        bonuses=bindparam('bonuses'), updated_at=bindparam('now'))
+    return statement.on_conflict_do_update(
+        index_elements=[affiliate_bonus_weeks.c.user_id, affiliate_bonus_weeks.c.week_start,
+                        affiliate_bonus_weeks.c.level],
+        set_={'amount': affiliate_bonus_weeks.c.amount + statement.excluded.amount,
+              'bonuses': affiliate_bonus_weeks.c.bonuses + statement.excluded.bonuses,
+              'updated_at': statement.excluded.updated_at})
+
+
+def _bonus_params(credits: Iterable[Tuple[int, int, Decimal, int]],
+                  moment: Optional[datetime]) -> List[Dict]:
+    now = datetime.utcnow()
+    week_start, _ = week_bounds(moment or now)
+    return [{'user_id': user_id, 'week_start': week_start, 'level': level,
+             'amount': amount, 'bonuses': count, 'now': now}
+            for user_id, level, amount, count in credits if amount]
+
+
+async def record_affiliate_bonuses(session, credits: Iterable[Tuple[int, int, Decimal, int]],
+                                   moment: Optional[datetime] = None) -> int:
+    """Somma gli accrediti (utente, livello, importo, n. bonus) alla settimana di `moment`"""
+    params = _bonus_params(credits, moment)
+    if params:
+        await session.execute(_bonus_statement(session.bind.dialect.name), params)
+    return len(params)
+
+
+def record_affiliate_bonuses_sync(connection, credits: Iterable[Tuple[int, int, Decimal, int]],
+                                  moment: Optional[datetime] = None) -> int:
+    """Come record_affiliate_bonuses, per connessioni o sessioni sincrone"""
+    params = _bonus_params(credits, moment)
+    if params:
+        dialect = connection.dialect if hasattr(connection, 'dialect') else connection.get_bind().dialect
+        connection.execute(_bonus_statement(dialect.name), params)
+    return len(params)
+
+
+class AffiliateBonusService:
+
+    @staticmethod
+    async def get_earnings(user_id: int, weeks: int = 4, until: Optional[datetime] = None,
+                           database=None) -> Dict:
+        """Guadagni affiliato per settimana e livello, dalla settimana di `until` indietro"""
+        database = database or db
+        try:
+            weeks = max(1, min(weeks, MAX_WEEKS))
+            last_week, _ = week_bounds(until or datetime.utcnow())
+            first_week = last_week - timedelta(weeks=weeks - 1)
+
+            async with database.get_async_session() as session:
+                rows = (await session.execute(
+                    select(affiliate_bonus_weeks.c.week_start, affiliate_bonus_weeks.c.level,
+                           affiliate_bonus_weeks.c.amount, affiliate_bonus_weeks.c.bonuses)
+                    .where(affiliate_bonus_weeks.c.user_id == user_id,
+                           affiliate_bonus_weeks.c.week_start.between(first_week, last_week))
+                    .order_by(affiliate_bonus_weeks.c.week_start.desc(),
+                              affiliate_bonus_weeks.c.level))).all()
+
+            by_week: Dict[datetime, Dict] = {}
+            for week_start, level, amount, count in rows:
+                week = by_week.setdefault(week_start, {'levels': {}, 'total': ZERO, 'bonuses': 0})
+                amount = Decimal(str(amount))
+                week['levels'][level] = amount
+                week['total'] += amount
+                week['bonuses'] += count
+
+            total = sum((week['total'] for week in by_week.values()), ZERO)
+            return {
+                'status': 'success',
+                'weeks': [{'week_start': week_start.isoformat(),
+                           'levels': {str(level): str(amount)
+                                      for level, amount in week['levels'].items()},
+                           'total': str(week['total']),
+                           'bonuses': week['bonuses']}
+                          for week_start, week in by_week.items()],
+                'total': str(total)
+            }
+
+        except Exception as e:
+            logger.error(f"Error reading affiliate earnings: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
@@ -2,7 +2,9 @@ from decimal import Decimal
 from datetime import datetime
 from typing import Dict, List, Any
 from app.models import db
-from app.models.models import User, MoneyAccount, Transaction
+from sqlalchemy import update
+from app.models.models import User, MoneyAccount, Transaction, TransactionType
+from app.services.ledger_writer import LedgerWriter
 from app.services.blockchain_service import BlockchainService
 from app.services.validators.blockchain_validator import ValidatoreBlockchain
 import os
@@ -23,6 +25,7 @@ class BatchCollectionService:
         self.max_batch_size = 1000 #Added max batch size
         self.daily_batch_limit = 100000 #Added daily limit
         self.MAX_BATCH_AMOUNT = 100000 # Added MAX_BATCH_AMOUNT
+        self.ledger = LedgerWriter('transactions', batch_size=self.max_batch_size)
 
 
     async def validate_batch(self, transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -60,37 +63,27 @@ class BatchCollectionService:
     async def execute_batch_transfers(self, batch_transfers: List[Dict]) -> Dict:
         """Processa un batch di bonifici"""
         try:
-            transactions = []
-            # async with self.session_lock: # This line is commented out because session_lock is not defined in the provided code.  Adding it would require further context.
-            for transfer in batch_transfers:
-                transaction = Transaction(
-                    user_id=transfer['user_id'],
-                    amount=Decimal(str(transfer['amount'])),
-                    type='bank_transfer',
-                    status='pending',
-                    reference=transfer.get('reference', '')
-                )
-                transactions.append(transaction)
-
-            # Process transactions in optimized batches
-            batch_size = 50 #Added batch size
-            for i in range(0, len(transactions), batch_size):
-                batch = transactions[i:i + batch_size]
-                try:
-                    db.session.add_all(batch)
-                    db.session.commit()
-                except Exception as e:
-                    logging.error(f"Batch processing error: {e}")
-                    db.session.rollback()
-                    continue
-
+            now = datetime.utcnow()
+            ledger_rows = [{
+                'user_id': transfer['user_id'],
+                'amount': Decimal(str(transfer['amount'])),
+                'transaction_type': TransactionType.DEPOSIT,
+                'payment_method': 'bank_transfer',
+                'status': 'pending',
+                'date': now,
+                'description': transfer.get('reference', '')
+            } for transfer in batch_transfers]
+
+            # Scrittura Core a blocchi: nessun oggetto ORM per bonifico
+            transaction_ids = self.ledger.write_ids_sync(db.session, ledger_rows)
+            db.session.commit()
 
             # Prepara dati per blockchain
             blockchain_batch = [{
-                'user_id': t.user_id,
-                'amount': float(t.amount),
-                'timestamp': int(t.created_at.timestamp())
-            } for t in transactions]
+                'user_id': row['user_id'],
+                'amount': float(row['amount']),
+                'timestamp': int(now.timestamp())
+            } for row in ledger_rows]
 
             validation_result = await self.verify_batch(blockchain_batch) #This line should be replaced with the correct validation function
             if validation_result['status'] != 'completed': #This line needs to be adjusted because the new validate_batch returns a dict with 'valid' key
@@ -101,15 +94,20 @@ class BatchCollectionService:
             receipt = await self.blockchain_service.process_batch_transformation(blockchain_batch)
 
             if receipt and receipt.status == 1:
-                for t in transactions:
-                    t.status = 'completed'
-                    t.blockchain_tx = receipt.transactionHash.hex()
+                # Solo le righe scritte da questo batch, non altre pendenti degli stessi utenti
+                tx_hash = receipt.transactionHash.hex()
+                transactions = Transaction.__table__
+                db.session.execute(
+                    update(transactions)
+                    .where(transactions.c.id.in_(transaction_ids),
+                           transactions.c.status == 'pending')
+                    .values(status='completed', blockchain_tx=tx_hash))
                 db.session.commit()
 
                 return {
                     'status': 'success',
-                    'message': f'Processati {len(transactions)} bonifici',
-                    'tx_hash': receipt.transactionHash.hex()
+                    'message': f'Processati {len(transaction_ids)} bonifici',
+                    'tx_hash': tx_hash
                 }
 
             raise Exception("Blockchain transaction failed")
@@ -1,12 +1,16 @@
 
-from typing import Dict, Any, Optional
-from decimal import Decimal
+from typing import Dict, Any, Iterable, Optional
+from decimal import Decimal, ROUND_DOWN
 from datetime import datetime
 import logging
+import os
 from web3 import Web3
-from app.models.noble_system import NobleRank
+from app.models.models import NobleRank
 from app.utils.logging_config import get_logger
 from app.services.blockchain_service import BlockchainService
+from app.services.config_cache import config_cache
+from app.services.noble_batch_reader import NobleBatchReader
+from app.database import db
 from app.utils.monitoring.blockchain_monitor import BlockchainMonitor
 
 logger = get_logger(__name__)
@@ -17,8 +21,19 @@ class ServizioNobileBlockchain:
     def __init__(self, blockchain_service: Optional[BlockchainService] = None):
         self.blockchain_service = blockchain_service or BlockchainService()
         self.monitor = BlockchainMonitor(self.blockchain_service.w3)
+        self.reader = None
         self.logger = logging.getLogger(__name__)
 
+    def _get_reader(self) -> NobleBatchReader:
+        if self.reader is None:
+            self.reader = NobleBatchReader(
+                self.blockchain_service.w3.provider.endpoint_uri,
+                self.blockchain_service.contract.address,
+                chunk_size=int(os.getenv('NOBLE_READ_CHUNK_SIZE', '100')),
+                max_concurrency=int(os.getenv('NOBLE_READ_CONCURRENCY', '4')),
+                cache_ttl=float(os.getenv('NOBLE_READ_CACHE_TTL', '5')))
+        return self.reader
+
     async def update_noble_rank(self, 
                               address: str, 
                               rank_id: int,
@@ -84,9 +99,10 @@ class ServizioNobileBlockchain:
             if not self.blockchain_service.w3.is_address(address):
                 return {'is_valid': False}
 
-            current_rank = await self.blockchain_service.contract.functions.nobleRanks(
-                address
-            ).call()
+            result = await self.read_noble_stats([address])
+            if address not in result.get('stats', {}):
+                raise ValueError(result.get('message') or result['errors'].get(address))
+            current_rank = result['stats'][address]['current_rank']
 
             return {
                 'is_valid': current_rank >= min_rank,
@@ -112,16 +128,8 @@ class ServizioNobileBlockchain:
             if not status['is_valid']:
                 return {'bonus_amount': Decimal('0')}
 
-            premio_referral = {
-                1: Decimal('0.007'),  # Livello 1: 0.7% del peso
-                2: Decimal('0.005'),  # Livello 2: 0.5% del peso
-                3: Decimal('0.005')   # Livello 3: 0.5% del peso
-            }
-
-            multiplier = premio_referral.get(
-                status['current_level'],
-                Decimal('0')
-            )
+            await config_cache.ensure_fresh(db)
+            multiplier = config_cache.bonus_rate(status['current_rank'])
             bonus_amount = (amount * multiplier).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
 
             return {
@@ -143,18 +151,16 @@ class ServizioNobileBlockchain:
             if not self.blockchain_service.w3.is_address(address):
                 return {'status': 'error', 'message': 'Invalid address'}
 
-            current_rank = await self.blockchain_service.contract.functions.nobleRanks(
-                address
-            ).call()
-
-            total_rewards = await self.blockchain_service.contract.functions.totalRewards(
-                address
-            ).call()
+            result = await self.read_noble_stats([address])
+            if result['status'] == 'error':
+                return result
+            if address not in result['stats']:
+                raise ValueError(result['errors'].get(address, 'Noble stats unavailable'))
 
             return {
                 'status': 'success',
-                'current_rank': current_rank,
-                'total_rewards': self.blockchain_service.w3.from_wei(total_rewards, 'ether'),
+                'current_rank': result['stats'][address]['current_rank'],
+                'total_rewards': result['stats'][address]['total_rewards'],
                 'address': address
             }
 
@@ -164,3 +170,58 @@ class ServizioNobileBlockchain:
                 'status': 'error',
                 'message': str(e)
             }
+
+    async def read_noble_stats(self, addresses: Iterable[str]) -> Dict[str, Any]:
+        """
+        Rank and total rewards for many addresses, read in JSON-RPC batches
+        at the same block
+
+        Args:
+            addresses: Blockchain addresses to read
+        """
+        try:
+            addresses = list(addresses)
+            invalid = {address for address in addresses
+                       if not self.blockchain_service.w3.is_address(address)}
+            valid = [address for address in addresses if address not in invalid]
+            result = await self._get_reader().read(valid) if valid else {
+                'block_number': None, 'values': {}}
+
+            stats, errors = {}, {}
+            for address in valid:
+                entry = result['values'][self.blockchain_service.w3.to_checksum_address(address)]
+                if 'error' in entry:
+                    errors[address] = entry['error']
+                else:
+                    stats[address] = {
+                        'current_rank': entry['rank'],
+                        'total_rewards': self.blockchain_service.w3.from_wei(
+                            entry['total_rewards'], 'ether')
+                    }
+
+            return {
+                'status': 'success' if not errors else 'partial',
+                'block_number': result['block_number'],
+                'stats': stats,
+                'errors': errors,
+                'invalid': sorted(invalid)
+            }
+
+        except Exception as e:
+            self.logger.error(f"Error reading noble stats: {str(e)}")
+            return {
+                'status': 'error',
+                'message': str(e)
+            }
+
+    async def verify_noble_statuses(self,
+                                    addresses: Iterable[str],
+                                    min_rank: int) -> Dict[str, Dict[str, Any]]:
+        """Verify the required noble rank for many addresses at once"""
+        addresses = list(addresses)
+        result = await self.read_noble_stats(addresses)
+        stats = result.get('stats', {})
+        return {address: {'is_valid': stats[address]['current_rank'] >= min_rank,
+                          'current_rank': stats[address]['current_rank']}
+                if address in stats else {'is_valid': False}
+                for address in addresses}
@@ -1,14 +1,18 @@
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
+from web3.middleware import async_geth_poa_middleware, geth_poa_middleware
+import asyncio
 import os
 import json
 import logging
-from typing import Dict, List, Any, Optional
+import time
+from typing import Dict, List, Any, Optional, Tuple
 from functools import lru_cache
 from app.utils.monitoring.blockchain_monitor import BlockchainMonitor
 from app.utils.retry import retry_with_backoff
 from app.utils.logging_config import get_logger
 from app.utils.monitoring.monitoring_manager import get_performance_monitor
+from app.services.tx_pipeline import TransactionPipeline, pipeline_for
+from app.utils.web3_provider import (create_web3, install_pooled_session, is_async,
+                                     resolve)
 
 logger = get_logger(__name__)
 
@@ -20,6 +24,7 @@ class BlockchainService:
         self.noble_contract = None
         self.initialization_status = False
         self.monitor = None
+        self.pipeline = None
         self.logger = logging.getLogger(__name__)
         self._performance_monitor = None
 
@@ -68,18 +73,19 @@ class BlockchainService:
 
             try:
                 self.logger.info(f"Attempting connection to: {endpoint}")
-                provider = Web3.HTTPProvider(endpoint,
-                                             request_kwargs={
-                                                 'timeout': 60,
-                                                 'verify': True
-                                             })
-                self.web3_client = Web3(provider)
-                self.web3_client.middleware_onion.inject(geth_poa_middleware,
-                                                         layer=0)
-
-                if self.web3_client.eth.block_number:
+                self.web3_client = create_web3(endpoint)
+                if is_async(self.web3_client):
+                    await install_pooled_session(self.web3_client)
+                    self.web3_client.middleware_onion.inject(async_geth_poa_middleware,
+                                                             layer=0)
+                else:
+                    self.web3_client.middleware_onion.inject(geth_poa_middleware,
+                                                             layer=0)
+
+                if await resolve(self.web3_client.eth.block_number):
                     self._setup_contract()
                     self._setup_account()
+                    self.initialization_status = True
                     self.logger.info(
                         f"Connected to blockchain node: {endpoint}")
                     return True
@@ -114,53 +120,47 @@ class BlockchainService:
             self.logger.error(f"Account setup failed: {e}")
             raise
 
-    @retry_with_backoff(max_retries=3)
-    async def send_transaction(self, func_call, value=0):
+    def _get_pipeline(self) -> TransactionPipeline:
+        if self.pipeline is None:
+            self.pipeline = pipeline_for(
+                self.web3_client, self.account, os.getenv('PRIVATE_KEY'),
+                max_in_flight=int(os.getenv('TX_MAX_IN_FLIGHT', '64')),
+                max_gas_price=self.web3_client.to_wei('100', 'gwei'))
+        return self.pipeline
+
+    async def submit_transaction(self, func_call, value=0) -> asyncio.Future:
+        """Trasmette senza attendere la ricevuta; il future si risolve con il dict di stato"""
         if not self.is_connected():
             raise ValueError("Blockchain connection not initialized")
+        return await self._get_pipeline().submit(func_call, value)
 
-        try:
-            gas_price = min(self.web3_client.eth.gas_price,
-                            self.web3_client.to_wei('100', 'gwei'))
-
-            transaction = func_call.build_transaction({
-                'from':
-                self.account.address,
-                'nonce':
-                self.web3_client.eth.get_transaction_count(
-                    self.account.address),
-                'gas':
-                200000,
-                'gasPrice':
-                gas_price,
-                'value':
-                value
-            })
-
-            signed_txn = self.web3_client.eth.account.sign_transaction(
-                transaction, os.getenv('PRIVATE_KEY'))
-            tx_hash = self.web3_client.eth.send_raw_transaction(
-                signed_txn.rawTransaction)
-            receipt = self.web3_client.eth.wait_for_transaction_receipt(
-                tx_hash)
-
-            if receipt.status != 1:
-                raise ValueError("Transaction failed")
-
-            return {
-                'status': 'completed',
-                'transaction_hash': receipt.transactionHash.hex(),
-                'block_number': receipt.blockNumber
-            }
-
-        except Exception as e:
-            self.logger.error(f"Transaction failed: {e}")
-            return {'status': 'error', 'message': str(e)}
+    @retry_with_backoff(max_retries=3)
+    async def send_transaction(self, func_call, value=0):
+        return await (await self.submit_transaction(func_call, value))
 
     def is_connected(self) -> bool:
+        if is_async(self.web3_client):
+            # is_connected() di AsyncWeb3 è una coroutine: vale l'esito della connessione
+            return bool(self.initialization_status and self.account and self.noble_contract)
         return bool(self.web3_client and self.web3_client.is_connected()
                     and self.account and self.noble_contract)
 
+    @property
+    def w3(self):
+        return self.web3_client
+
+    @w3.setter
+    def w3(self, client) -> None:
+        self.web3_client = client
+
+    @property
+    def contract(self):
+        return self.noble_contract
+
+    @contract.setter
+    def contract(self, contract) -> None:
+        self.noble_contract = contract
+
     async def get_transaction_stats(self) -> Dict[str, Any]:
         if not self.is_connected():
             return {'status': 'error', 'message': 'Not connected'}
@@ -169,28 +169,68 @@ class BlockchainService:
             return {
                 'status': 'verified',
                 'stats': {
-                    'gas_price': self.web3_client.eth.gas_price,
-                    'block_number': self.web3_client.eth.block_number,
-                    'network_id': self.web3_client.eth.chain_id,
+                    'gas_price': await resolve(self.web3_client.eth.gas_price),
+                    'block_number': await resolve(self.web3_client.eth.block_number),
+                    'network_id': await resolve(self.web3_client.eth.chain_id),
                     'connected': True,
-                    'syncing': self.web3_client.eth.syncing,
-                    'peer_count': self.web3_client.net.peer_count
+                    'syncing': await resolve(self.web3_client.eth.syncing),
+                    'peer_count': await resolve(self.web3_client.net.peer_count)
                 }
             }
         except Exception as e:
             self.logger.error(f"Failed to get stats: {e}")
             return {'status': 'error', 'message': str(e)}
 
-    async def update_noble_rank(self, address: str, rank: int):
+    def _record_time(self, started: float) -> None:
+        self.performance_monitor.record_metrics((time.perf_counter() - started) * 1000)
+
+    async def submit_noble_rank(self, address: str, rank: int) -> asyncio.Future:
         if not self.web3_client.is_address(address):
             raise ValueError("Invalid Ethereum address")
-
-        self.performance_monitor.start_timer('update_noble_rank')
-        result = await self.send_transaction(
+        return await self.submit_transaction(
             self.noble_contract.functions.updateNobleRank(address, rank))
-        self.performance_monitor.stop_timer('update_noble_rank')
+
+    async def update_noble_rank(self, address: str, rank: int):
+        started = time.perf_counter()
+        result = await (await self.submit_noble_rank(address, rank))
+        self._record_time(started)
         return result
 
+    async def update_noble_ranks(self, updates: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+        """Invia un lotto di aggiornamenti di rango in pipeline; un risultato per aggiornamento"""
+        started = time.perf_counter()
+        futures = []
+        for address, rank in updates:
+            try:
+                futures.append(await self.submit_noble_rank(address, rank))
+            except Exception as e:
+                self.logger.error(f"Rank update failed for {address}: {e}")
+                failed = asyncio.get_running_loop().create_future()
+                failed.set_result({'status': 'error', 'message': str(e)})
+                futures.append(failed)
+        results = list(await asyncio.gather(*futures))
+        self._record_time(started)
+        return results
+
+    async def submit_gold_transaction(self, address: str, euro_amount: float,
+                                      gold_grams: float) -> asyncio.Future:
+        return await self.submit_transaction(
+            self.noble_contract.functions.transformGold(
+                address, int(euro_amount * 100), int(gold_grams * 10000)))
+
+    async def submit_transformation_root(self, merkle_root: bytes,
+                                         leaf_count: int) -> asyncio.Future:
+        """Pubblica la radice di un lotto Merkle di trasformazioni"""
+        return await self.submit_transaction(
+            self.noble_contract.functions.commitTransformationRoot(merkle_root, leaf_count))
+
+    async def transformation_root_committed_at(self, merkle_root: bytes) -> int:
+        """Timestamp di registrazione della radice on-chain (0 se non registrata)"""
+        if not self.is_connected():
+            raise ValueError("Blockchain connection not initialized")
+        return await resolve(
+            self.noble_contract.functions.transformationRoots(merkle_root).call())
+
     async def record_gold_transaction(
             self,
             address: str,
@@ -206,9 +246,7 @@ class BlockchainService:
                 'Transaction requires approval before blockchain recording'
             }
 
-        self.performance_monitor.start_timer('record_gold_transaction')
-        result = await self.send_transaction(
-            self.noble_contract.functions.transformGold(
-                address, int(euro_amount * 100), int(gold_grams * 10000)))
-        self.performance_monitor.stop_timer('record_gold_transaction')
+        started = time.perf_counter()
+        result = await (await self.submit_gold_transaction(address, euro_amount, gold_grams))
+        self._record_time(started)
         return result
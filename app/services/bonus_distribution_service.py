@@ -1,35 +1,63 @@
 from decimal import Decimal
-from sqlalchemy import select
+import numpy as np
+from sqlalchemy import bindparam, func, insert, select, text
 from sqlalchemy.orm import joinedload
 from app.models import db, NobleRelation, BonusRate, User, GoldAccount, GoldReward
+from app.models.models import BonusTransaction
 from app.utils.logging_config import get_logger
 from app.services.blockchain_service import BlockchainService
+from app.services.referral_index import ReferralIndex, referral_index, NO_USER
+from app.services.referral_service import resolve_uplines, last_downline_level
+from app.services.network_volume_service import NetworkVolumeService, award_recorded
+from app.services.affiliate_bonus_service import (record_affiliate_bonuses,
+                                                  record_affiliate_bonuses_sync)
+from app.services.achievement_engine import (AchievementEngine, ACHIEVEMENT_THRESHOLDS,
+                                             ACHIEVEMENT_REWARDS)
+from app.services.config_cache import config_cache, bump_version, DEFAULT_BONUS_RATES
+from app.services.gold.fixed_point import (grams_to_units, rate_share,
+                                           units_to_decimal)
+from app.database import db as async_db
 from app.utils.errors import InvalidRankError
 from datetime import datetime
-from typing import Dict
+from typing import Callable, Dict, Iterable, Optional, Tuple
 
 logger = get_logger(__name__)
 
 
+gold_accounts = GoldAccount.__table__
+bonus_transactions = BonusTransaction.__table__
+gold_rewards = GoldReward.__table__
+
+CREDIT_BONUS = text("""UPDATE gold_accounts
+                       SET balance = balance + :amount, last_updated = :now
+                       WHERE user_id = :user_id""").bindparams(
+    bindparam('amount', type_=gold_accounts.c.balance.type),
+    bindparam('now', type_=gold_accounts.c.last_updated.type))
+
+
 class BonusDistributionService:
     MAX_BONUS_LEVEL = 3
 
-    def __init__(self):
-        from flask import current_app
-        with current_app.app_context():
+    def __init__(self, database=None, index: ReferralIndex = None, use_index: bool = True):
+        from flask import has_app_context
+        if has_app_context():
             self._init_bonus_rates()
+        self.database = database or async_db
+        self.referral_index = index or referral_index
+        # Senza indice caldo (use_index=False) la upline si legge con una query set-based
+        self.use_index = use_index
 
     def _init_bonus_rates(self):
         """Initialize or verify bonus rates"""
-        rates = [(1, Decimal('0.007'), 'Bronze'),
-                 (2, Decimal('0.005'), 'Silver'),
-                 (3, Decimal('0.005'), 'Gold')]
-
-        for level, rate, name in rates:
-            existing = BonusRate.query.filter_by(level=level).first()
-            if not existing:
-                bonus_rate = BonusRate(level=level, rate=rate, name=name)
-                db.session.add(bonus_rate)
+        names = {1: 'Bronze', 2: 'Silver', 3: 'Gold'}
+
+        missing = [level for level in DEFAULT_BONUS_RATES
+                   if not BonusRate.query.filter_by(level=level).first()]
+        for level in missing:
+            db.session.add(BonusRate(level=level, rate=DEFAULT_BONUS_RATES[level],
+                                     name=names[level]))
+        if missing:
+            bump_version(db.session)
         db.session.commit()
 
     @staticmethod
@@ -57,66 +85,45 @@ class BonusDistributionService:
             Dictionary con i bonus calcolati per ogni utente della rete
         """
         bonuses = {}
-
-        # Ottimizzazione: Carica utente e relazioni in una singola query
-        current_user = await db.session.execute(
-            select(User).options(joinedload(
-                User.noble_relations)).filter_by(id=user_id)
-        ).scalar_one_or_none()
-        db.session.execute(
-            select(User).options(joinedload(User.noble_relations)).filter_by(
-                id=user_id)).scalar_one_or_none()
-
-        if not current_user:
-            logger.warning(f"Utente {user_id} non trovato")
-            return bonuses
-
-        # Calculate upline bonuses (only first 3 levels receive bonuses)
-        current_level = 1
-        temp_user = current_user
-        while temp_user.referrer_id and current_level <= self.MAX_BONUS_LEVEL:
-            referrer = await User.query.get(temp_user.referrer_id)
-            if referrer:
-                rate = self._get_bonus_rate(current_level)
-                if rate > 0:
-                    bonus_amount = (purchase_amount * rate).quantize(
-                        Decimal('0.0001'))
-                    bonuses[referrer.id] = {
-                        'level': current_level,
-                        'amount': bonus_amount,
-                        'rate': rate,
-                        'type': 'upline'
-                    }
-            temp_user = referrer
-            current_level += 1
-
-        # Calculate downline bonuses (only from first 3 levels)
-        downline_relations = await NobleRelation.query.filter(
-            NobleRelation.referrer_id == user_id, NobleRelation.level
-            <= self.MAX_BONUS_LEVEL).all()
-
-        for relation in downline_relations:
-            rate = self._get_bonus_rate(relation.level)
+        await config_cache.ensure_fresh(self.database)
+        if self.use_index:
+            await self.referral_index.ensure_fresh(self.database)
+            upline = self.referral_index.upline(user_id)
+            downline_level = self.referral_index.downline_level(user_id)
+        else:
+            async with self.database.get_async_session() as session:
+                upline = [(beneficiary_id, level) for _, beneficiary_id, level in sorted(
+                    await resolve_uplines(session, [user_id], self.MAX_BONUS_LEVEL),
+                    key=lambda row: row[2])]
+                downline_level = await last_downline_level(session, user_id)
+
+        # Upline bonuses (only first 3 levels receive bonuses)
+        for referrer_id, level in upline:
+            rate = self._get_bonus_rate(level)
             if rate > 0:
-                bonus_amount = (purchase_amount * rate).quantize(
-                    Decimal('0.0001'))
-                bonuses[user_id] = {
-                    'level': relation.level,
-                    'amount': bonus_amount,
+                bonuses[referrer_id] = {
+                    'level': level,
+                    'amount': (purchase_amount * rate).quantize(Decimal('0.0001')),
                     'rate': rate,
-                    'type': 'downline'
+                    'type': 'upline'
                 }
 
+        # Downline bonus: livello dell'ultima relazione in cui l'utente è referrer
+        level = downline_level
+        rate = self._get_bonus_rate(level)
+        if rate > 0:
+            bonuses[user_id] = {
+                'level': level,
+                'amount': (purchase_amount * rate).quantize(Decimal('0.0001')),
+                'rate': rate,
+                'type': 'downline'
+            }
+
         return bonuses
 
     def _get_bonus_rate(self, level: int) -> Decimal:
-        """Get bonus rate for a specific level"""
-        rates = {
-            1: Decimal('0.007'),  # Bronze - 0.7%
-            2: Decimal('0.005'),  # Silver - 0.5%
-            3: Decimal('0.005')  # Gold - 0.5%
-        }
-        return rates.get(level, Decimal('0'))
+        """Get bonus rate for a specific level (dallo snapshot di configurazione)"""
+        return config_cache.bonus_rate(level)
 
     async def distribute_bonuses(self, bonuses: dict) -> dict:
         """Distribute calculated bonuses to users with validation"""
@@ -131,6 +138,11 @@ class BonusDistributionService:
                     user = await User.query.get(user_id)
                     if user:
                         await self._credit_bonus(user, bonus_info['amount'])
+                        # La proiezione conta solo i bonus da affiliati: il bonus
+                        # downline dell'acquirente userebbe le stesse chiavi di livello
+                        if bonus_info['type'] == 'upline':
+                            record_affiliate_bonuses_sync(db.session, [
+                                (user_id, bonus_info['level'], bonus_info['amount'], 1)])
                         distribution_results[user_id] = {
                             'status': 'success',
                             'amount': str(bonus_info['amount']),
@@ -159,9 +171,160 @@ class BonusDistributionService:
         gold_account.last_updated = datetime.utcnow()
 
 
+    @staticmethod
+    def _upline_lookup(triples: Iterable[Tuple[int, int, int]]) -> Callable:
+        """ancestors_at equivalente a ReferralIndex, costruito dalle triple SQL"""
+        by_level: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        rows = np.array(sorted(triples), dtype=np.int64).reshape(-1, 3)
+        for level in np.unique(rows[:, 2]):
+            selected = rows[rows[:, 2] == level]
+            by_level[int(level)] = (selected[:, 0], selected[:, 1])
+
+        def ancestors_at(user_ids: np.ndarray, level: int) -> np.ndarray:
+            result = np.full(user_ids.shape, NO_USER, dtype=np.int64)
+            if level not in by_level:
+                return result
+            purchasers, beneficiaries = by_level[level]
+            slots = np.minimum(np.searchsorted(purchasers, user_ids), purchasers.size - 1)
+            found = purchasers[slots] == user_ids
+            result[found] = beneficiaries[slots[found]]
+            return result
+
+        return ancestors_at
+
+    def _cohort_credits(self, purchases: Iterable[Tuple[int, Decimal]],
+                        ancestors_at: Optional[Callable] = None
+                        ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Bonus upline di tutti gli acquisti, aggregati per beneficiario.
+
+        Ogni quota è arrotondata per acquisto come in calculate_purchase_bonuses
+        e poi sommata: il totale coincide con la somma dei bonus singoli.
+        Restituisce coppie (beneficiario, livello), importi in 0.0001 g e
+        numero di acquisti per coppia.
+        """
+        purchases = list(purchases)
+        if not purchases:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty.reshape(0, 2), empty, empty
+
+        buyers = np.fromiter((user_id for user_id, _ in purchases), dtype=np.int64,
+                             count=len(purchases))
+        gold = np.fromiter((grams_to_units(grams) for _, grams in purchases),
+                           dtype=np.int64, count=len(purchases))
+        keys, amounts = [], []
+        ancestors_at = ancestors_at or self.referral_index.ancestors_at
+        for level in range(1, self.MAX_BONUS_LEVEL + 1):
+            rate = self._get_bonus_rate(level)
+            if rate <= 0:
+                continue
+            ancestors = ancestors_at(buyers, level)
+            found = ancestors != 0
+            keys.append(np.column_stack((ancestors[found],
+                                         np.full(found.sum(), level, dtype=np.int64))))
+            amounts.append(rate_share(gold[found], rate.as_integer_ratio()))
+
+        if not keys:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty.reshape(0, 2), empty, empty
+        pairs, slots = np.unique(np.concatenate(keys), axis=0, return_inverse=True)
+        slots = slots.reshape(-1)
+        totals = np.zeros(len(pairs), dtype=np.int64)
+        np.add.at(totals, slots, np.concatenate(amounts))
+        return pairs, totals, np.bincount(slots, minlength=len(pairs))
+
+    async def calculate_cohort_bonuses(self, purchases: Iterable[Tuple[int, Decimal]]
+                                       ) -> Dict[int, Dict]:
+        """Bonus upline della settimana in un solo passaggio.
+
+        Args:
+            purchases: coppie (user_id, grammi acquistati)
+
+        Returns:
+            Per ogni beneficiario l'importo aggregato e il numero di acquisti
+        """
+        purchases = list(purchases)
+        await config_cache.ensure_fresh(self.database)
+        if self.use_index:
+            await self.referral_index.ensure_fresh(self.database)
+            ancestors_at = None
+        else:
+            async with self.database.get_async_session() as session:
+                ancestors_at = self._upline_lookup(await resolve_uplines(
+                    session, (user_id for user_id, _ in purchases), self.MAX_BONUS_LEVEL))
+        pairs, totals, counts = self._cohort_credits(purchases, ancestors_at)
+        credits: Dict[int, Dict] = {}
+        for (user_id, level), total, count in zip(pairs.tolist(), totals.tolist(),
+                                                  counts.tolist()):
+            if total <= 0:
+                continue
+            credit = credits.setdefault(user_id, {'units': 0, 'purchases': 0, 'levels': {}})
+            credit['units'] += total
+            credit['purchases'] += count
+            credit['levels'][level] = (units_to_decimal(total), count)
+        return {
+            user_id: {'amount': units_to_decimal(credit.pop('units')), **credit}
+            for user_id, credit in credits.items()
+        }
+
+    async def distribute_cohort_bonuses(self, purchases: Iterable[Tuple[int, Decimal]]
+                                        ) -> Dict:
+        """Accredita i bonus della settimana: una riga aggiornata per beneficiario.
+
+        Un update executemany sui conti oro e gli insert massivi di
+        BonusTransaction e GoldReward, tutto nella stessa transazione.
+        """
+        try:
+            credits = await self.calculate_cohort_bonuses(purchases)
+            if not credits:
+                return {'status': 'success', 'beneficiaries': 0,
+                        'total_bonus': '0.0000'}
+
+            now = datetime.utcnow()
+            user_ids = list(credits)
+            async with self.database.get_async_session() as session:
+                found = (await session.execute(
+                    select(func.count()).select_from(gold_accounts)
+                    .where(gold_accounts.c.user_id.in_(user_ids)))).scalar()
+                if found != len(user_ids):
+                    raise ValueError(
+                        f"Gold account not found for {len(user_ids) - found} beneficiaries")
+
+                await session.execute(CREDIT_BONUS, [
+                    {'amount': credit['amount'], 'now': now, 'user_id': user_id}
+                    for user_id, credit in credits.items()])
+                await session.execute(insert(bonus_transactions), [
+                    {'user_id': user_id, 'amount': credit['amount'],
+                     'transaction_date': now}
+                    for user_id, credit in credits.items()])
+                await session.execute(insert(gold_rewards), [
+                    {'user_id': user_id, 'reward_amount': credit['amount'],
+                     'created_at': now}
+                    for user_id, credit in credits.items()])
+                await record_affiliate_bonuses(session, [
+                    (user_id, level, amount, count)
+                    for user_id, credit in credits.items()
+                    for level, (amount, count) in credit['levels'].items()], now)
+
+            total = sum((credit['amount'] for credit in credits.values()), Decimal('0'))
+            logger.info(f"Credited cohort bonuses {total} to {len(credits)} users")
+            return {
+                'status': 'success',
+                'beneficiaries': len(credits),
+                'total_bonus': str(total),
+                'distributions': {user_id: {'amount': str(credit['amount']),
+                                            'purchases': credit['purchases']}
+                                  for user_id, credit in credits.items()}
+            }
+
+        except Exception as e:
+            logger.error(f"Error distributing cohort bonuses: {str(e)}")
+            return {'status': 'error', 'error': str(e)}
+
+
 class PremiumDistributionService:
 
-    def __init__(self):
+    def __init__(self, database=None):
+        self.database = database or async_db
         self.blockchain_service = BlockchainService()
         self._init_premium_rates()
         self._init_thresholds()
@@ -182,19 +345,10 @@ class PremiumDistributionService:
 
     def _init_thresholds(self):
         """Initialize achievement thresholds and rewards"""
-        self.achievement_thresholds = {
-            'bronze': Decimal('5000'),
-            'silver': Decimal('10000'),
-            'gold': Decimal('25000'),
-            'platinum': Decimal('50000')
-        }
-
-        self.achievement_rewards = {
-            'bronze': Decimal('0.1000'),
-            'silver': Decimal('0.2500'),
-            'gold': Decimal('0.5000'),
-            'platinum': Decimal('1.0000')
-        }
+        self.achievement_thresholds = dict(ACHIEVEMENT_THRESHOLDS)
+        self.achievement_rewards = dict(ACHIEVEMENT_REWARDS)
+        self.achievement_engine = AchievementEngine(self.achievement_thresholds,
+                                                    self.achievement_rewards)
 
     @staticmethod
     def validate_gold_amount(amount: Decimal) -> Decimal:
@@ -362,43 +516,36 @@ class PremiumDistributionService:
     async def distribute_achievement_reward(self, user_id: int,
                                             euro_amount: Decimal,
                                             fixing_price: Decimal) -> Dict:
-        """Distribute achievement rewards based on thresholds"""
-        try:
-            user = await User.query.get(user_id)
-            if not user:
-                raise ValueError(f"User {user_id} not found")
+        """Premia le soglie attraversate da un acquisto già registrato.
 
+        Il volume lo scrive chi registra l'acquisto (es. execute_transformation):
+        qui si leggono solo i contatori, prima = totale - euro_amount, per
+        l'acquirente e i referrer fino al 3° livello. I premi già pagati non
+        si ripetono.
+        """
+        try:
+            async with self.database.get_async_session() as session:
+                awards = await award_recorded(session, user_id, euro_amount,
+                                              self.achievement_engine)
             total_volume = await self._calculate_total_volume(user_id)
-            achieved_level = None
+            upline_awards = {uid: [a['level'] for a in awarded]
+                             for uid, awarded in awards.items() if uid != user_id}
 
-            for level, threshold in sorted(self.achievement_thresholds.items(),
-                                           key=lambda x: x[1],
-                                           reverse=True):
-                if total_volume >= threshold:
-                    achieved_level = level
-                    break
-
-            if not achieved_level:
+            awarded = awards.get(user_id)
+            if not awarded:
                 return {
                     "status": "no_achievement",
-                    "total_volume": str(total_volume)
+                    "total_volume": str(total_volume),
+                    "upline_awards": upline_awards
                 }
 
-            reward_amount = self.achievement_rewards[achieved_level]
-            await self._create_and_save_reward(
-                user_id,
-                reward_amount,
-                'achievement',
-                0,  # Level 0 for achievements
-                euro_amount,
-                fixing_price,
-                total_volume)
-
             return {
                 "status": "success",
-                "achievement_level": achieved_level,
-                "reward_amount": str(reward_amount),
-                "total_volume": str(total_volume)
+                "achievement_level": awarded[-1]['level'],
+                "reward_amount": str(sum(a['reward_amount'] for a in awarded)),
+                "levels": [a['level'] for a in awarded],
+                "total_volume": str(total_volume),
+                "upline_awards": upline_awards
             }
 
         except Exception as e:
@@ -406,6 +553,6 @@ class PremiumDistributionService:
             raise
 
     async def _calculate_total_volume(self, user_id: int) -> Decimal:
-        """Calculate total volume for achievement rewards"""
-        # Implementation depends on your specific requirements
-        return Decimal('0')  # Placeholder - implement actual calculation
+        """Volume personale + rete fino al 3° livello, dai contatori"""
+        volume = await NetworkVolumeService.get_volume(user_id, self.database)
+        return volume['total']
@@ -0,0 +1,155 @@
+"""Cache in processo della configurazione: parameters, bonus_rates, noble_ranks.
+
+Le tre tabelle vengono lette una volta per processo in uno snapshot
+immutabile, etichettato con il contatore di config_versions. Chi modifica
+la configurazione incrementa il contatore nella stessa transazione
+(bump_version); ogni worker confronta il contatore al più ogni
+check_interval secondi con una lettura per chiave primaria e ricarica lo
+snapshot solo quando è cambiato. I percorsi caldi leggono lo snapshot
+senza query.
+"""
+import asyncio
+import time
+from datetime import datetime
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+import logging
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.models.models import BonusRate, NobleRank, Parameter
+from app.models.config_version import ConfigVersion
+
+logger = logging.getLogger(__name__)
+
+config_versions = ConfigVersion.__table__
+parameters = Parameter.__table__
+bonus_rates = BonusRate.__table__
+noble_ranks = NobleRank.__table__
+
+CONFIG_ID = 1
+ZERO = Decimal('0')
+
+# Valori usati finché bonus_rates è vuota (gli stessi del seed iniziale)
+DEFAULT_BONUS_RATES = {
+    1: Decimal('0.007'),  # Bronze - 0.7%
+    2: Decimal('0.005'),  # Silver - 0.5%
+    3: Decimal('0.005')   # Gold - 0.5%
+}
+
+
+class ConfigSnapshot(NamedTuple):
+    version: int
+    parameters: Mapping[str, str]
+    bonus_rates: Mapping[int, Decimal]
+    noble_ranks: Tuple[Dict, ...]
+
+
+EMPTY_SNAPSHOT = ConfigSnapshot(0, MappingProxyType({}),
+                                MappingProxyType(dict(DEFAULT_BONUS_RATES)), ())
+
+
+def read_version(connection) -> int:
+    """Versione corrente (0 se il contatore non esiste ancora)"""
+    return connection.execute(
+        select(config_versions.c.version)
+        .where(config_versions.c.id == CONFIG_ID)).scalar() or 0
+
+
+def read_snapshot(connection) -> ConfigSnapshot:
+    """Legge versione e tabelle di configurazione con la stessa connessione"""
+    version = read_version(connection)
+    values = dict(connection.execute(
+        select(parameters.c.key, parameters.c.value)).all())
+    rates = {level: Decimal(str(rate)) for level, rate in connection.execute(
+        select(bonus_rates.c.level, bonus_rates.c.rate)).all()}
+    ranks = tuple(dict(row._mapping) for row in connection.execute(
+        select(noble_ranks.c.id, noble_ranks.c.level, noble_ranks.c.name,
+               noble_ranks.c.description, bonus_rates.c.rate.label('bonus_rate'))
+        .select_from(noble_ranks.outerjoin(
+            bonus_rates, bonus_rates.c.id == noble_ranks.c.bonus_rate_id))
+        .order_by(noble_ranks.c.level)))
+    return ConfigSnapshot(version, MappingProxyType(values),
+                          MappingProxyType(rates or dict(DEFAULT_BONUS_RATES)), ranks)
+
+
+def bump_version(connection) -> None:
+    """Incrementa il contatore; va eseguito nella transazione della modifica"""
+    now = datetime.utcnow()
+    bumped = connection.execute(
+        update(config_versions)
+        .where(config_versions.c.id == CONFIG_ID)
+        .values(version=config_versions.c.version + 1, updated_at=now))
+    if bumped.rowcount == 0:
+        connection.execute(insert(config_versions).values(
+            id=CONFIG_ID, version=1, updated_at=now))
+
+
+class ConfigCache:
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self.snapshot = EMPTY_SNAPSHOT
+        self.checked_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _due(self) -> bool:
+        return (self.checked_at is None
+                or time.monotonic() - self.checked_at > self.check_interval)
+
+    def _refresh(self, connection) -> None:
+        if self.checked_at is None or read_version(connection) != self.snapshot.version:
+            self.snapshot = read_snapshot(connection)
+            logger.info(f"Loaded configuration version {self.snapshot.version}")
+        self.checked_at = time.monotonic()
+
+    async def ensure_fresh(self, database) -> None:
+        """Carica alla prima chiamata, poi ricontrolla la versione al più ogni check_interval.
+
+        Se la lettura fallisce resta in uso l'ultimo snapshot, o i valori di
+        default se non ne è mai stato caricato uno.
+        """
+        if not self._due():
+            return
+        async with self._lock:
+            if not self._due():
+                return
+            try:
+                async with database.get_async_session() as session:
+                    await session.run_sync(self._refresh)
+            except SQLAlchemyError as e:
+                if self.snapshot is EMPTY_SNAPSHOT:
+                    logger.warning(f"Configuration load failed, using default "
+                                   f"bonus rates: {str(e)}")
+                else:
+                    logger.warning(f"Configuration check failed, keeping version "
+                                   f"{self.snapshot.version}: {str(e)}")
+                self.checked_at = time.monotonic()
+
+    def ensure_fresh_sync(self, session) -> None:
+        """Come ensure_fresh, con una sessione sincrona (viste Flask)"""
+        if self._due():
+            self._refresh(session)
+
+    def invalidate(self) -> None:
+        """Forza il controllo della versione alla prossima lettura"""
+        self.checked_at = None
+
+    def bonus_rate(self, level: int) -> Decimal:
+        return self.snapshot.bonus_rates.get(level, ZERO)
+
+    def parameter(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self.snapshot.parameters.get(key, default)
+
+    @property
+    def bonus_rates(self) -> Mapping[int, Decimal]:
+        return self.snapshot.bonus_rates
+
+    @property
+    def noble_ranks(self) -> Tuple[Dict, ...]:
+        return self.snapshot.noble_ranks
+
+
+config_cache = ConfigCache()
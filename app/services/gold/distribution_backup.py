@@ -1,142 +1,233 @@
-from typing import Dict, Optional
+from typing import Iterable
 from datetime import datetime
-import json
+from sqlalchemy import text, select, insert, update, delete, bindparam, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import db
-from app.models.distribution import DistributionSnapshot
-from sqlalchemy.orm import Session
+from app.models.models import Transaction, GoldReward
+from app.models.achievement import AchievementAward
+from app.models.distribution import DistributionSnapshot, WeeklyDistributionLog
+from app.services.network_volume_service import record_volumes
+
+snapshots = DistributionSnapshot.__table__
+transactions = Transaction.__table__
+gold_rewards = GoldReward.__table__
+achievement_awards = AchievementAward.__table__
+distribution_logs = WeeklyDistributionLog.__table__
+
+# Stato terminale di una run annullata dal journal: _open_run non la riprende
+STATUS_RESTORED = 'restored'
+
+ACCOUNT_TABLES = {'money': 'money_accounts', 'gold': 'gold_accounts'}
+
+
+def _journal_statement(account_type: str):
+    # Copy-on-write: registra solo il primo valore precedente per conto
+    return text(f"""
+        INSERT INTO distribution_journal
+            (distribution_id, account_type, user_id, balance_before, created_at)
+        SELECT :distribution_id, '{account_type}', a.user_id, a.balance, :now
+        FROM {ACCOUNT_TABLES[account_type]} a
+        WHERE a.user_id IN :user_ids
+          AND NOT EXISTS (
+              SELECT 1 FROM distribution_journal j
+              WHERE j.distribution_id = :distribution_id
+                AND j.account_type = '{account_type}'
+                AND j.user_id = a.user_id)
+        """).bindparams(bindparam('user_ids', expanding=True),
+                     bindparam('now', type_=DateTime()))
+
+
+# Colonna del ledger e segno con cui il movimento torna sul conto:
+# gli euro addebitati vengono riaccreditati, l'oro accreditato tolto
+LEDGER_DELTAS = {'money': ('amount', '+'), 'gold': ('net_amount', '-')}
+
+
+def _replay_statement(account_type: str):
+    # Delta dal ledger invece del saldo precedente: depositi e movimenti
+    # committati dopo la distribuzione sopravvivono al ripristino
+    table = ACCOUNT_TABLES[account_type]
+    column, sign = LEDGER_DELTAS[account_type]
+    return text(f"""
+        UPDATE {table}
+        SET balance = balance {sign} (
+            SELECT SUM(t.{column}) FROM transactions t
+            WHERE t.distribution_id = :distribution_id
+              AND t.user_id = {table}.user_id)
+        WHERE user_id IN (
+            SELECT user_id FROM transactions
+            WHERE distribution_id = :distribution_id)
+        """)
+
+
+JOURNAL_STATEMENTS = {t: _journal_statement(t) for t in ACCOUNT_TABLES}
+REPLAY_STATEMENTS = {t: _replay_statement(t) for t in ACCOUNT_TABLES}
+
+# I premi achievement pagati dentro la run non passano dal ledger: si
+# stornano da gold_rewards, etichettati con lo stesso id
+REVERSE_REWARDS = text("""
+    UPDATE gold_accounts
+    SET balance = balance - (
+        SELECT SUM(r.reward_amount) FROM gold_rewards r
+        WHERE r.distribution_id = :distribution_id
+          AND r.user_id = gold_accounts.user_id)
+    WHERE user_id IN (
+        SELECT user_id FROM gold_rewards
+        WHERE distribution_id = :distribution_id)
+    """)
+
 
 class DistributionBackup:
+    """Journal dei saldi toccati da una distribuzione.
+
+    Invece di serializzare tutti i conti, prima di ogni modifica si
+    registra il saldo precedente dei soli conti coinvolti, indicizzato per
+    id distribuzione. Il ripristino non sovrascrive i saldi con il journal:
+    storna con due UPDATE i movimenti del ledger etichettati con l'id.
+    """
 
-    def __init__(self):
-        self.backup_path = "backups/distribution"
+    def __init__(self, database=None):
+        self.database = database or db
 
-    def create_snapshot(self) -> int:
-        """Crea uno snapshot dello stato corrente dei saldi"""
+    async def create_snapshot(self, distribution_id: int) -> int:
+        """Apre (o restituisce) l'intestazione del journal di una distribuzione"""
         try:
-            snapshot_data = {
-                'timestamp': datetime.utcnow().isoformat(),
-                'money_accounts': {},
-                'gold_accounts': {}
-            }
-
-            with Session(db.engine) as session:
-                # Snapshot dei money accounts
-                money_accounts = session.execute("""
-                    SELECT user_id, balance 
-                    FROM money_accounts 
-                    WHERE balance > 0
-                    """).fetchall()
-                for user_id, balance in money_accounts:
-                    snapshot_data['money_accounts'][str(user_id)] = str(
-                        balance)
-
-                # Snapshot dei gold accounts
-                gold_accounts = session.execute("""
-                    SELECT user_id, balance 
-                    FROM gold_accounts
-                    """).fetchall()
-                for user_id, balance in gold_accounts:
-                    snapshot_data['gold_accounts'][str(user_id)] = str(balance)
-
-                # Salva lo snapshot nel database
-                snapshot = DistributionSnapshot(timestamp=datetime.utcnow(),
-                                                snapshot_data=snapshot_data,
-                                                restored=False)
-                session.add(snapshot)
-                session.commit()
-
-                return snapshot.id
+            async with self.database.get_async_session() as session:
+                existing = (await session.execute(
+                    select(snapshots.c.id).where(
+                        snapshots.c.distribution_id == distribution_id,
+                        snapshots.c.restored.is_(False)))).scalar()
+                if existing:
+                    return existing
+
+                result = await session.execute(
+                    insert(snapshots).values(timestamp=datetime.utcnow(),
+                                             distribution_id=distribution_id,
+                                             snapshot_data={'mode': 'journal'},
+                                             restored=False))
+                return result.inserted_primary_key[0]
 
         except Exception as e:
-            self.log_error("Errore nella creazione dello snapshot",
-                                 str(e))
+            self.log_error("Errore nella creazione dello snapshot", str(e))
             raise
 
-    def restore_latest_snapshot(self) -> bool:
-        """Ripristina l'ultimo snapshot disponibile"""
+    async def journal_accounts(self, session: AsyncSession,
+                               distribution_id: int,
+                               user_ids: Iterable[int]) -> None:
+        """Registra i saldi precedenti dei conti che stanno per cambiare.
+
+        Va chiamato nella stessa sessione che applica le modifiche, così il
+        journal e i nuovi saldi vengono committati insieme.
+        """
+        params = {'distribution_id': distribution_id,
+                  'user_ids': list(user_ids),
+                  'now': datetime.utcnow()}
+        if not params['user_ids']:
+            return
+        for statement in JOURNAL_STATEMENTS.values():
+            await session.execute(statement, params)
+
+    async def discard_effects(self, session: AsyncSession,
+                              distribution_id: int) -> None:
+        """Annulla saldi, volumi, premi e ledger scritti da una distribuzione.
+
+        Storna dai saldi e dai volumi gli importi registrati nel ledger con
+        l'id della distribuzione e cancella quelle transazioni; allo stesso
+        modo storna e cancella i premi achievement pagati dalla run, così
+        una nuova run li riassegna una sola volta. Il journal resta: lo
+        cancella chi chiama, se serve.
+        """
+        params = {'distribution_id': distribution_id}
+        for statement in REPLAY_STATEMENTS.values():
+            await session.execute(statement, params)
+        await session.execute(REVERSE_REWARDS, params)
+        await session.execute(
+            delete(gold_rewards)
+            .where(gold_rewards.c.distribution_id == distribution_id))
+        await session.execute(
+            delete(achievement_awards)
+            .where(achievement_awards.c.distribution_id == distribution_id))
+        rows = (await session.execute(
+            select(transactions.c.user_id, transactions.c.amount)
+            .where(transactions.c.distribution_id == distribution_id))).all()
+        await record_volumes(session, [(user_id, -amount) for user_id, amount in rows])
+        await session.execute(
+            delete(transactions)
+            .where(transactions.c.distribution_id == distribution_id))
+
+    async def restore_distribution(self, distribution_id: int) -> bool:
+        """Ripristina i saldi precedenti di una distribuzione.
+
+        Nella stessa transazione annulla ledger e volumi e chiude il log
+        come restored, così una nuova run con lo stesso fixing riparte da
+        zero invece di riprendere dal checkpoint.
+        """
         try:
-            with Session(db.engine) as session:
-                # Trova l'ultimo snapshot non ripristinato
-                latest_snapshot = session.execute("""
-                    SELECT id, snapshot_data 
-                    FROM distribution_snapshots 
-                    WHERE restored = false 
-                    ORDER BY timestamp DESC 
-                    LIMIT 1
-                    """).fetchone()
-                snapshot_id, snapshot_data = latest_snapshot
-
-                if not snapshot_data:
-                    raise ValueError(
-                        "Nessuno snapshot disponibile per il ripristino")
-
-                # Ripristina i saldi dei money accounts
-                for user_id, balance in snapshot_data['money_accounts'].items(
-                ):
-                    session.execute(
-                        """
-                        UPDATE money_accounts 
-                        SET balance = :balance 
-                        WHERE user_id = :user_id
-                        """, {
-                            'balance': balance,
-                            'user_id': int(user_id)
-                        })
-
-                # Ripristina i saldi dei gold accounts
-                for user_id, balance in snapshot_data['gold_accounts'].items():
-                    session.execute(
-                        """
-                        UPDATE gold_accounts 
-                        SET balance = :balance 
-                        WHERE user_id = :user_id
-                        """, {
-                            'balance': balance,
-                            'user_id': int(user_id)
-                        })
-
-                # Marca lo snapshot come ripristinato
-                session.execute(
-                    """
-                    UPDATE distribution_snapshots 
-                    SET restored = true 
-                    WHERE id = :snapshot_id
-                    """, {'snapshot_id': snapshot_id})
-
-                session.commit()
-                return True
+            async with self.database.get_async_session() as session:
+                await self.discard_effects(session, distribution_id)
+
+                await session.execute(
+                    update(distribution_logs)
+                    .where(distribution_logs.c.id == distribution_id)
+                    .values(status=STATUS_RESTORED,
+                            updated_at=datetime.utcnow()))
+                await session.execute(
+                    update(snapshots)
+                    .where(snapshots.c.distribution_id == distribution_id)
+                    .values(restored=True))
+            return True
 
         except Exception as e:
-            self.log_error("Errore nel ripristino dello snapshot",
-                                 str(e))
+            self.log_error("Errore nel ripristino dello snapshot", str(e))
             return False
 
-    def verify_snapshot_integrity(self, snapshot_id: int) -> bool:
-        """Verifica l'integrità di uno snapshot"""
+    async def restore_latest_snapshot(self) -> bool:
+        """Ripristina l'ultima distribuzione non ancora ripristinata"""
         try:
-            with Session(db.engine) as session:
-                snapshot = session.execute(
-                    """
-                    SELECT snapshot_data 
-                    FROM distribution_snapshots 
-                    WHERE id = :snapshot_id
-                    """, {'snapshot_id': snapshot_id}).scalar()
-
-                if not snapshot:
-                    return False
+            async with self.database.get_async_session() as session:
+                distribution_id = (await session.execute(
+                    select(snapshots.c.distribution_id)
+                    .where(snapshots.c.restored.is_(False),
+                           snapshots.c.distribution_id.isnot(None))
+                    .order_by(snapshots.c.timestamp.desc())
+                    .limit(1))).scalar()
+
+            if distribution_id is None:
+                raise ValueError(
+                    "Nessuno snapshot disponibile per il ripristino")
+
+            return await self.restore_distribution(distribution_id)
 
-                # Verifica che tutti gli account necessari siano presenti
-                money_accounts = set(snapshot['money_accounts'].keys())
-                gold_accounts = set(snapshot['gold_accounts'].keys())
+        except Exception as e:
+            self.log_error("Errore nel ripristino dello snapshot", str(e))
+            return False
 
-                if money_accounts != gold_accounts:
+    async def verify_snapshot_integrity(self, snapshot_id: int) -> bool:
+        """Verifica che ogni conto euro nel journal abbia il conto oro"""
+        try:
+            async with self.database.get_async_session() as session:
+                distribution_id = (await session.execute(
+                    select(snapshots.c.distribution_id)
+                    .where(snapshots.c.id == snapshot_id))).scalar()
+
+                if distribution_id is None:
                     return False
 
-                return True
+                unmatched = (await session.execute(
+                    text("""
+                    SELECT COUNT(*) FROM distribution_journal m
+                    WHERE m.distribution_id = :distribution_id
+                      AND m.account_type = 'money'
+                      AND NOT EXISTS (
+                          SELECT 1 FROM distribution_journal g
+                          WHERE g.distribution_id = m.distribution_id
+                            AND g.account_type = 'gold'
+                            AND g.user_id = m.user_id)
+                    """), {'distribution_id': distribution_id})).scalar()
+
+                return unmatched == 0
 
         except Exception as e:
-            self.log_error("Errore nella verifica dello snapshot",
-                                 str(e))
+            self.log_error("Errore nella verifica dello snapshot", str(e))
             return False
 
     def log_error(self, message: str, error_details: str) -> None:
@@ -145,4 +236,4 @@ class DistributionBackup:
             print(f"Backup Error - {message}: {error_details}")
             # TODO: Implementare sistema di logging più robusto
         except:
-            pass
\ No newline at end of file
+            pass
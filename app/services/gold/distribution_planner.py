@@ -0,0 +1,116 @@
+"""Simulazione della distribuzione settimanale per più fixing candidati.
+
+I saldi idonei vengono letti una sola volta in due colonne int64
+(user_id e centesimi) e ogni prezzo candidato è valutato col kernel in
+virgola fissa della distribuzione, senza alcuna scrittura sul database.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import BigInteger, cast, func, select
+
+from app.database import db
+from app.services.gold import fixed_point
+from app.services.gold.weekly_distribution import money_accounts
+
+# Saldi idonei già in centesimi, per evitare la conversione riga per riga
+ELIGIBLE_CENTS = select(
+    money_accounts.c.user_id,
+    cast(func.round(money_accounts.c.balance * 100), BigInteger)
+).where(money_accounts.c.balance > 0).order_by(money_accounts.c.user_id)
+
+
+class BalanceColumns(NamedTuple):
+    """Saldi idonei in forma colonnare"""
+    user_ids: np.ndarray
+    cents: np.ndarray
+    loaded_at: datetime
+
+
+class DistributionPlanner:
+    """Planner in sola lettura per confrontare fixing candidati"""
+
+    def __init__(self, database=None, fetch_size: int = 200000):
+        self.database = database or db
+        self.fetch_size = fetch_size
+        self.columns: Optional[BalanceColumns] = None
+
+    async def load(self) -> BalanceColumns:
+        """Carica user_id e saldi idonei in array int64.
+
+        Legge per keyset a pagine bufferizzate: lo streaming riga per riga
+        del driver asincrono è un ordine di grandezza più lento.
+        """
+        user_ids: List[np.ndarray] = []
+        cents: List[np.ndarray] = []
+        last_user_id = 0
+
+        async with self.database.get_async_session() as session:
+            while True:
+                rows = (await session.execute(
+                    ELIGIBLE_CENTS
+                    .where(money_accounts.c.user_id > last_user_id)
+                    .limit(self.fetch_size))).all()
+                if not rows:
+                    break
+                block = np.array([tuple(row) for row in rows], dtype=np.int64)
+                user_ids.append(block[:, 0])
+                cents.append(block[:, 1])
+                last_user_id = int(block[-1, 0])
+
+        empty = np.empty(0, dtype=np.int64)
+        self.columns = BalanceColumns(
+            np.concatenate(user_ids) if user_ids else empty,
+            np.concatenate(cents) if cents else empty,
+            datetime.utcnow())
+        return self.columns
+
+    def _require_columns(self) -> BalanceColumns:
+        if self.columns is None:
+            raise RuntimeError("Balances not loaded: call load() first")
+        return self.columns
+
+    def plan(self, fixing_prices: Iterable[Decimal]) -> List[Dict]:
+        """Riepilogo della distribuzione per ogni fixing candidato"""
+        columns = self._require_columns()
+        total_euro = fixed_point.units_to_decimal(columns.cents.sum(), -2)
+        plans = []
+
+        for fixing_price in fixing_prices:
+            result = fixed_point.weekly_distribution(
+                columns.cents, fixed_point.price_to_units(fixing_price))
+            plans.append({
+                'fixing_price': fixing_price,
+                'users': int(columns.cents.size),
+                'total_euro': total_euro,
+                'total_gold': fixed_point.units_to_decimal(result.total_gold.sum()),
+                'client_gold': fixed_point.units_to_decimal(result.client_gold.sum()),
+                'affiliate_pool': fixed_point.units_to_decimal(result.affiliate_gold.sum()),
+                'fee_income': fixed_point.units_to_decimal(result.fee.sum(), -5),
+                'max_client_gold': fixed_point.units_to_decimal(
+                    result.client_gold.max() if columns.cents.size else 0)
+            })
+
+        return plans
+
+    def breakdown(self, fixing_price: Decimal,
+                  batch_size: int = 10000) -> Iterator[Dict]:
+        """Dettaglio per utente, calcolato e restituito a blocchi"""
+        columns = self._require_columns()
+        price_units = fixed_point.price_to_units(fixing_price)
+
+        for start in range(0, columns.cents.size, batch_size):
+            user_ids = columns.user_ids[start:start + batch_size]
+            cents = columns.cents[start:start + batch_size]
+            result = fixed_point.weekly_distribution(cents, price_units)
+            for i in range(user_ids.size):
+                yield {
+                    'user_id': int(user_ids[i]),
+                    'euro': fixed_point.units_to_decimal(cents[i], -2),
+                    'total_gold': fixed_point.units_to_decimal(result.total_gold[i]),
+                    'client_gold': fixed_point.units_to_decimal(result.client_gold[i]),
+                    'affiliate_gold': fixed_point.units_to_decimal(result.affiliate_gold[i]),
+                    'fee': fixed_point.units_to_decimal(result.fee[i], -5)
+                }
@@ -1,10 +1,77 @@
+import hashlib
 from decimal import Decimal
 from datetime import datetime
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+from sqlalchemy import text, select
 from app.database import db
+from app.models.distribution import WeeklyDistributionLog
+from app.services.gold import fixed_point
+
+distribution_logs = WeeklyDistributionLog.__table__
+
+# Oro lordo per centesimo in 0.0001 g prima della divisione per il fixing,
+# come nel kernel: cents * 95 (netto in 0.0001 €) * 10000
+GOLD_FACTOR = 100 * fixed_point.NET_GOLD_SHARE[0] // fixed_point.NET_GOLD_SHARE[1] * fixed_point.GRAM_SCALE
+
+# Righe del ledger di una distribuzione con il saldo euro precedente dal
+# journal, in unità intere: centesimi e 0.0001 g
+LEDGER_CHUNK = text("""
+    SELECT t.user_id,
+           CAST(ROUND(j.balance_before * 100) AS BIGINT) AS before_cents,
+           CAST(ROUND(t.amount * 100) AS BIGINT) AS euro_cents,
+           CAST(ROUND(t.net_amount * 10000) AS BIGINT) AS client_gold
+    FROM transactions t
+    JOIN distribution_journal j
+      ON j.distribution_id = t.distribution_id
+     AND j.account_type = 'money'
+     AND j.user_id = t.user_id
+    WHERE t.distribution_id = :distribution_id AND t.user_id > :after
+    ORDER BY t.user_id
+    LIMIT :limit
+""")
+
+# Bilancio di conservazione di un blocco calcolato dal database
+CHUNK_BALANCE = text("""
+    SELECT COUNT(*) AS users,
+           SUM(CAST(ROUND(j.balance_before * 100) AS BIGINT)) AS euro_before,
+           SUM(CAST(ROUND(t.amount * 100) AS BIGINT)) AS euro_converted,
+           SUM(CAST(ROUND(t.net_amount * 10000) AS BIGINT)) AS client_gold,
+           SUM(CAST(ROUND(t.amount * 100) AS BIGINT) * :gold_factor / :price_units) AS total_gold,
+           SUM(CAST(ROUND(t.amount * 100) AS BIGINT) * :gold_factor / :price_units
+               * :affiliate_num / :affiliate_den) AS affiliate_gold,
+           SUM(CAST(ROUND(t.amount * 100) AS BIGINT)) * :gold_factor / :price_units AS exact_gold
+    FROM transactions t
+    JOIN distribution_journal j
+      ON j.distribution_id = t.distribution_id
+     AND j.account_type = 'money'
+     AND j.user_id = t.user_id
+    WHERE t.distribution_id = :distribution_id
+      AND t.user_id > :after AND t.user_id <= :last
+""")
+
+
+def genesis_hash(distribution_id: int, price_units: int) -> str:
+    """Hash di partenza della catena di una distribuzione"""
+    return hashlib.sha256(f"distribution:{distribution_id}:{price_units}".encode()).hexdigest()
+
+
+def chunk_hash(previous: str, rows: Iterable[Tuple[int, int, int, int]]) -> str:
+    """Hash del blocco concatenato al precedente.
+
+    Le righe sono (user_id, centesimi prima, centesimi convertiti, oro
+    cliente in 0.0001 g) in ordine di user_id: un verificatore con le
+    stesse righe ricalcola la catena blocco per blocco.
+    """
+    digest = hashlib.sha256(previous.encode())
+    for row in rows:
+        digest.update((":".join(str(int(v)) for v in row) + "\n").encode())
+    return digest.hexdigest()
+
 
 class DistributionValidator:
-    def __init__(self):
+    def __init__(self, database=None, chunk_size: int = 5000):
+        self.database = database or db
+        self.chunk_size = chunk_size
         self.min_fixing_price = Decimal('0.01')
         self.max_fixing_price = Decimal('100000.00')  # Valore massimo ragionevole
 
@@ -26,15 +93,15 @@ class DistributionValidator:
     async def validate_system_status(self) -> bool:
         """Verifica che il sistema sia pronto per la distribuzione"""
         try:
-            async with db.session() as session:
+            async with self.database.get_async_session() as session:
                 # Verifica che non ci siano distribuzioni in corso
-                active_distributions = await session.execute(
+                active_distributions = await session.execute(text(
                     """
                     SELECT COUNT(*) 
                     FROM weekly_distribution_logs 
                     WHERE status = 'in_progress'
                     """
-                )
+                ))
                 if active_distributions.scalar() > 0:
                     return False
 
@@ -51,9 +118,9 @@ class DistributionValidator:
     async def check_database_integrity(self) -> bool:
         """Verifica l'integrità del database"""
         try:
-            async with db.session() as session:
+            async with self.database.get_async_session() as session:
                 # Verifica che ogni utente abbia entrambi gli account
-                mismatched_accounts = await session.execute(
+                mismatched_accounts = await session.execute(text(
                     """
                     SELECT COUNT(*) 
                     FROM users u 
@@ -63,12 +130,12 @@ class DistributionValidator:
                         SELECT 1 FROM gold_accounts ga WHERE ga.user_id = u.id
                     )
                     """
-                )
+                ))
                 if mismatched_accounts.scalar() > 0:
                     return False
 
                 # Verifica che non ci siano saldi negativi
-                negative_balances = await session.execute(
+                negative_balances = await session.execute(text(
                     """
                     SELECT COUNT(*) 
                     FROM money_accounts 
@@ -78,7 +145,7 @@ class DistributionValidator:
                     FROM gold_accounts 
                     WHERE balance < 0
                     """
-                )
+                ))
                 if sum(row[0] for row in negative_balances) > 0:
                     return False
 
@@ -115,6 +182,113 @@ class DistributionValidator:
             await self.log_error("Errore nella validazione risultati", str(e))
             return False
 
+    async def iter_distribution_chunks(self, distribution_id: int) -> AsyncIterator[Dict]:
+        """Verifica una distribuzione blocco per blocco, senza caricare il ledger.
+
+        Per ogni blocco di utenti il database calcola il bilancio: euro
+        prima (dal journal) uguale agli euro convertiti, e oro cliente più
+        pool affiliati uguale all'oro lordo dal netto in euro al fixing,
+        a meno del troncamento a 0.0001 g per utente. Ogni blocco porta
+        l'hash della catena fino a quel punto.
+        """
+        async with self.database.get_async_session() as session:
+            fixing_price = (await session.execute(
+                select(distribution_logs.c.fixing_price)
+                .where(distribution_logs.c.id == distribution_id))).scalar()
+        if fixing_price is None:
+            raise ValueError(f"Distribution {distribution_id} not found")
+
+        price_units = fixed_point.price_to_units(Decimal(str(fixing_price)))
+        previous = genesis_hash(distribution_id, price_units)
+        after = 0
+        chunk = 0
+
+        while True:
+            async with self.database.get_async_session() as session:
+                rows = (await session.execute(LEDGER_CHUNK, {
+                    'distribution_id': distribution_id, 'after': after,
+                    'limit': self.chunk_size})).all()
+                if not rows:
+                    break
+                last = rows[-1].user_id
+                balance = (await session.execute(CHUNK_BALANCE, {
+                    'distribution_id': distribution_id, 'after': after,
+                    'last': last, 'price_units': price_units,
+                    'gold_factor': GOLD_FACTOR,
+                    'affiliate_num': fixed_point.AFFILIATE_SHARE[0],
+                    'affiliate_den': fixed_point.AFFILIATE_SHARE[1]})).one()
+
+            previous = chunk_hash(previous, rows)
+            euro_balanced = balance.euro_before == balance.euro_converted
+            gold_balanced = (balance.client_gold + balance.affiliate_gold
+                             == balance.total_gold)
+            rounding = balance.exact_gold - balance.total_gold
+            chunk += 1
+            yield {
+                'chunk': chunk,
+                'first_user_id': rows[0].user_id,
+                'last_user_id': last,
+                'users': balance.users,
+                'euro_before_cents': balance.euro_before,
+                'euro_converted_cents': balance.euro_converted,
+                'client_gold_units': balance.client_gold,
+                'affiliate_gold_units': balance.affiliate_gold,
+                'rounding_units': rounding,
+                'valid': (euro_balanced and gold_balanced
+                          and 0 <= rounding < max(balance.users, 1)),
+                'hash': previous
+            }
+            after = last
+
+    async def verify_distribution(self, distribution_id: int) -> Dict:
+        """Verifica completa in streaming e confronto con i totali del log"""
+        try:
+            users = 0
+            euro_cents = 0
+            client_gold = 0
+            affiliate_gold = 0
+            chunks = 0
+            invalid_chunks = []
+            final_hash = None
+
+            async for chunk in self.iter_distribution_chunks(distribution_id):
+                chunks += 1
+                users += chunk['users']
+                euro_cents += chunk['euro_converted_cents']
+                client_gold += chunk['client_gold_units']
+                affiliate_gold += chunk['affiliate_gold_units']
+                final_hash = chunk['hash']
+                if not chunk['valid']:
+                    invalid_chunks.append(chunk['chunk'])
+
+            async with self.database.get_async_session() as session:
+                log = (await session.execute(
+                    select(distribution_logs)
+                    .where(distribution_logs.c.id == distribution_id))).one()
+
+            matches_log = (
+                users == log.users_processed
+                and euro_cents == fixed_point.to_cents(log.total_euro_processed)
+                and client_gold == round(Decimal(str(log.total_gold_distributed)) * fixed_point.GRAM_SCALE)
+                and affiliate_gold == round(Decimal(str(log.total_affiliate_bonus)) * fixed_point.GRAM_SCALE))
+
+            return {
+                'valid': not invalid_chunks and matches_log,
+                'distribution_id': distribution_id,
+                'chunks': chunks,
+                'invalid_chunks': invalid_chunks,
+                'matches_log': matches_log,
+                'users': users,
+                'total_euro': fixed_point.units_to_decimal(euro_cents, -2),
+                'total_gold': fixed_point.units_to_decimal(client_gold),
+                'total_affiliate': fixed_point.units_to_decimal(affiliate_gold),
+                'hash': final_hash
+            }
+
+        except Exception as e:
+            await self.log_error("Errore nella verifica della distribuzione", str(e))
+            return {'valid': False, 'distribution_id': distribution_id, 'error': str(e)}
+
     async def log_error(self, message: str, error_details: str) -> None:
         """Logga gli errori di validazione"""
         try:
@@ -0,0 +1,148 @@
+"""Kernel in virgola fissa per fee e conversione euro -> grammi.
+
+Tutti i calcoli sono su interi NumPy int64 con unità fisse:
+
+- euro in centesimi (0.01 €)
+- fixing price in decimillesimi di euro (0.0001 €/g)
+- grammi in decimillesimi di grammo (0.0001 g)
+
+La divisione intera tronca come ROUND_DOWN sui valori non negativi, per
+cui i risultati coincidono cifra per cifra con il percorso Decimal dei
+servizi (quantize a 0.0001 o 0.01 con ROUND_DOWN).
+"""
+from decimal import Decimal, ROUND_DOWN
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+CENT = Decimal('0.01')
+GRAM_UNIT = Decimal('0.0001')
+PRICE_UNIT = Decimal('0.0001')
+
+GRAM_SCALE = 10_000
+PRICE_SCALE = 10_000
+
+# Tassi come rapporti interi
+STRUCTURE_FEE = (5, 100)  # 5%
+AFFILIATE_SHARE = (17, 1000)  # 1.7% dell'oro
+TOTAL_SPREAD = (67, 1000)  # 5% + 1.7% in euro
+NET_GOLD_SHARE = (95, 100)  # oro netto dopo la fee di struttura
+
+# Oltre questo saldo cents * 950000 supera int64
+MAX_CENTS = 9_000_000_000_000
+
+
+class DistributionResult(NamedTuple):
+    """Conversione settimanale; oro in 0.0001 g, fee in 0.00001 €"""
+    total_gold: np.ndarray
+    affiliate_gold: np.ndarray
+    client_gold: np.ndarray
+    fee: np.ndarray
+
+
+class TransformationResult(NamedTuple):
+    """Conversione dei saldi settimanali in centesimi di grammo pieni"""
+    gold: np.ndarray
+    net_gold: np.ndarray
+
+
+class SpreadResult(NamedTuple):
+    """Trasformazione singola; spread in 0.00001 €, oro in 0.0001 g"""
+    spread: np.ndarray
+    gold: np.ndarray
+
+
+def to_cents(amount: Decimal) -> int:
+    """Converte un importo in centesimi troncando come ROUND_DOWN"""
+    return int(Decimal(str(amount)).quantize(CENT, rounding=ROUND_DOWN) * 100)
+
+
+def price_to_units(fixing_price: Decimal) -> int:
+    """Converte il fixing in 0.0001 €; rifiuta prezzi con più decimali"""
+    price = Decimal(str(fixing_price))
+    if price <= 0:
+        raise ValueError("Fixing price must be positive")
+    units = price * PRICE_SCALE
+    if units != units.to_integral_value():
+        raise ValueError("Fixing price supports at most 4 decimals")
+    return int(units)
+
+
+def grams_to_units(grams: Decimal) -> int:
+    """Converte i grammi in 0.0001 g; rifiuta quantità con più decimali"""
+    units = Decimal(str(grams)) * GRAM_SCALE
+    if units != units.to_integral_value():
+        raise ValueError("Gold amounts support at most 4 decimals")
+    return int(units)
+
+
+def units_to_decimal(units: int, exponent: int = -4) -> Decimal:
+    """Riporta un intero in unità fisse a Decimal (default 0.0001)"""
+    return Decimal(int(units)).scaleb(exponent)
+
+
+def _as_cents(euro_cents) -> np.ndarray:
+    cents = np.asarray(euro_cents, dtype=np.int64)
+    if cents.size and (cents.min() < 0 or cents.max() > MAX_CENTS):
+        raise ValueError("Euro balances out of range for fixed-point kernel")
+    return cents
+
+
+def weekly_distribution(euro_cents, price_units: int) -> DistributionResult:
+    """Distribuzione settimanale: fee 5%, poi 1.7% dell'oro ai bonus.
+
+    total = (saldo * 0.95 / fixing) a 0.0001 g, affiliate = total * 0.017
+    a 0.0001 g, cliente = total - affiliate; fee = saldo * 6.7%.
+    """
+    cents = _as_cents(euro_cents)
+    # netto in 0.0001 €: cents * 100 * 0.95
+    net = cents * (100 * NET_GOLD_SHARE[0] // NET_GOLD_SHARE[1])
+    total_gold = net * GRAM_SCALE // price_units
+    affiliate_gold = total_gold * AFFILIATE_SHARE[0] // AFFILIATE_SHARE[1]
+    fee = cents * TOTAL_SPREAD[0]
+    return DistributionResult(total_gold, affiliate_gold,
+                              total_gold - affiliate_gold, fee)
+
+
+def weekly_transformation(euro_cents, price_units: int) -> TransformationResult:
+    """Trasformazione settimanale in centesimi di grammo pieni.
+
+    oro = saldo / fixing a 0.01 g, netto = oro * 0.95 a 0.01 g.
+    """
+    cents = _as_cents(euro_cents)
+    hundredths = cents * PRICE_SCALE // price_units
+    net_hundredths = hundredths * NET_GOLD_SHARE[0] // NET_GOLD_SHARE[1]
+    result = TransformationResult(hundredths * 100, net_hundredths * 100)
+    require_whole_hundredths(result.gold)
+    require_whole_hundredths(result.net_gold)
+    return result
+
+
+def transformation_spread(euro_cents, price_units: int) -> SpreadResult:
+    """Trasformazione singola: spread 6.7%, oro dal netto a 0.0001 g"""
+    cents = _as_cents(euro_cents)
+    spread = cents * TOTAL_SPREAD[0]
+    # netto in 0.00001 €: cents * 1000 - spread
+    net = cents * (1000 - TOTAL_SPREAD[0])
+    gold = net * (GRAM_SCALE * PRICE_SCALE // 100_000) // price_units
+    return SpreadResult(spread, gold)
+
+
+def rate_share(gold_units, rate: Tuple[int, int]) -> np.ndarray:
+    """Quota `rate` dell'oro a 0.0001 g, ROUND_HALF_EVEN come Decimal.quantize"""
+    quotient, remainder = np.divmod(np.asarray(gold_units, dtype=np.int64) * rate[0],
+                                    rate[1])
+    twice = remainder * 2
+    round_up = (twice > rate[1]) | ((twice == rate[1]) & (quotient % 2 == 1))
+    return quotient + round_up
+
+
+def require_whole_hundredths(gold_units: np.ndarray) -> None:
+    """L'oro deve essere in centesimi di grammo pieni"""
+    if np.any(np.asarray(gold_units) % 100):
+        raise ValueError("La quantità di oro deve essere in centesimi di grammo pieni")
+
+
+def scalar(result: Tuple) -> Tuple[int, ...]:
+    """Estrae il primo elemento di ogni campo come int Python"""
+    return tuple(int(field[0]) for field in result)
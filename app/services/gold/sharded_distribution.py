@@ -0,0 +1,260 @@
+"""Distribuzione settimanale a shard su un pool di processi.
+
+Gli utenti con saldo positivo vengono divisi in intervalli di user_id di
+dimensione simile. Ogni shard gira in un processo separato con un proprio
+engine sincrono e applica tutte le sue conversioni in un'unica transazione,
+registrando journal e ledger con l'id della distribuzione.
+
+Il coordinatore conferma in due fasi: prima confronta i totali degli shard
+con la coorte letta all'avvio e con il ledger, poi porta il log a
+completed. Se uno shard fallisce o i totali non tornano, gli shard già
+committati vengono annullati rigiocando il journal.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, NamedTuple, Tuple
+
+from sqlalchemy import BigInteger, cast, create_engine, delete, func, select, update
+from sqlalchemy.engine import make_url, URL
+
+from app.models.distribution import DistributionJournalEntry
+from app.services.gold.distribution_backup import JOURNAL_STATEMENTS
+from app.services.ledger_writer import LedgerWriter
+from app.services.network_volume_service import record_volumes_sync
+from app.services.achievement_engine import achievement_engine
+from app.services.gold.weekly_distribution import (
+    ELIGIBLE_BALANCES, CREDIT_GOLD, DEBIT_EURO, STATUS_IN_PROGRESS,
+    STATUS_COMPLETED, STATUS_FAILED, money_accounts, gold_accounts,
+    transactions, distribution_logs, convert_chunk)
+
+journal = DistributionJournalEntry.__table__
+
+# Coorte all'avvio: numero di utenti e saldo totale in centesimi
+COHORT_TOTALS = select(
+    func.count(),
+    func.coalesce(func.sum(cast(func.round(money_accounts.c.balance * 100),
+                                BigInteger)), 0)
+).where(money_accounts.c.balance > 0)
+
+
+class ShardResult(NamedTuple):
+    """Totali di uno shard (low, high] committato"""
+    low: int
+    high: int
+    users: int
+    total_euro: Decimal
+    total_gold: Decimal
+    total_affiliate: Decimal
+
+
+def sync_database_url(url) -> str:
+    """URL dell'engine sincrono corrispondente a quello asincrono"""
+    url = make_url(url) if not isinstance(url, URL) else url
+    return url.set(drivername=url.get_backend_name()).render_as_string(
+        hide_password=False)
+
+
+def _engine_options(database_url: str) -> Dict:
+    # Su SQLite gli shard si alternano sul lock di scrittura
+    if make_url(database_url).get_backend_name() == 'sqlite':
+        return {'connect_args': {'timeout': 60}}
+    return {}
+
+
+def apply_shard(database_url: str, distribution_id: int, fixing_price: Decimal,
+                low: int, high: int, chunk_size: int) -> ShardResult:
+    """Applica le conversioni degli utenti in (low, high] in una transazione.
+
+    Gira in un processo del pool: nessuno stato condiviso col coordinatore
+    oltre agli argomenti, e un engine proprio chiuso a fine shard.
+    """
+    engine = create_engine(database_url, **_engine_options(database_url))
+    ledger = LedgerWriter('transactions', batch_size=chunk_size)
+    users = 0
+    total_euro = Decimal('0')
+    total_gold = Decimal('0')
+    total_affiliate = Decimal('0')
+    last_user_id = low
+    now = datetime.utcnow()
+
+    try:
+        with engine.begin() as conn:
+            while True:
+                accounts = conn.execute(
+                    ELIGIBLE_BALANCES
+                    .where(money_accounts.c.user_id > last_user_id,
+                           money_accounts.c.user_id <= high)
+                    .limit(chunk_size)).all()
+                if not accounts:
+                    break
+
+                user_ids = [account.user_id for account in accounts]
+                found = conn.execute(
+                    select(func.count()).select_from(gold_accounts)
+                    .where(gold_accounts.c.user_id.in_(user_ids))).scalar()
+                if found != len(user_ids):
+                    raise ValueError(
+                        f"Gold accounts do not match money accounts in shard "
+                        f"({low}, {high}]")
+
+                chunk = convert_chunk(accounts, fixing_price, distribution_id, now)
+                params = {'distribution_id': distribution_id,
+                          'user_ids': user_ids, 'now': now}
+                for statement in JOURNAL_STATEMENTS.values():
+                    conn.execute(statement, params)
+                conn.execute(CREDIT_GOLD, chunk.gold_params)
+                conn.execute(DEBIT_EURO, chunk.euro_params)
+                ledger.write_sync(conn, chunk.ledger_rows)
+                record_volumes_sync(conn, [(p['user_id'], p['euro'])
+                                           for p in chunk.euro_params],
+                                    achievement_engine, distribution_id)
+
+                users += len(accounts)
+                total_euro += chunk.total_euro
+                total_gold += chunk.total_gold
+                total_affiliate += chunk.total_affiliate
+                last_user_id = user_ids[-1]
+    finally:
+        engine.dispose()
+
+    return ShardResult(low, high, users, total_euro, total_gold, total_affiliate)
+
+
+class ShardCoordinator:
+    """Lancia gli shard di una distribuzione e ne conferma o annulla l'esito"""
+
+    def __init__(self, distribution):
+        self.distribution = distribution
+        self.database = distribution.database
+        self.workers = distribution.shard_workers or os.cpu_count() or 1
+        self.chunk_size = distribution.bulk_chunk_size
+
+    async def run(self, fixing_price: Decimal) -> Dict:
+        distribution_id, _, resumed = await self.distribution._open_run(fixing_price)
+        if resumed:
+            # Run interrotta: si riparte da zero invece che dal checkpoint
+            async with self.database.get_async_session() as session:
+                await self._discard(session, distribution_id)
+                await session.execute(
+                    update(distribution_logs)
+                    .where(distribution_logs.c.id == distribution_id)
+                    .values(last_user_id=0, chunks_committed=0, users_processed=0,
+                            total_euro_processed=Decimal('0'),
+                            total_gold_distributed=Decimal('0'),
+                            total_affiliate_bonus=Decimal('0'),
+                            updated_at=datetime.utcnow()))
+        await self.distribution.backup.create_snapshot(distribution_id)
+
+        async with self.database.get_async_session() as session:
+            cohort_users, cohort_cents = (await session.execute(COHORT_TOTALS)).one()
+            bounds = await self._shard_bounds(session, cohort_users)
+
+        try:
+            results = await self._run_shards(distribution_id, fixing_price, bounds)
+            await self._verify(distribution_id, results, cohort_users, cohort_cents)
+        except Exception as e:
+            await self._abort(distribution_id, str(e))
+            raise
+
+        # Seconda fase: la run diventa visibile come completata
+        totals = {
+            'users_processed': sum(r.users for r in results),
+            'total_euro_processed': sum((r.total_euro for r in results), Decimal('0')),
+            'total_gold_distributed': sum((r.total_gold for r in results), Decimal('0')),
+            'total_affiliate_bonus': sum((r.total_affiliate for r in results), Decimal('0'))
+        }
+        async with self.database.get_async_session() as session:
+            await session.execute(
+                update(distribution_logs)
+                .where(distribution_logs.c.id == distribution_id,
+                       distribution_logs.c.status == STATUS_IN_PROGRESS)
+                .values(status=STATUS_COMPLETED,
+                        last_user_id=bounds[-1][1] if bounds else 0,
+                        chunks_committed=len(results),
+                        updated_at=datetime.utcnow(),
+                        **totals))
+
+        return {
+            'status': 'success',
+            'distribution_id': distribution_id,
+            'resumed': resumed,
+            'shards': len(results),
+            'total_euro': float(totals['total_euro_processed']),
+            'total_gold': float(totals['total_gold_distributed']),
+            'users_processed': totals['users_processed']
+        }
+
+    async def _shard_bounds(self, session, cohort_users: int) -> List[Tuple[int, int]]:
+        """Intervalli (low, high] di user_id con circa lo stesso numero di utenti"""
+        shards = min(self.workers, cohort_users)
+        highs = []
+        for i in range(1, shards + 1):
+            position = cohort_users * i // shards
+            highs.append((await session.execute(
+                select(money_accounts.c.user_id)
+                .where(money_accounts.c.balance > 0)
+                .order_by(money_accounts.c.user_id)
+                .offset(position - 1).limit(1))).scalar())
+        return list(zip([0] + highs[:-1], highs))
+
+    async def _run_shards(self, distribution_id: int, fixing_price: Decimal,
+                          bounds: List[Tuple[int, int]]) -> List[ShardResult]:
+        database_url = sync_database_url(self.database.engine.url)
+        loop = asyncio.get_running_loop()
+        # spawn: i figli non ereditano i thread del loop asincrono del padre
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max(len(bounds), 1),
+                                 mp_context=context) as pool:
+            outcomes = await asyncio.gather(*[
+                loop.run_in_executor(pool, apply_shard, database_url,
+                                     distribution_id, fixing_price, low, high,
+                                     self.chunk_size)
+                for low, high in bounds
+            ], return_exceptions=True)
+
+        failures = [o for o in outcomes if isinstance(o, BaseException)]
+        if failures:
+            raise RuntimeError(
+                f"{len(failures)} of {len(bounds)} shards failed: {failures[0]}")
+        return outcomes
+
+    async def _verify(self, distribution_id: int, results: List[ShardResult],
+                      cohort_users: int, cohort_cents: int) -> None:
+        """Prima fase: shard, coorte e ledger devono coincidere"""
+        shard_users = sum(r.users for r in results)
+        shard_cents = int(sum((r.total_euro for r in results), Decimal('0')) * 100)
+        if (shard_users, shard_cents) != (cohort_users, cohort_cents):
+            raise ValueError(
+                f"Shard totals ({shard_users} users, {shard_cents} cents) do not "
+                f"match cohort ({cohort_users} users, {cohort_cents} cents)")
+
+        async with self.database.get_async_session() as session:
+            ledger_users, ledger_cents = (await session.execute(
+                select(func.count(),
+                       func.coalesce(func.sum(cast(func.round(
+                           transactions.c.amount * 100), BigInteger)), 0))
+                .where(transactions.c.distribution_id == distribution_id))).one()
+        if (ledger_users, ledger_cents) != (cohort_users, cohort_cents):
+            raise ValueError(
+                f"Ledger totals ({ledger_users} rows, {ledger_cents} cents) do not "
+                f"match cohort ({cohort_users} users, {cohort_cents} cents)")
+
+    async def _discard(self, session, distribution_id: int) -> None:
+        """Annulla saldi, volumi, premi, ledger e journal scritti dagli shard"""
+        await self.distribution.backup.discard_effects(session, distribution_id)
+        await session.execute(
+            delete(journal).where(journal.c.distribution_id == distribution_id))
+
+    async def _abort(self, distribution_id: int, error: str) -> None:
+        async with self.database.get_async_session() as session:
+            await self._discard(session, distribution_id)
+            await session.execute(
+                update(distribution_logs)
+                .where(distribution_logs.c.id == distribution_id)
+                .values(status=STATUS_FAILED,
+                        error_details={'error': error, 'rolled_back': True},
+                        updated_at=datetime.utcnow()))
@@ -1,93 +1,211 @@
 from decimal import Decimal
 import asyncio
+import numpy as np
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import text, insert, select, update, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import db
-from app.models.models import User, MoneyAccount, GoldAccount, Transaction
-from app.utils.monitoring.performance_monitor import performance_monitor
+from app.models.models import MoneyAccount, GoldAccount, Transaction, TransactionType
+from app.models.distribution import WeeklyDistributionLog
+from app.services.gold.distribution_backup import DistributionBackup, STATUS_RESTORED
+from app.services.gold import fixed_point
+from app.services.ledger_writer import LedgerWriter
+from app.services.network_volume_service import record_volumes
+from app.services.achievement_engine import achievement_engine
+from app.utils.monitoring.performance_monitor import system_performance_monitor
+
+MODE_ROW = 'row'
+MODE_BULK = 'bulk'
+MODE_SHARDED = 'sharded'
+
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+money_accounts = MoneyAccount.__table__
+gold_accounts = GoldAccount.__table__
+transactions = Transaction.__table__
+distribution_logs = WeeklyDistributionLog.__table__
+
+# Saldi euro da convertire, ordinati per utente
+ELIGIBLE_BALANCES = select(
+    money_accounts.c.user_id, money_accounts.c.balance
+).where(money_accounts.c.balance > 0).order_by(money_accounts.c.user_id)
+
+CREDIT_GOLD = text("""UPDATE gold_accounts
+                      SET balance = balance + :gold
+                      WHERE user_id = :user_id""").bindparams(
+    bindparam('gold', type_=gold_accounts.c.balance.type))
+
+# Scala l'importo letto invece di azzerare: i depositi arrivati
+# durante la distribuzione restano per la settimana successiva
+DEBIT_EURO = text("""UPDATE money_accounts
+                     SET balance = balance - :euro
+                     WHERE user_id = :user_id""").bindparams(
+    bindparam('euro', type_=money_accounts.c.balance.type))
+
+
+class ChunkUpdate(NamedTuple):
+    """Parametri e totali di un blocco di conversioni"""
+    gold_params: List[Dict]
+    euro_params: List[Dict]
+    ledger_rows: List[Dict]
+    total_euro: Decimal
+    total_gold: Decimal
+    total_affiliate: Decimal
+
+
+def ledger_row(user_id: int, euro_balance: Decimal, gold_amount: Decimal,
+               fee_amount: Decimal, timestamp: datetime,
+               distribution_id: Optional[int] = None) -> Dict:
+    return {
+        'user_id': user_id,
+        'amount': euro_balance,
+        'transaction_type': TransactionType.GOLD_PURCHASE,
+        'processing_fee': fee_amount,
+        'net_amount': gold_amount,
+        'status': 'completed',
+        'date': timestamp,
+        'description': 'weekly_distribution',
+        'distribution_id': distribution_id
+    }
+
+
+def convert_chunk(accounts: List, fixing_price: Decimal, distribution_id: int,
+                  timestamp: datetime) -> ChunkUpdate:
+    """Converte un blocco di (user_id, saldo) con il kernel in virgola fissa"""
+    cents = np.fromiter((fixed_point.to_cents(balance) for _, balance in accounts),
+                        dtype=np.int64, count=len(accounts))
+    result = fixed_point.weekly_distribution(
+        cents, fixed_point.price_to_units(fixing_price))
+
+    gold_params: List[Dict] = []
+    euro_params: List[Dict] = []
+    ledger_rows: List[Dict] = []
+    total_euro = Decimal('0')
+
+    for i, (user_id, euro_balance) in enumerate(accounts):
+        gold_amount = fixed_point.units_to_decimal(result.client_gold[i])
+        gold_params.append({'gold': gold_amount, 'user_id': user_id})
+        euro_params.append({'euro': euro_balance, 'user_id': user_id})
+        ledger_rows.append(ledger_row(
+            user_id, euro_balance, gold_amount,
+            fixed_point.units_to_decimal(result.fee[i], -5), timestamp,
+            distribution_id))
+        total_euro += euro_balance
+
+    return ChunkUpdate(gold_params, euro_params, ledger_rows, total_euro,
+                       fixed_point.units_to_decimal(result.client_gold.sum()),
+                       fixed_point.units_to_decimal(result.affiliate_gold.sum()))
+
 
 class WeeklyGoldDistribution:
-    def __init__(self):
+    def __init__(self, database=None, bulk_chunk_size: int = 5000,
+                 shard_workers: Optional[int] = None):
         self.structure_fee = Decimal('0.05')  # 5%
         self.affiliate_fee = Decimal('0.017')  # 1.7%
         self.total_fee = self.structure_fee + self.affiliate_fee
+        self.database = database or db
+        self.bulk_chunk_size = bulk_chunk_size
+        self.shard_workers = shard_workers
+        self.backup = DistributionBackup(database=self.database)
+        self.ledger = LedgerWriter('transactions', batch_size=bulk_chunk_size)
         self._processing_lock = asyncio.Lock()
         self._backup_state = {}
 
     async def create_backup(self, session: AsyncSession) -> str:
         backup_id = datetime.utcnow().isoformat()
-        users = await session.execute(
-            "SELECT id, money_account_balance, gold_account_balance FROM users")
+        accounts = await session.execute(
+            text("""SELECT ma.user_id, ma.balance AS money_balance,
+                           ga.balance AS gold_balance
+                    FROM money_accounts ma
+                    LEFT JOIN gold_accounts ga ON ga.user_id = ma.user_id"""))
         self._backup_state[backup_id] = {
-            user.id: {
-                'money_balance': user.money_account_balance,
-                'gold_balance': user.gold_account_balance
+            account.user_id: {
+                'money_balance': account.money_balance,
+                'gold_balance': account.gold_balance
             }
-            for user in users
+            for account in accounts
         }
         return backup_id
 
-    @performance_monitor.track_time("distribution")
-    async def process_distribution(self, fixing_price: Decimal) -> Dict:
+    def _calculate_conversion(self, euro_balance: Decimal,
+                              fixing_price: Decimal) -> Tuple[Decimal, Decimal, Decimal]:
+        """Restituisce (oro al cliente, oro per i bonus, fee in euro) per un saldo"""
+        # Netto dopo la fee di struttura (5%), oro dal netto, 1.7% ai bonus:
+        # es. 1000€ a 85.13 -> 11.1594g totali, 0.1897g bonus, 10.9697g cliente
+        result = fixed_point.weekly_distribution(
+            [fixed_point.to_cents(euro_balance)],
+            fixed_point.price_to_units(fixing_price))
+        _, affiliate_gold, client_gold, fee = fixed_point.scalar(result)
+        return (fixed_point.units_to_decimal(client_gold),
+                fixed_point.units_to_decimal(affiliate_gold),
+                fixed_point.units_to_decimal(fee, -5))
+
+    @system_performance_monitor.track_time("distribution")
+    async def process_distribution(self, fixing_price: Decimal,
+                                   mode: str = MODE_ROW) -> Dict:
+        """Converte i saldi euro in oro al prezzo di fixing.
+
+        mode='row' aggiorna un utente alla volta; mode='bulk' scorre i saldi
+        a blocchi per keyset, applicando ogni blocco con executemany e insert
+        multipli sul ledger e registrando un checkpoint ripristinabile;
+        mode='sharded' divide gli utenti per intervalli di id su un pool di
+        processi e conferma la run solo se tutti gli shard sono riusciti.
+        """
+        if mode not in (MODE_ROW, MODE_BULK, MODE_SHARDED):
+            raise ValueError(f"Unknown distribution mode: {mode}")
+
         async with self._processing_lock:
             if fixing_price <= Decimal('0'):
                 raise ValueError("Fixing price must be positive")
+            fixed_point.price_to_units(fixing_price)
+
+            if mode in (MODE_BULK, MODE_SHARDED):
+                try:
+                    if mode == MODE_SHARDED:
+                        from app.services.gold.sharded_distribution import ShardCoordinator
+                        return await ShardCoordinator(self).run(fixing_price)
+                    return await self._process_bulk(fixing_price)
+                except Exception as e:
+                    raise Exception(f"Distribution failed: {str(e)}")
 
             backup_id = None
             try:
-                async with db.get_async_session() as session:
+                async with self.database.get_async_session() as session:
                     backup_id = await self.create_backup(session)
 
                     total_euro = Decimal('0')
                     total_gold = Decimal('0')
                     processed_users = 0
+                    ledger_rows: List[Dict] = []
+                    now = datetime.utcnow()
 
-                    users = await session.execute(
-                        "SELECT * FROM users WHERE money_account_balance > 0")
-
-                    for user in users:
-                        # Calcola importo netto dopo la fee di struttura (5%)
-                        structure_fee_amount = user.money_account_balance * self.structure_fee
-                        net_amount = user.money_account_balance - structure_fee_amount
+                    accounts = (await session.execute(ELIGIBLE_BALANCES)).all()
 
-                        # Calcola il totale di oro disponibile dal netto
-                        total_gold = net_amount / fixing_price  # Es: 11.1594g da 950€
-
-                        # Calcola la quota per i bonus (1.7% del totale oro)
-                        affiliate_bonus_gold = total_gold * Decimal('0.017')  # Es: 0.18971g
-
-                        # Il resto va al cliente
-                        gold_amount = total_gold - affiliate_bonus_gold  # Es: 10.96969g
+                    for user_id, euro_balance in accounts:
+                        gold_amount, _, fee_amount = self._calculate_conversion(
+                            euro_balance, fixing_price)
 
                         # Aggiorna i bilanci
                         await session.execute(
-                            """UPDATE gold_accounts 
-                               SET balance = balance + :gold
-                               WHERE user_id = :user_id""",
-                            {'gold': gold_amount, 'user_id': user.id})
-
+                            CREDIT_GOLD, {'gold': gold_amount, 'user_id': user_id})
                         await session.execute(
-                            """UPDATE euro_accounts 
-                               SET balance = 0 
-                               WHERE user_id = :user_id""",
-                            {'user_id': user.id})
-
-                        # Registra transazione
-                        transaction = Transaction(
-                            user_id=user.id,
-                            euro_amount=user.money_account_balance,
-                            gold_amount=gold_amount,
-                            fee_amount=user.money_account_balance * self.total_fee,
-                            transaction_type='weekly_distribution',
-                            status='completed'
-                        )
-                        session.add(transaction)
-
-                        total_euro += user.money_account_balance
+                            DEBIT_EURO, {'euro': euro_balance, 'user_id': user_id})
+
+                        ledger_rows.append(ledger_row(
+                            user_id, euro_balance, gold_amount, fee_amount, now))
+
+                        total_euro += euro_balance
                         total_gold += gold_amount
                         processed_users += 1
 
+                    # Registra le transazioni e i volumi di rete
+                    await self.ledger.write(session, ledger_rows)
+                    await record_volumes(session, [(row['user_id'], row['amount'])
+                                                   for row in ledger_rows],
+                                         achievement_engine)
                     await session.commit()
 
                     return {
@@ -102,18 +220,134 @@ class WeeklyGoldDistribution:
                     await self.restore_backup(session, backup_id)
                 raise Exception(f"Distribution failed: {str(e)}")
 
+    async def _open_run(self, fixing_price: Decimal) -> Tuple[int, int, bool]:
+        """Riprende la run in corso con lo stesso fixing o ne apre una nuova.
+
+        Restituisce (id del log, ultimo user_id committato, ripresa).
+        """
+        async with self.database.get_async_session() as session:
+            running = (await session.execute(
+                select(distribution_logs.c.id, distribution_logs.c.fixing_price,
+                       distribution_logs.c.last_user_id)
+                .where(distribution_logs.c.status == STATUS_IN_PROGRESS)
+                .order_by(distribution_logs.c.id.desc())
+                .limit(1))).first()
+
+            if running:
+                if Decimal(str(running.fixing_price)) != fixing_price:
+                    raise ValueError(
+                        f"Distribution {running.id} is in progress with fixing "
+                        f"price {running.fixing_price}")
+                return running.id, running.last_user_id or 0, True
+
+            now = datetime.utcnow()
+            result = await session.execute(
+                insert(distribution_logs).values(
+                    processing_date=now,
+                    fixing_price=fixing_price,
+                    total_euro_processed=Decimal('0'),
+                    total_gold_distributed=Decimal('0'),
+                    total_affiliate_bonus=Decimal('0'),
+                    users_processed=0,
+                    status=STATUS_IN_PROGRESS,
+                    last_user_id=0,
+                    chunks_committed=0,
+                    updated_at=now))
+            return result.inserted_primary_key[0], 0, False
+
+    async def _process_bulk(self, fixing_price: Decimal) -> Dict:
+        """Scorre i saldi per keyset a blocchi, ognuno con il proprio commit.
+
+        Ogni blocco registra i saldi precedenti nel journal, aggiorna i saldi,
+        scrive il ledger e avanza il checkpoint in weekly_distribution_logs
+        nella stessa transazione: dopo un crash la run con lo stesso fixing
+        riparte dal blocco successivo.
+        """
+        distribution_id, last_user_id, resumed = await self._open_run(fixing_price)
+        await self.backup.create_snapshot(distribution_id)
+
+        try:
+            while True:
+                async with self.database.get_async_session() as session:
+                    accounts = (await session.execute(
+                        ELIGIBLE_BALANCES
+                        .where(money_accounts.c.user_id > last_user_id)
+                        .limit(self.bulk_chunk_size))).all()
+                    if not accounts:
+                        break
+                    await self._apply_chunk(session, distribution_id,
+                                            accounts, fixing_price)
+                last_user_id = accounts[-1].user_id
+
+            async with self.database.get_async_session() as session:
+                await session.execute(
+                    update(distribution_logs)
+                    .where(distribution_logs.c.id == distribution_id)
+                    .values(status=STATUS_COMPLETED,
+                            updated_at=datetime.utcnow()))
+                summary = (await session.execute(
+                    select(distribution_logs)
+                    .where(distribution_logs.c.id == distribution_id))).one()
+
+        except Exception as e:
+            # La run resta in_progress: i blocchi committati non vanno rifatti
+            async with self.database.get_async_session() as session:
+                await session.execute(
+                    update(distribution_logs)
+                    .where(distribution_logs.c.id == distribution_id)
+                    .values(error_details={'error': str(e),
+                                           'last_user_id': last_user_id},
+                            updated_at=datetime.utcnow()))
+            raise
+
+        return {
+            'status': 'success',
+            'distribution_id': distribution_id,
+            'resumed': resumed,
+            'chunks': summary.chunks_committed,
+            'total_euro': float(summary.total_euro_processed),
+            'total_gold': float(summary.total_gold_distributed),
+            'users_processed': summary.users_processed
+        }
+
+    async def _apply_chunk(self, session: AsyncSession, distribution_id: int,
+                           accounts: List, fixing_price: Decimal) -> None:
+        """Applica un blocco di conversioni e avanza il checkpoint"""
+        now = datetime.utcnow()
+        chunk = convert_chunk(accounts, fixing_price, distribution_id, now)
+
+        await self.backup.journal_accounts(
+            session, distribution_id, [p['user_id'] for p in chunk.euro_params])
+        await session.execute(CREDIT_GOLD, chunk.gold_params)
+        await session.execute(DEBIT_EURO, chunk.euro_params)
+        await self.ledger.write(session, chunk.ledger_rows)
+        await record_volumes(session, [(p['user_id'], p['euro']) for p in chunk.euro_params],
+                             achievement_engine, distribution_id)
+
+        await session.execute(
+            update(distribution_logs)
+            .where(distribution_logs.c.id == distribution_id)
+            .values(
+                last_user_id=accounts[-1].user_id,
+                chunks_committed=distribution_logs.c.chunks_committed + 1,
+                users_processed=distribution_logs.c.users_processed + len(accounts),
+                total_euro_processed=distribution_logs.c.total_euro_processed + chunk.total_euro,
+                total_gold_distributed=distribution_logs.c.total_gold_distributed + chunk.total_gold,
+                total_affiliate_bonus=distribution_logs.c.total_affiliate_bonus + chunk.total_affiliate,
+                updated_at=now))
+
     async def restore_backup(self, session: AsyncSession, backup_id: str):
         if backup_id in self._backup_state:
             for user_id, balances in self._backup_state[backup_id].items():
                 await session.execute(
-                    """UPDATE euro_accounts 
-                       SET balance = :money_balance 
-                       WHERE user_id = :user_id""",
+                    text("""UPDATE money_accounts
+                            SET balance = :money_balance
+                            WHERE user_id = :user_id"""),
                     {'money_balance': balances['money_balance'], 'user_id': user_id})
                 await session.execute(
-                    """UPDATE gold_accounts 
-                       SET balance = :gold_balance 
-                       WHERE user_id = :user_id""",
+                    text("""UPDATE gold_accounts
+                            SET balance = :gold_balance
+                            WHERE user_id = :user_id"""),
                     {'gold_balance': balances['gold_balance'], 'user_id': user_id})
             await session.commit()
-            print(f"Restored backup: {backup_id}")
\ No newline at end of file
+            print(f"Restored backup: {backup_id}")
@@ -0,0 +1,103 @@
+"""Scrittura massiva delle righe di ledger con insert Core.
+
+Le righe arrivano come dict o tuple semplici e vengono scritte a blocchi
+di `batch_size` con un insert executemany che restituisce gli id
+assegnati, senza creare oggetti ORM né passare dall'identity map.
+write/write_sync riassumono gli id in un IdRange; write_ids/write_ids_sync
+restituiscono la lista esatta, per aggiornare poi proprio quelle righe.
+"""
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Union
+
+from sqlalchemy import Table, insert
+
+from app.models.models import Transaction, GoldTransformation
+
+LEDGER_TABLES = {
+    'transactions': Transaction.__table__,
+    'gold_transformations': GoldTransformation.__table__,
+}
+
+Row = Union[Dict, Sequence]
+
+
+class IdRange(NamedTuple):
+    """Id minimo e massimo assegnati alle righe scritte"""
+    first_id: Optional[int]
+    last_id: Optional[int]
+    count: int
+
+    @property
+    def contiguous(self) -> bool:
+        return self.count == 0 or self.last_id - self.first_id + 1 == self.count
+
+
+class LedgerWriter:
+    """Writer per `transactions` e `gold_transformations`.
+
+    Le tuple vanno accompagnate da `columns`, nell'ordine dei valori.
+    """
+
+    def __init__(self, table: Union[str, Table] = 'transactions',
+                 batch_size: int = 1000,
+                 columns: Optional[Sequence[str]] = None):
+        self.table = LEDGER_TABLES[table] if isinstance(table, str) else table
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.batch_size = batch_size
+        self.columns = list(columns) if columns else None
+        self.statement = (insert(self.table)
+                          .returning(self.table.c.id)
+                          .execution_options(insertmanyvalues_page_size=batch_size))
+
+    def _as_dict(self, row: Row) -> Dict:
+        if isinstance(row, dict):
+            return row
+        if self.columns is None:
+            raise ValueError("Tuple rows require the column names")
+        return dict(zip(self.columns, row))
+
+    def _batches(self, rows: Iterable[Row]) -> Iterator[List[Dict]]:
+        iterator = iter(rows)
+        while True:
+            batch = [self._as_dict(row) for row in islice(iterator, self.batch_size)]
+            if not batch:
+                return
+            yield batch
+
+    @staticmethod
+    def _merge(id_range: IdRange, ids: List[int]) -> IdRange:
+        # Solo estremi e conteggio: l'ordine delle righe RETURNING non conta
+        first_id = min(ids) if id_range.first_id is None else min(id_range.first_id, min(ids))
+        last_id = max(ids) if id_range.last_id is None else max(id_range.last_id, max(ids))
+        return IdRange(first_id, last_id, id_range.count + len(ids))
+
+    async def write(self, session, rows: Iterable[Row]) -> IdRange:
+        """Scrive le righe con una AsyncSession o AsyncConnection"""
+        id_range = IdRange(None, None, 0)
+        for batch in self._batches(rows):
+            ids = (await session.execute(self.statement, batch)).scalars().all()
+            id_range = self._merge(id_range, ids)
+        return id_range
+
+    def write_sync(self, connection, rows: Iterable[Row]) -> IdRange:
+        """Scrive le righe con una Session o Connection sincrona"""
+        id_range = IdRange(None, None, 0)
+        for batch in self._batches(rows):
+            ids = connection.execute(self.statement, batch).scalars().all()
+            id_range = self._merge(id_range, ids)
+        return id_range
+
+    async def write_ids(self, session, rows: Iterable[Row]) -> List[int]:
+        """Come write, ma restituisce tutti gli id assegnati"""
+        ids: List[int] = []
+        for batch in self._batches(rows):
+            ids.extend((await session.execute(self.statement, batch)).scalars().all())
+        return ids
+
+    def write_ids_sync(self, connection, rows: Iterable[Row]) -> List[int]:
+        """Come write_sync, ma restituisce tutti gli id assegnati"""
+        ids: List[int] = []
+        for batch in self._batches(rows):
+            ids.extend(connection.execute(self.statement, batch).scalars().all())
+        return ids
@@ -1,7 +1,8 @@
 
+import asyncio
 from unittest.mock import Mock
 from web3 import Web3
-from typing import Dict, Any
+from typing import Dict, List, Any, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -51,9 +52,31 @@ class MockBlockchainService:
             'block_number': 12345
         }
 
+    async def submit_transaction(self, func_call: Any, value: int = 0) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(await self.send_transaction(func_call, value))
+        return future
+
+    async def submit_noble_rank(self, address: str, rank: int) -> asyncio.Future:
+        return await self.submit_transaction(None)
+
+    async def submit_gold_transaction(self, address: str, euro_amount: float,
+                                      gold_grams: float) -> asyncio.Future:
+        return await self.submit_transaction(None)
+
+    async def submit_transformation_root(self, merkle_root: bytes,
+                                         leaf_count: int) -> asyncio.Future:
+        return await self.submit_transaction(None)
+
+    async def transformation_root_committed_at(self, merkle_root: bytes) -> int:
+        return 0
+
     async def update_noble_rank(self, address: str, rank: int) -> Dict[str, Any]:
         return await self.send_transaction(None)
 
+    async def update_noble_ranks(self, updates: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+        return [await self.send_transaction(None) for _ in updates]
+
     async def record_gold_transaction(self, address: str, euro_amount: float, 
                                     gold_grams: float) -> Dict[str, Any]:
         return await self.send_transaction(None)
@@ -0,0 +1,268 @@
+"""Contatori di volume personale e di rete per utente.
+
+Ogni acquisto o trasformazione somma l'importo in euro al volume personale
+dell'acquirente e al volume di rete dei suoi referrer fino al 3° livello,
+con due upsert eseguiti nella transazione che registra l'operazione. Le
+verifiche di premi e soglie leggono così una sola riga per utente invece
+di riaggregare le transazioni. Passando un AchievementEngine, nella stessa
+transazione si premiano le soglie attraversate da acquirenti e referrer.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import bindparam, delete, func, literal, or_, select, union_all, update
+
+from app.database import db
+from app.models.models import Transaction, TransactionType, GoldTransformation, NobleRelation
+from app.models.network_volume import NetworkVolume
+from app.services.achievement_engine import AchievementEngine
+from app.services.weekly_amount_service import UPSERT_DIALECTS
+
+logger = logging.getLogger(__name__)
+
+network_volumes = NetworkVolume.__table__
+noble_relations = NobleRelation.__table__
+transactions = Transaction.__table__
+gold_transformations = GoldTransformation.__table__
+
+MAX_LEVEL = 3
+
+# Stati che contano come acquisto effettivo nel ledger
+TRANSFORMATION_STATUSES = ('completed', 'verified')
+
+ZERO = Decimal('0')
+
+
+def _volume_statements(dialect_name: str):
+    """Upsert del volume personale e di rete, parametri user_id/amount/now"""
+    upsert = UPSERT_DIALECTS[dialect_name]
+    amount = bindparam('amount', type_=network_volumes.c.personal_volume.type)
+    now = bindparam('now', type_=network_volumes.c.updated_at.type)
+
+    personal = upsert(network_volumes).values(
+        user_id=bindparam('user_id'), personal_volume=amount,
+        network_volume=ZERO, rank_dirty=True, updated_at=now)
+    personal = personal.on_conflict_do_update(
+        index_elements=[network_volumes.c.user_id],
+        set_={'personal_volume': network_volumes.c.personal_volume
+              + personal.excluded.personal_volume,
+              'rank_dirty': True,
+              'updated_at': personal.excluded.updated_at})
+
+    network = upsert(network_volumes).from_select(
+        ['user_id', 'personal_volume', 'network_volume', 'rank_dirty', 'updated_at'],
+        select(noble_relations.c.referrer_id, literal(ZERO, network_volumes.c.personal_volume.type),
+               amount, literal(True), now)
+        .where(noble_relations.c.referred_id == bindparam('user_id'),
+               noble_relations.c.level.between(1, MAX_LEVEL)))
+    network = network.on_conflict_do_update(
+        index_elements=[network_volumes.c.user_id],
+        set_={'network_volume': network_volumes.c.network_volume
+              + network.excluded.network_volume,
+              'rank_dirty': True,
+              'updated_at': network.excluded.updated_at})
+    return personal, network
+
+
+def _volume_params(purchases: Iterable[Tuple[int, Decimal]]) -> List[Dict]:
+    now = datetime.utcnow()
+    return [{'user_id': user_id, 'amount': amount, 'now': now}
+            for user_id, amount in purchases if amount]
+
+
+def _totals_query(params: List[Dict]):
+    """Volume totale di acquirenti e referrer fino al 3° livello"""
+    buyers = sorted({p['user_id'] for p in params})
+    return (select(network_volumes.c.user_id,
+                   network_volumes.c.personal_volume + network_volumes.c.network_volume)
+            .where(or_(network_volumes.c.user_id.in_(buyers),
+                       network_volumes.c.user_id.in_(
+                           select(noble_relations.c.referrer_id)
+                           .where(noble_relations.c.referred_id.in_(buyers),
+                                  noble_relations.c.level.between(1, MAX_LEVEL))))))
+
+
+def _crossings(before: Dict, after: Dict) -> List[Tuple[int, Decimal, Decimal]]:
+    """(utente, volume prima, volume dopo) per chi è cresciuto"""
+    return [(user_id, Decimal(str(before.get(user_id, ZERO))), Decimal(str(total)))
+            for user_id, total in sorted(after.items())
+            if total > before.get(user_id, ZERO)]
+
+
+async def record_volumes(session, purchases: Iterable[Tuple[int, Decimal]],
+                         achievements: Optional[AchievementEngine] = None,
+                         distribution_id: Optional[int] = None) -> Dict[int, List[Dict]]:
+    """Aggiorna i contatori nella transazione della sessione chiamante.
+
+    Con `achievements` premia le soglie attraversate dall'acquirente e dai
+    referrer i cui contatori cambiano; restituisce i premi per utente.
+    `distribution_id` marca i premi pagati da una distribuzione settimanale.
+    """
+    params = _volume_params(purchases)
+    if not params:
+        return {}
+    if achievements:
+        before = dict((await session.execute(_totals_query(params))).all())
+    for statement in _volume_statements(session.bind.dialect.name):
+        await session.execute(statement, params)
+    if not achievements:
+        return {}
+
+    after = dict((await session.execute(_totals_query(params))).all())
+    awards = {}
+    for user_id, previous, current in _crossings(before, after):
+        awarded = await achievements.award(session, user_id, previous, current,
+                                           distribution_id)
+        if awarded:
+            awards[user_id] = awarded
+    return awards
+
+
+def record_volumes_sync(connection, purchases: Iterable[Tuple[int, Decimal]],
+                        achievements: Optional[AchievementEngine] = None,
+                        distribution_id: Optional[int] = None) -> Dict[int, List[Dict]]:
+    """Come record_volumes, per connessioni sincrone (shard)"""
+    params = _volume_params(purchases)
+    if not params:
+        return {}
+    if achievements:
+        before = dict(connection.execute(_totals_query(params)).all())
+    for statement in _volume_statements(connection.dialect.name):
+        connection.execute(statement, params)
+    if not achievements:
+        return {}
+
+    after = dict(connection.execute(_totals_query(params)).all())
+    awards = {}
+    for user_id, previous, current in _crossings(before, after):
+        awarded = achievements.award_sync(connection, user_id, previous, current,
+                                          distribution_id)
+        if awarded:
+            awards[user_id] = awarded
+    return awards
+
+
+async def award_recorded(session, user_id: int, amount: Decimal,
+                         achievements: AchievementEngine) -> Dict[int, List[Dict]]:
+    """Premia le soglie attraversate da un acquisto già nei contatori.
+
+    Non scrive volume: il volume precedente di acquirente e referrer è il
+    totale attuale meno `amount`. I livelli già pagati restano esclusi dal
+    vincolo su (user_id, level).
+    """
+    if not amount:
+        return {}
+    amount = Decimal(str(amount))
+    after = dict((await session.execute(_totals_query([{'user_id': user_id}]))).all())
+    before = {uid: Decimal(str(total)) - amount for uid, total in after.items()}
+    awards = {}
+    for uid, previous, current in _crossings(before, after):
+        awarded = await achievements.award(session, uid, previous, current)
+        if awarded:
+            awards[uid] = awarded
+    return awards
+
+
+async def mark_dirty(session, user_ids: Iterable[int]) -> int:
+    """Segna da rivalutare il rango degli utenti (es. upline di un nuovo referral)"""
+    now = datetime.utcnow()
+    params = [{'user_id': user_id, 'now': now} for user_id in sorted(set(user_ids))]
+    if not params:
+        return 0
+    upsert = UPSERT_DIALECTS[session.bind.dialect.name]
+    statement = upsert(network_volumes).values(
+        user_id=bindparam('user_id'), personal_volume=ZERO, network_volume=ZERO,
+        rank_dirty=True, updated_at=bindparam('now', type_=network_volumes.c.updated_at.type))
+    await session.execute(statement.on_conflict_do_update(
+        index_elements=[network_volumes.c.user_id],
+        set_={'rank_dirty': True, 'updated_at': statement.excluded.updated_at}), params)
+    return len(params)
+
+
+async def mark_upline_dirty(session, user_id: int) -> None:
+    """Segna da rivalutare i referrer di user_id fino al 3° livello"""
+    upsert = UPSERT_DIALECTS[session.bind.dialect.name]
+    statement = upsert(network_volumes).from_select(
+        ['user_id', 'personal_volume', 'network_volume', 'rank_dirty', 'updated_at'],
+        select(noble_relations.c.referrer_id, literal(ZERO), literal(ZERO), literal(True),
+               literal(datetime.utcnow()))
+        .where(noble_relations.c.referred_id == user_id,
+               noble_relations.c.level.between(1, MAX_LEVEL)))
+    await session.execute(statement.on_conflict_do_update(
+        index_elements=[network_volumes.c.user_id],
+        set_={'rank_dirty': True, 'updated_at': statement.excluded.updated_at}))
+
+
+class NetworkVolumeService:
+
+    @staticmethod
+    async def get_volume(user_id: int, database=None) -> Dict[str, Decimal]:
+        """Volume personale, di rete e totale di un utente"""
+        database = database or db
+        async with database.get_async_session() as session:
+            row = (await session.execute(
+                select(network_volumes.c.personal_volume, network_volumes.c.network_volume)
+                .where(network_volumes.c.user_id == user_id))).one_or_none()
+
+        personal, network = (Decimal(str(row[0])), Decimal(str(row[1]))) if row else (ZERO, ZERO)
+        return {'personal': personal, 'network': network, 'total': personal + network}
+
+    @staticmethod
+    async def rebuild(database=None) -> Dict:
+        """Ricalcola tutti i contatori dagli acquisti e dalle trasformazioni"""
+        database = database or db
+        try:
+            now = datetime.utcnow()
+            ledger = union_all(
+                select(transactions.c.user_id, transactions.c.amount.label('amount'))
+                .where(transactions.c.transaction_type == TransactionType.GOLD_PURCHASE,
+                       transactions.c.status == 'completed'),
+                select(gold_transformations.c.user_id,
+                       gold_transformations.c.euro_amount.label('amount'))
+                .where(gold_transformations.c.status.in_(TRANSFORMATION_STATUSES))
+            ).subquery()
+            personal = (select(ledger.c.user_id, func.sum(ledger.c.amount).label('volume'))
+                        .group_by(ledger.c.user_id)).subquery()
+
+            async with database.get_async_session() as session:
+                await session.execute(delete(network_volumes))
+                await session.execute(network_volumes.insert().from_select(
+                    ['user_id', 'personal_volume', 'network_volume', 'rank_dirty', 'updated_at'],
+                    select(personal.c.user_id, personal.c.volume, literal(ZERO), literal(True),
+                           literal(now))))
+
+                # Referrer senza volume personale: riga a zero prima del totale di rete
+                await session.execute(network_volumes.insert().from_select(
+                    ['user_id', 'personal_volume', 'network_volume', 'rank_dirty', 'updated_at'],
+                    select(noble_relations.c.referrer_id, literal(ZERO), literal(ZERO),
+                           literal(True), literal(now))
+                    .where(noble_relations.c.level.between(1, MAX_LEVEL),
+                           noble_relations.c.referred_id.in_(select(personal.c.user_id)),
+                           noble_relations.c.referrer_id.not_in(
+                               select(network_volumes.c.user_id)))
+                    .distinct()))
+
+                network = (select(func.coalesce(func.sum(personal.c.volume), ZERO))
+                           .select_from(noble_relations.join(
+                               personal, personal.c.user_id == noble_relations.c.referred_id))
+                           .where(noble_relations.c.referrer_id == network_volumes.c.user_id,
+                                  noble_relations.c.level.between(1, MAX_LEVEL))
+                           .scalar_subquery())
+                await session.execute(update(network_volumes).values(network_volume=network))
+
+                users, personal_total, network_total = (await session.execute(
+                    select(func.count(),
+                           func.coalesce(func.sum(network_volumes.c.personal_volume), ZERO),
+                           func.coalesce(func.sum(network_volumes.c.network_volume), ZERO))
+                )).one()
+
+            logger.info(f"Rebuilt network volumes for {users} users")
+            return {'status': 'success', 'users': users,
+                    'personal_volume': str(personal_total),
+                    'network_volume': str(network_total)}
+
+        except Exception as e:
+            logger.error(f"Network volume rebuild failed: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
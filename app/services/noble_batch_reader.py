@@ -0,0 +1,120 @@
+"""Letture batch di rango e premi nobiliari per molti indirizzi.
+
+Invece di una o due chiamate .call() per indirizzo, le letture
+nobleRanks/totalRewards vengono raggruppate in richieste JSON-RPC batch
+di chunk_size indirizzi, con al più max_concurrency batch in volo. Tutte
+le eth_call di una lettura sono fissate allo stesso blocco, letto una volta
+all'inizio; i risultati restano in cache per cache_ttl secondi con chiave
+(blocco, indirizzo), quindi un nuovo blocco invalida la cache da solo.
+"""
+import asyncio
+import time
+from typing import Dict, Iterable, List, Tuple
+import logging
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+from app.utils.web3_provider import rpc_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CACHE_TTL = 5.0
+
+# Funzioni lette dal contratto: campo del risultato -> firma (uint256 in uscita)
+FIELDS: Tuple[Tuple[str, bytes], ...] = tuple(
+    (name, Web3.keccak(text=signature)[:4])
+    for name, signature in (('rank', 'nobleRanks(address)'),
+                            ('total_rewards', 'totalRewards(address)')))
+
+
+def encode_call(selector: bytes, address: str) -> str:
+    return Web3.to_hex(selector + encode(['address'], [address]))
+
+
+class NobleBatchReader:
+
+    def __init__(self, endpoint: str, contract_address: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_concurrency: int = DEFAULT_CONCURRENCY,
+                 cache_ttl: float = DEFAULT_CACHE_TTL, timeout: int = 30):
+        self.endpoint = endpoint
+        self.contract_address = Web3.to_checksum_address(contract_address)
+        self.chunk_size = chunk_size
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self.stats = {'addresses': 0, 'cache_hits': 0, 'batches': 0}
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._cache: Dict[Tuple[int, str], Tuple[float, Dict]] = {}
+
+    async def _block_number(self) -> int:
+        [result] = await rpc_batch(self.endpoint, [('eth_blockNumber', [])], self.timeout)
+        if isinstance(result, Exception):
+            raise result
+        return int(result, 16)
+
+    def _decode(self, results: List, offset: int) -> Dict:
+        entry = {}
+        for position, (name, _) in enumerate(FIELDS):
+            result = results[offset + position]
+            if isinstance(result, Exception):
+                return {'error': str(result)}
+            try:
+                entry[name] = decode(['uint256'], Web3.to_bytes(hexstr=result))[0]
+            except Exception as e:
+                return {'error': f"Undecodable {name}: {e}"}
+        return entry
+
+    async def _read_chunk(self, addresses: List[str], block_tag: str) -> Dict[str, Dict]:
+        calls = [('eth_call', [{'to': self.contract_address,
+                                'data': encode_call(selector, address)}, block_tag])
+                 for address in addresses for _, selector in FIELDS]
+        async with self._slots:
+            results = await rpc_batch(self.endpoint, calls, self.timeout)
+        self.stats['batches'] += 1
+        return {address: self._decode(results, index * len(FIELDS))
+                for index, address in enumerate(addresses)}
+
+    def _evict(self, now: float) -> None:
+        for key in [key for key, (expires, _) in self._cache.items() if expires <= now]:
+            del self._cache[key]
+
+    async def read(self, addresses: Iterable[str]) -> Dict:
+        """Rango e premi totali (wei) per indirizzo, letti allo stesso blocco.
+
+        Restituisce {'block_number': n, 'values': {indirizzo: {...}}}, dove
+        ogni valore è {'rank', 'total_rewards'} oppure {'error'}.
+        """
+        unique = list(dict.fromkeys(Web3.to_checksum_address(address) for address in addresses))
+        block = await self._block_number()
+        now = time.monotonic()
+        self._evict(now)
+
+        values: Dict[str, Dict] = {}
+        missing = []
+        for address in unique:
+            cached = self._cache.get((block, address))
+            if cached:
+                values[address] = cached[1]
+            else:
+                missing.append(address)
+
+        chunks = [missing[i:i + self.chunk_size] for i in range(0, len(missing), self.chunk_size)]
+        results = await asyncio.gather(*(self._read_chunk(chunk, hex(block)) for chunk in chunks),
+                                       return_exceptions=True)
+        expires = time.monotonic() + self.cache_ttl
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Noble batch read failed for {len(chunk)} addresses: {result}")
+                values.update({address: {'error': str(result)} for address in chunk})
+                continue
+            for address, entry in result.items():
+                values[address] = entry
+                if 'error' not in entry:
+                    self._cache[(block, address)] = (expires, entry)
+
+        self.stats['addresses'] += len(unique)
+        self.stats['cache_hits'] += len(unique) - len(missing)
+        return {'block_number': block, 'values': {address: values[address] for address in unique}}
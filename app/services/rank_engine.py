@@ -0,0 +1,187 @@
+"""Ricalcolo incrementale dei ranghi nobiliari.
+
+Il rango di un utente dipende dal suo volume totale (personale + rete fino
+al 3° livello). Gli upsert dei volumi segnano rank_dirty sull'acquirente e
+sulla sua upline, e un nuovo referral segna la upline del nuovo utente:
+il batch periodico rivaluta solo quelle righe, scrive il nuovo rango in
+users.noble_rank_id, registra i cambi reali in rank_changes e li pubblica
+on-chain in un unico invio.
+
+Il numero di soglie raggiunte si traduce nel NobleRank con il livello più
+alto non superiore, letto da config_cache.noble_ranks; rank_changes
+registra i livelli (0 = nessun rango).
+"""
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Mapping, Optional, Sequence
+import logging
+
+from sqlalchemy import bindparam, insert, select, text, update
+
+from app.database import db
+from app.models.models import User
+from app.models.network_volume import NetworkVolume
+from app.models.rank import RankChange
+from app.services.achievement_engine import ACHIEVEMENT_THRESHOLDS
+from app.services.config_cache import config_cache
+
+logger = logging.getLogger(__name__)
+
+network_volumes = NetworkVolume.__table__
+users = User.__table__
+rank_changes = RankChange.__table__
+
+# Pulisce il flag solo se la riga non è stata aggiornata dopo la lettura
+CLEAR_DIRTY = text("""UPDATE network_volumes SET rank_dirty = :clean
+                      WHERE user_id = :user_id AND updated_at = :seen""").bindparams(
+    bindparam('clean', type_=network_volumes.c.rank_dirty.type),
+    bindparam('seen', type_=network_volumes.c.updated_at.type))
+
+SET_NOBLE_RANK = (update(users)
+                  .where(users.c.id == bindparam('target_id'))
+                  .values(noble_rank_id=bindparam('noble_rank_id')))
+
+
+class RankEngine:
+
+    def __init__(self, database=None, thresholds: Optional[Sequence[Decimal]] = None,
+                 batch_size: int = 5000):
+        self.database = database or db
+        self.bounds = sorted(thresholds or ACHIEVEMENT_THRESHOLDS.values())
+        self.batch_size = batch_size
+
+    def rank_for(self, volume: Decimal) -> int:
+        """Rango = numero di soglie raggiunte (0 sotto la prima)"""
+        return bisect_right(self.bounds, volume)
+
+    @staticmethod
+    def _noble_ranks() -> Dict[int, int]:
+        """Livello -> id dei NobleRank configurati"""
+        return {rank['level']: rank['id'] for rank in config_cache.noble_ranks}
+
+    @staticmethod
+    def level_for(rank: int, levels: Sequence[int]) -> int:
+        """Livello NobleRank più alto non superiore al rango (0 se nessuno)"""
+        position = bisect_right(levels, rank)
+        return levels[position - 1] if position else 0
+
+    async def _recompute_batch(self, session, after_user_id: int,
+                               noble_ranks: Dict[int, int]) -> Optional[Dict]:
+        total = (network_volumes.c.personal_volume
+                 + network_volumes.c.network_volume).label('volume')
+        rows = (await session.execute(
+            select(network_volumes.c.user_id, total, users.c.noble_rank_id,
+                   network_volumes.c.updated_at)
+            .select_from(network_volumes.join(
+                users, users.c.id == network_volumes.c.user_id))
+            .where(network_volumes.c.rank_dirty.is_(True),
+                   network_volumes.c.user_id > after_user_id)
+            .order_by(network_volumes.c.user_id)
+            .limit(self.batch_size))).all()
+        if not rows:
+            return None
+
+        levels = sorted(noble_ranks)
+        level_of = {rank_id: level for level, rank_id in noble_ranks.items()}
+        now = datetime.utcnow()
+        changes = []
+        for user_id, volume, noble_rank_id, _ in rows:
+            previous = level_of.get(noble_rank_id, 0)
+            new_level = self.level_for(self.rank_for(Decimal(str(volume))), levels)
+            if new_level != previous:
+                changes.append({'user_id': user_id, 'previous_rank': previous,
+                                'new_rank': new_level, 'created_at': now})
+
+        if changes:
+            await session.execute(SET_NOBLE_RANK, [
+                {'target_id': c['user_id'], 'noble_rank_id': noble_ranks.get(c['new_rank'])}
+                for c in changes])
+            await session.execute(insert(rank_changes), changes)
+
+        await session.execute(CLEAR_DIRTY, [
+            {'clean': False, 'user_id': user_id, 'seen': seen}
+            for user_id, _, _, seen in rows])
+        return {'last_user_id': rows[-1].user_id, 'evaluated': len(rows),
+                'changes': changes}
+
+    async def recompute(self) -> Dict:
+        """Rivaluta i soli utenti con rank_dirty, a blocchi per keyset"""
+        try:
+            await config_cache.ensure_fresh(self.database)
+            noble_ranks = self._noble_ranks()
+            if not noble_ranks:
+                return {'status': 'error', 'message': 'No noble ranks configured'}
+
+            evaluated = 0
+            changes: List[Dict] = []
+            after_user_id = 0
+            while True:
+                async with self.database.get_async_session() as session:
+                    batch = await self._recompute_batch(session, after_user_id, noble_ranks)
+                if batch is None:
+                    break
+                evaluated += batch['evaluated']
+                changes.extend(batch['changes'])
+                after_user_id = batch['last_user_id']
+
+            logger.info(f"Rank recompute: {evaluated} evaluated, {len(changes)} changed")
+            return {'status': 'success', 'evaluated': evaluated,
+                    'changed': len(changes), 'changes': changes}
+
+        except Exception as e:
+            logger.error(f"Rank recompute failed: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    async def push_pending(self, blockchain_service, addresses: Mapping[int, str]) -> Dict:
+        """Pubblica on-chain l'ultimo rango di ogni utente con cambi in attesa.
+
+        I cambi precedenti dello stesso utente vengono chiusi insieme
+        all'ultimo; gli utenti senza indirizzo restano in attesa.
+        """
+        async with self.database.get_async_session() as session:
+            pending = (await session.execute(
+                select(rank_changes.c.id, rank_changes.c.user_id, rank_changes.c.new_rank)
+                .where(rank_changes.c.pushed_at.is_(None))
+                .order_by(rank_changes.c.id))).all()
+
+        latest: Dict[int, int] = {}
+        ids: Dict[int, List[int]] = {}
+        for change_id, user_id, new_rank in pending:
+            latest[user_id] = new_rank
+            ids.setdefault(user_id, []).append(change_id)
+
+        batch = [(user_id, addresses[user_id], rank)
+                 for user_id, rank in latest.items() if addresses.get(user_id)]
+        if not batch:
+            return {'status': 'success', 'pushed': 0, 'failed': 0, 'unknown': 0,
+                    'skipped': len(latest)}
+
+        results = await blockchain_service.update_noble_ranks(
+            [(address, rank) for _, address, rank in batch])
+
+        now = datetime.utcnow()
+        pushed, failed, unknown = [], [], []
+        for (user_id, _, _), result in zip(batch, results):
+            if result.get('status') in ('completed', 'verified'):
+                pushed.append({'user_id': user_id, 'tx_hash': result.get('transaction_hash')})
+            elif result.get('status') == 'timeout':
+                # Esito ignoto: restano in attesa, reinviare lo stesso rango è innocuo
+                unknown.append(user_id)
+            else:
+                failed.append(user_id)
+
+        async with self.database.get_async_session() as session:
+            for entry in pushed:
+                await session.execute(
+                    update(rank_changes)
+                    .where(rank_changes.c.id.in_(ids[entry['user_id']]))
+                    .values(pushed_at=now, tx_hash=entry['tx_hash']))
+
+        if failed:
+            logger.warning(f"Rank push failed for {len(failed)} users")
+        if unknown:
+            logger.warning(f"Rank push receipt timed out for {len(unknown)} users")
+        return {'status': 'success' if not failed and not unknown else 'partial',
+                'pushed': len(pushed), 'failed': len(failed), 'unknown': len(unknown),
+                'skipped': len(latest) - len(batch)}
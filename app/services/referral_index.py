@@ -0,0 +1,147 @@
+"""Indice in memoria delle relazioni referral per i calcoli dei bonus.
+
+Per ogni user_id l'indice tiene in array interi gli antenati di livello
+1..MAX_LEVEL (il livello 1 è il referrer diretto) e il livello dell'ultima
+relazione di downline ricevuta. Viene caricato da `noble_relations` una
+volta per processo e poi aggiornato in modo incrementale: dalle relazioni
+con id successivo all'ultimo letto e da ReferralService.create_referral.
+"""
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.models.models import NobleRelation
+from app.services.referral_service import ReferralService
+
+noble_relations = NobleRelation.__table__
+
+NO_USER = 0
+
+
+class ReferralIndex:
+    def __init__(self, max_level: int = ReferralService.MAX_LEVEL,
+                 capacity: int = 1024, fetch_size: int = 50000):
+        self.max_level = max_level
+        self.fetch_size = fetch_size
+        self.ancestors = np.zeros((capacity, max_level), dtype=np.int64)
+        self.last_downline_level = np.zeros(capacity, dtype=np.int8)
+        self.last_relation_id = 0
+        self.loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _ensure_capacity(self, user_id: int) -> None:
+        capacity = self.ancestors.shape[0]
+        if user_id < capacity:
+            return
+        while capacity <= user_id:
+            capacity *= 2
+        ancestors = np.zeros((capacity, self.max_level), dtype=np.int64)
+        ancestors[:self.ancestors.shape[0]] = self.ancestors
+        downline = np.zeros(capacity, dtype=np.int8)
+        downline[:self.last_downline_level.size] = self.last_downline_level
+        self.ancestors, self.last_downline_level = ancestors, downline
+
+    def _ingest(self, referrer_ids: np.ndarray, referred_ids: np.ndarray,
+                levels: np.ndarray) -> None:
+        """Applica un blocco di relazioni in ordine di id"""
+        keep = (levels >= 1) & (levels <= self.max_level)
+        referrer_ids, referred_ids, levels = referrer_ids[keep], referred_ids[keep], levels[keep]
+        if not referred_ids.size:
+            return
+        self._ensure_capacity(int(max(referrer_ids.max(), referred_ids.max())))
+        self.ancestors[referred_ids, levels - 1] = referrer_ids
+        # Con indici ripetuti vince l'ultima assegnazione, cioè l'id più alto
+        self.last_downline_level[referrer_ids] = levels
+
+    async def _load_after(self, database, after_id: int) -> int:
+        loaded = 0
+        while True:
+            async with database.get_async_session() as session:
+                rows = (await session.execute(
+                    select(noble_relations.c.id, noble_relations.c.referrer_id,
+                           noble_relations.c.referred_id, noble_relations.c.level)
+                    .where(noble_relations.c.id > after_id)
+                    .order_by(noble_relations.c.id)
+                    .limit(self.fetch_size))).all()
+            if not rows:
+                return loaded
+            block = np.array([tuple(row) for row in rows], dtype=np.int64)
+            self._ingest(block[:, 1], block[:, 2], block[:, 3])
+            after_id = int(block[-1, 0])
+            self.last_relation_id = after_id
+            loaded += len(rows)
+
+    async def load(self, database) -> int:
+        """Caricamento completo da noble_relations"""
+        async with self._lock:
+            self.ancestors[:] = NO_USER
+            self.last_downline_level[:] = 0
+            self.last_relation_id = 0
+            loaded = await self._load_after(database, 0)
+            self.loaded_at = time.monotonic()
+            return loaded
+
+    async def refresh(self, database) -> int:
+        """Legge solo le relazioni create dopo l'ultima già indicizzata"""
+        async with self._lock:
+            loaded = await self._load_after(database, self.last_relation_id)
+            self.loaded_at = time.monotonic()
+            return loaded
+
+    async def ensure_fresh(self, database, max_age: float = 5.0) -> None:
+        """Carica alla prima chiamata, poi aggiorna al più ogni max_age secondi"""
+        if self.loaded_at is None:
+            await self.load(database)
+        elif time.monotonic() - self.loaded_at > max_age:
+            await self.refresh(database)
+
+    def add_referral(self, referrer_id: int, referred_id: int) -> None:
+        """Registra una nuova relazione diretta e le indirette che ne derivano.
+
+        Se referred_id ha già una downline, i discendenti fino a max_level
+        ereditano i nuovi antenati sopra di lui.
+        """
+        self._ensure_capacity(max(referrer_id, referred_id))
+        chain = np.concatenate(([referrer_id], self.ancestors[referrer_id, :-1]))
+        self.ancestors[referred_id] = chain
+        for level, ancestor in enumerate(chain, start=1):
+            if ancestor != NO_USER:
+                self.last_downline_level[ancestor] = level
+
+        for depth in range(1, self.max_level):
+            descendants = np.flatnonzero(self.ancestors[:, depth - 1] == referred_id)
+            if not descendants.size:
+                break
+            inherited = chain[:self.max_level - depth]
+            self.ancestors[descendants, depth:] = inherited
+            for level, ancestor in enumerate(inherited, start=depth + 1):
+                if ancestor != NO_USER:
+                    self.last_downline_level[ancestor] = level
+
+    def upline(self, user_id: int) -> List[Tuple[int, int]]:
+        """(antenato, livello) dal referrer diretto in su"""
+        if user_id >= self.ancestors.shape[0]:
+            return []
+        return [(int(ancestor), level)
+                for level, ancestor in enumerate(self.ancestors[user_id], start=1)
+                if ancestor != NO_USER]
+
+    def ancestors_at(self, user_ids: np.ndarray, level: int) -> np.ndarray:
+        """Antenato di livello `level` per ogni utente (NO_USER se assente)"""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        result = np.full(user_ids.shape, NO_USER, dtype=np.int64)
+        known = user_ids < self.ancestors.shape[0]
+        result[known] = self.ancestors[user_ids[known], level - 1]
+        return result
+
+    def downline_level(self, user_id: int) -> int:
+        """Livello dell'ultima relazione in cui l'utente è referrer (0 se nessuna)"""
+        if user_id >= self.last_downline_level.size:
+            return 0
+        return int(self.last_downline_level[user_id])
+
+
+referral_index = ReferralIndex()
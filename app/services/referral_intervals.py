@@ -0,0 +1,274 @@
+"""Codifica a intervalli annidati della foresta referral.
+
+Ogni utente ha (lft, rgt, depth) nel proprio albero: il sottoalbero di un
+utente è l'insieme delle righe con lo stesso root_id e lft in (lft, rgt),
+per cui dimensione della downline, grammi sotto un utente o affiliati
+attivi entro una profondità diventano query di intervallo sull'indice
+(root_id, lft) invece di visite ricorsive di noble_relations.
+
+Gli intervalli hanno spazio libero: un nuovo figlio prende 1/CHILD_SHARE
+dello spazio ancora libero del padre, senza toccare altre righe. Quando lo
+spazio finisce si ridistribuisce solo il sottoalbero del primo antenato
+con abbastanza spazio, non l'intera foresta.
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional
+import logging
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+
+from app.database import db
+from app.models.models import NobleRelation, User
+from app.models.referral_interval import ReferralInterval
+
+logger = logging.getLogger(__name__)
+
+referral_intervals = ReferralInterval.__table__
+noble_relations = NobleRelation.__table__
+users = User.__table__
+
+ROOT_SPAN = 2 ** 60
+CHILD_SHARE = 8  # quota dello spazio libero del padre data a un nuovo figlio
+MIN_SPAN = 64  # ampiezza minima di un intervallo, per ospitare figli futuri
+RESERVED_SLOTS = 1  # posti liberi per nodo, in unità di "un utente", nel layout
+INSERT_CHUNK = 5000
+
+
+class IntervalExhausted(ValueError):
+    """Lo spazio dell'intervallo non basta per il sottoalbero"""
+
+
+class Interval(NamedTuple):
+    user_id: int
+    root_id: int
+    parent_id: Optional[int]
+    lft: int
+    rgt: int
+    next_child: int
+    depth: int
+
+
+def layout_subtree(node_id: int, children: Dict[int, List[int]], root_id: int,
+                   lft: int = 0, rgt: int = ROOT_SPAN, depth: int = 0,
+                   parent_id: Optional[int] = None) -> List[Interval]:
+    """Intervalli del sottoalbero di node_id dentro [lft, rgt].
+
+    Lo spazio interno di ogni nodo si divide tra i figli esistenti in
+    proporzione alla dimensione dei loro sottoalberi, più RESERVED_SLOTS
+    quote lasciate libere per i figli futuri. Ogni utente riceve così circa
+    lo stesso spazio qualunque sia la forma dell'albero: l'ampiezza cala
+    con la dimensione del sottoalbero, non in modo geometrico con la
+    profondità, e anche catene lunghe migliaia di livelli trovano posto.
+    """
+    # Dimensioni dei sottoalberi con una visita in post-ordine
+    sizes: Dict[int, int] = {}
+    stack = [(node_id, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            sizes[node] = 1 + sum(sizes[child] for child in children.get(node, ()))
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children.get(node, ()))
+
+    rows = []
+    stack = [(node_id, lft, rgt, depth, parent_id)]
+    while stack:
+        node, low, high, level, parent = stack.pop()
+        if high - low + 1 < MIN_SPAN:
+            raise IntervalExhausted(f"No interval space left for user {node}")
+        kids = children.get(node, ())
+        inner = high - low - 1
+        shares = sizes[node] - 1 + RESERVED_SLOTS
+        cursor = low + 1
+        for child in kids:
+            span = inner * sizes[child] // shares
+            stack.append((child, cursor, cursor + span - 1, level + 1, node))
+            cursor += span
+        rows.append(Interval(node, root_id, parent, low, high, cursor, level))
+    return rows
+
+
+def _children_of(parents: Dict[int, int]) -> Dict[int, List[int]]:
+    children: Dict[int, List[int]] = {}
+    for referred_id, referrer_id in sorted(parents.items()):
+        children.setdefault(referrer_id, []).append(referred_id)
+    return children
+
+
+def _root_of(user_id: int, parents: Dict[int, int]) -> int:
+    while user_id in parents:
+        user_id = parents[user_id]
+    return user_id
+
+
+def _row(interval: Interval) -> Dict:
+    return interval._asdict()
+
+
+class ReferralIntervalTree:
+
+    def __init__(self, database=None):
+        self.database = database or db
+
+    @staticmethod
+    def descendants(anchor) -> and_:
+        """Condizione sulle righe strettamente sotto `anchor` (una riga di intervallo)"""
+        return and_(referral_intervals.c.root_id == anchor.root_id,
+                    referral_intervals.c.lft > anchor.lft,
+                    referral_intervals.c.lft <= anchor.rgt)
+
+    async def _write(self, session, rows: List[Interval]) -> None:
+        for first in range(0, len(rows), INSERT_CHUNK):
+            await session.execute(insert(referral_intervals),
+                                  [_row(r) for r in rows[first:first + INSERT_CHUNK]])
+
+    async def rebuild(self) -> Dict:
+        """Ricalcola tutti gli intervalli dalle relazioni dirette"""
+        try:
+            async with self.database.get_async_session() as session:
+                parents = dict((await session.execute(
+                    select(noble_relations.c.referred_id, noble_relations.c.referrer_id)
+                    .where(noble_relations.c.level == 1))).all())
+                children = _children_of(parents)
+                roots = sorted(set(children) - set(parents))
+
+                rows: List[Interval] = []
+                for root_id in roots:
+                    rows.extend(layout_subtree(root_id, children, root_id))
+
+                await session.execute(delete(referral_intervals))
+                await self._write(session, rows)
+
+            logger.info(f"Rebuilt referral intervals for {len(rows)} users")
+            return {'status': 'success', 'trees': len(roots), 'users': len(rows)}
+
+        except Exception as e:
+            logger.error(f"Referral interval rebuild failed: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    async def replace_trees(self, session, parents: Dict[int, int],
+                            user_ids: Iterable[int]) -> int:
+        """Ricalcola gli alberi che contengono user_ids, dati tutti i referrer diretti.
+
+        Usato dall'import massivo: gli alberi toccati vengono ridisegnati
+        in memoria e riscritti nella transazione dell'import.
+        """
+        roots = {_root_of(user_id, parents) for user_id in user_ids}
+        if not roots:
+            return 0
+        children = _children_of(parents)
+        rows: List[Interval] = []
+        for root_id in sorted(roots):
+            rows.extend(layout_subtree(root_id, children, root_id))
+
+        members = [row.user_id for row in rows]
+        for first in range(0, len(members), INSERT_CHUNK):
+            await session.execute(delete(referral_intervals).where(
+                referral_intervals.c.user_id.in_(members[first:first + INSERT_CHUNK])))
+        await self._write(session, rows)
+        return len(rows)
+
+    async def _get(self, session, user_id: int):
+        return (await session.execute(
+            select(referral_intervals)
+            .where(referral_intervals.c.user_id == user_id))).one_or_none()
+
+    async def add(self, session, referrer_id: int, referred_id: int) -> None:
+        """Aggiunge una relazione diretta nella transazione della sessione"""
+        parent = await self._get(session, referrer_id)
+        if parent is None:
+            root = Interval(referrer_id, referrer_id, None, 0, ROOT_SPAN, 1, 0)
+            await session.execute(insert(referral_intervals).values(**_row(root)))
+            parent = root
+
+        child = await self._get(session, referred_id)
+        if child is not None and child.parent_id is not None:
+            raise ValueError(f"User {referred_id} already has a referrer")
+
+        span = (parent.rgt - parent.next_child + 1) // CHILD_SHARE
+        if child is None and span >= MIN_SPAN:
+            lft = parent.next_child
+            moved = await session.execute(
+                update(referral_intervals)
+                .where(referral_intervals.c.user_id == referrer_id,
+                       referral_intervals.c.next_child == lft)
+                .values(next_child=lft + span))
+            if moved.rowcount != 1:
+                raise ValueError(f"Concurrent insert under user {referrer_id}")
+            await session.execute(insert(referral_intervals).values(**_row(Interval(
+                referred_id, parent.root_id, referrer_id, lft, lft + span - 1,
+                lft + 1, parent.depth + 1))))
+            return
+
+        # Spazio esaurito, o l'utente porta con sé un albero: ridistribuzione locale
+        await self._relayout(session, parent, referred_id, child)
+
+    async def _relayout(self, session, parent, referred_id: int, child) -> None:
+        edges = {referred_id: parent.user_id}
+        moved = []
+        if child is not None:
+            moved = (await session.execute(
+                select(referral_intervals.c.user_id, referral_intervals.c.parent_id)
+                .where(referral_intervals.c.root_id == child.user_id))).all()
+            edges.update((u, p) for u, p in moved if p is not None)
+
+        anchor = parent
+        while True:
+            members = (await session.execute(
+                select(referral_intervals.c.user_id, referral_intervals.c.parent_id)
+                .where(self.descendants(anchor)))).all()
+            tree = dict(edges)
+            tree.update((u, p) for u, p in members)
+            try:
+                rows = layout_subtree(anchor.user_id, _children_of(tree), anchor.root_id,
+                                      anchor.lft, anchor.rgt, anchor.depth, anchor.parent_id)
+                break
+            except IntervalExhausted:
+                if anchor.parent_id is None:
+                    raise
+                anchor = await self._get(session, anchor.parent_id)
+
+        await session.execute(delete(referral_intervals).where(or_(
+            self.descendants(anchor),
+            referral_intervals.c.user_id == anchor.user_id,
+            referral_intervals.c.root_id == referred_id)))
+        await self._write(session, rows)
+        logger.info(f"Relaid out referral subtree of user {anchor.user_id} ({len(rows)} users)")
+
+    async def downline_size(self, user_id: int) -> int:
+        """Numero di utenti sotto user_id, a ogni profondità"""
+        async with self.database.get_async_session() as session:
+            anchor = await self._get(session, user_id)
+            if anchor is None:
+                return 0
+            return (await session.execute(
+                select(func.count()).select_from(referral_intervals)
+                .where(self.descendants(anchor)))).scalar()
+
+    async def subtree_sum(self, user_id: int, column, max_depth: Optional[int] = None):
+        """Somma di `column` (colonna di una tabella con user_id) sulla downline"""
+        async with self.database.get_async_session() as session:
+            anchor = await self._get(session, user_id)
+            if anchor is None:
+                return 0
+            query = (select(func.coalesce(func.sum(column), 0))
+                     .select_from(referral_intervals.join(
+                         column.table, column.table.c.user_id == referral_intervals.c.user_id))
+                     .where(self.descendants(anchor)))
+            if max_depth is not None:
+                query = query.where(referral_intervals.c.depth <= anchor.depth + max_depth)
+            return (await session.execute(query)).scalar()
+
+    async def active_affiliates(self, user_id: int, max_depth: int = 3) -> int:
+        """Utenti attivi nella downline entro max_depth livelli"""
+        async with self.database.get_async_session() as session:
+            anchor = await self._get(session, user_id)
+            if anchor is None:
+                return 0
+            return (await session.execute(
+                select(func.count())
+                .select_from(referral_intervals.join(
+                    users, users.c.id == referral_intervals.c.user_id))
+                .where(self.descendants(anchor),
+                       referral_intervals.c.depth <= anchor.depth + max_depth,
+                       users.c.is_active.is_(True)))).scalar()
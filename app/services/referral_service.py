@@ -1,12 +1,121 @@
 
+import time
+from datetime import datetime
 from app.models import db, NobleRelation, User
+from app.services.referral_intervals import ReferralIntervalTree
+from app.services.network_volume_service import mark_dirty, mark_upline_dirty
 from app.utils.logging_config import get_logger
-from sqlalchemy import text, Index
+from sqlalchemy import (text, Index, insert, select, delete, desc, Table, Column,
+                        Integer, MetaData)
 from sqlalchemy.exc import IntegrityError
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterable, Tuple
 
 logger = get_logger(__name__)
 
+noble_relations = NobleRelation.__table__
+
+# Oltre questa soglia gli id passano da una tabella temporanea invece che da IN (...)
+UPLINE_TEMP_THRESHOLD = 1000
+
+upline_purchasers = Table('tmp_upline_purchasers', MetaData(),
+                          Column('user_id', Integer, primary_key=True),
+                          prefixes=['TEMPORARY'], postgresql_on_commit='DROP')
+
+
+async def resolve_uplines(session, purchaser_ids: Iterable[int], max_level: int = 3,
+                          temp_threshold: int = UPLINE_TEMP_THRESHOLD
+                          ) -> List[Tuple[int, int, int]]:
+    """Triple (purchaser, beneficiary, level) di tutti gli acquirenti in una query.
+
+    Fallback set-based per i worker senza indice referral in memoria: con
+    molti id la lista viene caricata in una tabella temporanea e unita a
+    noble_relations sull'indice (referred_id, level).
+    """
+    ids = sorted(set(purchaser_ids))
+    if not ids:
+        return []
+    if len(ids) <= temp_threshold:
+        return [tuple(row) for row in
+                await session.execute(NobleRelation.upline_select(ids, max_level))]
+
+    await session.run_sync(
+        lambda sync_session: upline_purchasers.create(sync_session.connection(),
+                                                      checkfirst=True))
+    await session.execute(delete(upline_purchasers))
+    await session.execute(insert(upline_purchasers), [{'user_id': u} for u in ids])
+    rows = [tuple(row) for row in await session.execute(
+        NobleRelation.upline_select(select(upline_purchasers.c.user_id), max_level))]
+    await session.execute(delete(upline_purchasers))
+    return rows
+
+
+async def last_downline_level(session, user_id: int) -> int:
+    """Livello dell'ultima relazione in cui l'utente è referrer (0 se nessuna)"""
+    return (await session.execute(
+        select(noble_relations.c.level)
+        .where(noble_relations.c.referrer_id == user_id)
+        .order_by(desc(noble_relations.c.id))
+        .limit(1))).scalar() or 0
+
+
+def plan_referral_import(pairs: Iterable[Tuple[int, int]], parents: Dict[int, int],
+                         max_level: int) -> Tuple[List[Tuple[int, int, int]], List[Dict]]:
+    """Righe di chiusura (referrer, referred, level) per le nuove coppie.
+
+    `parents` è la mappa referred -> referrer diretto già presente nel
+    database. Se un referred ha già una downline, anche i suoi discendenti
+    fino a `max_level` ricevono le righe verso i nuovi antenati.
+    Auto-referral, utenti con due referrer diretti e cicli (anche
+    attraverso l'albero esistente) finiscono negli scarti.
+    """
+    new_parents: Dict[int, int] = {}
+    rejected: List[Dict] = []
+    for referrer_id, referred_id in pairs:
+        if referrer_id == referred_id:
+            rejected.append({'referrer_id': referrer_id, 'referred_id': referred_id,
+                             'reason': 'self_referral'})
+        elif parents.get(referred_id, referrer_id) != referrer_id:
+            rejected.append({'referrer_id': referrer_id, 'referred_id': referred_id,
+                             'reason': 'already_referred'})
+        elif new_parents.get(referred_id, referrer_id) != referrer_id:
+            rejected.append({'referrer_id': referrer_id, 'referred_id': referred_id,
+                             'reason': 'conflicting_referrer'})
+        elif referred_id not in parents:
+            new_parents[referred_id] = referrer_id
+
+    # Visita dei cammini verso la radice: un nodo rivisto nello stesso cammino chiude un ciclo
+    def parent_of(user_id):
+        return new_parents.get(user_id, parents.get(user_id))
+
+    done, cyclic = set(), set()
+    for start in new_parents:
+        path, on_path, node = [], set(), start
+        while node is not None and node not in done:
+            if node in on_path:
+                cyclic.update(path[path.index(node):])
+                break
+            path.append(node)
+            on_path.add(node)
+            node = parent_of(node)
+        done.update(path)
+
+    for referred_id in cyclic:
+        if referred_id in new_parents:
+            rejected.append({'referrer_id': new_parents.pop(referred_id),
+                             'referred_id': referred_id, 'reason': 'cycle'})
+
+    # Una riga è nuova quando il cammino verso l'antenato passa da un nuovo
+    # collegamento: vale anche per la downline già esistente dei referred
+    rows = []
+    for user_id in [*new_parents, *parents]:
+        level, node, linked = 1, user_id, False
+        while level <= max_level and parent_of(node) is not None:
+            linked = linked or node in new_parents
+            if linked:
+                rows.append((parent_of(node), user_id, level))
+            node, level = parent_of(node), level + 1
+    return rows, rejected
+
 class ReferralService:
     MAX_LEVEL = 3  # Maximum level for bonus calculations
     
@@ -45,8 +154,15 @@ class ReferralService:
             
             # Create indirect relations up to MAX_LEVEL
             await self._create_indirect_relations(referrer_id, referred_id)
+            await ReferralIntervalTree().add(db.session, referrer_id, referred_id)
+            await mark_upline_dirty(db.session, referred_id)
             
             await db.session.commit()
+
+            # Aggiorna l'indice in memoria di questo processo
+            from app.services.referral_index import referral_index
+            referral_index.add_referral(referrer_id, referred_id)
+
             logger.info(f"Referral created successfully: {referrer_id} -> {referred_id}")
             return True
             
@@ -112,5 +228,60 @@ class ReferralService:
             logger.error(f"Error creating indirect relations: {str(e)}")
             raise
 
+    async def import_referrals(self, pairs: Iterable[Tuple[int, int]], database=None,
+                               chunk_size: int = 5000) -> Dict:
+        """Importa in blocco coppie (referrer, referred) in una sola transazione.
+
+        Cicli e auto-referral sono verificati in memoria sull'albero esistente
+        più le nuove coppie; se ce ne sono non viene scritto nulla. Le
+        relazioni di livello 1..MAX_LEVEL sono calcolate in memoria e inserite
+        con executemany a blocchi di `chunk_size`.
+        """
+        from app.database import db as async_db
+        from app.services.referral_index import referral_index
+        database = database or async_db
+        start = time.perf_counter()
+        try:
+            async with database.get_async_session() as session:
+                parents = dict((await session.execute(
+                    select(noble_relations.c.referred_id, noble_relations.c.referrer_id)
+                    .where(noble_relations.c.level == 1))).all())
+
+                rows, rejected = plan_referral_import(pairs, parents, self.MAX_LEVEL)
+                if rejected:
+                    logger.warning(f"Referral import rejected: {len(rejected)} invalid pairs")
+                    return {'status': 'error', 'rejected': rejected, 'inserted': 0}
+
+                now = datetime.utcnow()
+                for first in range(0, len(rows), chunk_size):
+                    await session.execute(insert(noble_relations), [
+                        {'referrer_id': referrer_id, 'referred_id': referred_id,
+                         'level': level, 'created_at': now}
+                        for referrer_id, referred_id, level in rows[first:first + chunk_size]])
+
+                new_parents = {referred_id: referrer_id
+                               for referrer_id, referred_id, level in rows if level == 1}
+                await ReferralIntervalTree(database).replace_trees(
+                    session, {**parents, **new_parents}, new_parents)
+                await mark_dirty(session, {referrer_id for referrer_id, _, _ in rows})
+
+            if referral_index.loaded_at is not None:
+                await referral_index.refresh(database)
+
+            seconds = time.perf_counter() - start
+            logger.info(f"Imported {len(rows)} referral relations in {seconds:.2f}s")
+            return {
+                'status': 'success',
+                'referrals': sum(1 for row in rows if row[2] == 1),
+                'inserted': len(rows),
+                'seconds': round(seconds, 3),
+                'rows_per_second': round(len(rows) / max(seconds, 1e-9), 1)
+            }
+
+        except Exception as e:
+            logger.error(f"Referral import failed: {str(e)}")
+            return {'status': 'error', 'message': str(e), 'inserted': 0}
+
+
 # Create index on referred_id for better query performance
 Index('idx_noble_relations_referred_id', NobleRelation.__table__.c.referred_id)
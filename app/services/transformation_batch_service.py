@@ -0,0 +1,303 @@
+"""Registrazione on-chain delle trasformazioni in lotti Merkle.
+
+Invece di una chiamata transformGold per trasformazione, il recorder
+raccoglie le trasformazioni approvate fino a fine finestra, costruisce un
+albero Merkle delle foglie (id, indirizzo, centesimi di euro, unità di
+grammi) e pubblica on-chain solo la radice, con una transazione per lotto.
+Foglie e prove di inclusione restano in transformation_leaves: chiunque
+può verificare una trasformazione contro la radice con
+GoldSystem.verifyTransformation.
+
+L'albero è compatibile con MerkleProof di OpenZeppelin: foglia
+keccak256(keccak256(abi.encode(...))), coppie ordinate prima dell'hash,
+nodo dispari promosso al livello superiore.
+"""
+import asyncio
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Mapping, Optional, Sequence
+import logging
+
+from eth_abi import encode
+from eth_utils import keccak
+from sqlalchemy import insert, select, update
+from web3 import Web3
+
+from app.database import db
+from app.models.models import GoldTransformation
+from app.models.transformation_batch import TransformationBatch, TransformationLeaf
+from app.services.network_volume_service import TRANSFORMATION_STATUSES
+
+logger = logging.getLogger(__name__)
+
+gold_transformations = GoldTransformation.__table__
+transformation_batches = TransformationBatch.__table__
+transformation_leaves = TransformationLeaf.__table__
+
+# Stesse unità di submit_gold_transaction
+EURO_SCALE = 100
+GRAM_SCALE = 10000
+MAX_LEAVES = 10000
+
+LEAF_TYPES = ['uint256', 'address', 'uint256', 'uint256']
+CONFIRMED_STATUSES = ('completed', 'verified')
+RECEIPT_TIMEOUT = 'timeout'
+
+
+def to_units(value, scale: int) -> int:
+    return int(Decimal(str(value)) * scale)
+
+
+def leaf_hash(transformation_id: int, address: str, euro_cents: int, gold_units: int) -> bytes:
+    encoded = encode(LEAF_TYPES, [transformation_id, Web3.to_checksum_address(address),
+                                  euro_cents, gold_units])
+    return keccak(keccak(encoded))
+
+
+def _hash_pair(left: bytes, right: bytes) -> bytes:
+    return keccak(min(left, right) + max(left, right))
+
+
+def build_levels(leaves: Sequence[bytes]) -> List[List[bytes]]:
+    """Livelli dell'albero dalle foglie (indice 0) alla radice (ultimo)"""
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([_hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                       for i in range(0, len(level), 2)])
+    return levels
+
+
+def proof_for(levels: List[List[bytes]], index: int) -> List[bytes]:
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf: bytes, proof: Sequence[bytes], root: bytes) -> bool:
+    node = leaf
+    for sibling in proof:
+        node = _hash_pair(node, sibling)
+    return node == root
+
+
+class MerkleBatchRecorder:
+
+    def __init__(self, database=None, max_leaves: int = MAX_LEAVES):
+        self.database = database or db
+        self.max_leaves = max_leaves
+
+    async def _store_batch(self, session, entries) -> Dict:
+        now = datetime.utcnow()
+        leaves = [(row.id, address, to_units(row.euro_amount, EURO_SCALE),
+                   to_units(row.gold_grams, GRAM_SCALE)) for row, address in entries]
+        hashes = [leaf_hash(*leaf) for leaf in leaves]
+        levels = build_levels(hashes)
+        root = Web3.to_hex(levels[-1][0])
+
+        batch_id = (await session.execute(insert(transformation_batches).values(
+            merkle_root=root, leaf_count=len(leaves), status='pending',
+            created_at=now))).inserted_primary_key[0]
+        await session.execute(insert(transformation_leaves), [
+            {'batch_id': batch_id, 'transformation_id': transformation_id,
+             'leaf_index': index, 'address': address, 'euro_cents': euro_cents,
+             'gold_units': gold_units, 'leaf_hash': Web3.to_hex(hashes[index]),
+             'proof': json.dumps([Web3.to_hex(node) for node in proof_for(levels, index)])}
+            for index, (transformation_id, address, euro_cents, gold_units)
+            in enumerate(leaves)])
+        await session.execute(
+            update(gold_transformations)
+            .where(gold_transformations.c.id.in_([leaf[0] for leaf in leaves]))
+            .values(blockchain_status='batched'))
+        return {'batch_id': batch_id, 'merkle_root': root, 'leaves': len(leaves)}
+
+    async def build_batches(self, addresses: Mapping[int, str],
+                            until: Optional[datetime] = None) -> Dict:
+        """Mette in lotti le trasformazioni approvate create prima di `until`.
+
+        Le trasformazioni di utenti senza indirizzo restano in attesa.
+        """
+        until = until or datetime.utcnow()
+        batches, skipped, after_id = [], 0, 0
+        while True:
+            async with self.database.get_async_session() as session:
+                rows = (await session.execute(
+                    select(gold_transformations.c.id, gold_transformations.c.user_id,
+                           gold_transformations.c.euro_amount, gold_transformations.c.gold_grams)
+                    .where(gold_transformations.c.status.in_(TRANSFORMATION_STATUSES),
+                           gold_transformations.c.blockchain_status == 'pending',
+                           gold_transformations.c.created_at < until,
+                           gold_transformations.c.id > after_id)
+                    .order_by(gold_transformations.c.id)
+                    .limit(self.max_leaves))).all()
+                if not rows:
+                    break
+                after_id = rows[-1].id
+                entries = [(row, addresses[row.user_id]) for row in rows
+                           if addresses.get(row.user_id)]
+                skipped += len(rows) - len(entries)
+                if entries:
+                    batches.append(await self._store_batch(session, entries))
+
+        return {'batches': batches, 'skipped': skipped}
+
+    @staticmethod
+    async def _mark_committed(session, batch_id: int, tx_hash: Optional[str],
+                              block_number: Optional[int], committed_at: datetime) -> None:
+        await session.execute(
+            update(transformation_batches)
+            .where(transformation_batches.c.id == batch_id)
+            .values(status='committed', blockchain_tx_hash=tx_hash,
+                    block_number=block_number, committed_at=committed_at))
+        await session.execute(
+            update(gold_transformations)
+            .where(gold_transformations.c.id.in_(
+                select(transformation_leaves.c.transformation_id)
+                .where(transformation_leaves.c.batch_id == batch_id)))
+            .values(blockchain_status='confirmed', blockchain_tx_hash=tx_hash))
+
+    async def commit_pending(self, blockchain_service) -> Dict:
+        """Pubblica le radici dei lotti non ancora confermati, in pipeline.
+
+        Un lotto fallito o senza ricevuta può avere la radice già registrata
+        (il contratto rifiuta un secondo commit): prima del reinvio si legge
+        transformationRoots e, se valorizzata, il lotto risulta confermato.
+        """
+        async with self.database.get_async_session() as session:
+            pending = (await session.execute(
+                select(transformation_batches.c.id, transformation_batches.c.merkle_root,
+                       transformation_batches.c.leaf_count, transformation_batches.c.status,
+                       transformation_batches.c.blockchain_tx_hash)
+                .where(transformation_batches.c.status.in_(
+                    ('pending', 'failed', 'unconfirmed')))
+                .order_by(transformation_batches.c.id))).all()
+        if not pending:
+            return {'committed': 0, 'failed': 0, 'unconfirmed': 0}
+
+        on_chain: Dict[int, int] = {}
+        unchecked = set()
+        for batch in pending:
+            if batch.status == 'pending':
+                continue
+            try:
+                committed_at = await blockchain_service.transformation_root_committed_at(
+                    Web3.to_bytes(hexstr=batch.merkle_root))
+            except Exception as e:
+                logger.warning(f"Root lookup failed for batch {batch.id}: {e}")
+                unchecked.add(batch.id)
+                continue
+            if committed_at:
+                on_chain[batch.id] = committed_at
+        to_submit = [batch for batch in pending
+                     if batch.id not in on_chain and batch.id not in unchecked]
+
+        futures = []
+        for batch in to_submit:
+            try:
+                futures.append(await blockchain_service.submit_transformation_root(
+                    Web3.to_bytes(hexstr=batch.merkle_root), batch.leaf_count))
+            except Exception as e:
+                logger.error(f"Root submission failed for batch {batch.id}: {e}")
+                failed = asyncio.get_running_loop().create_future()
+                failed.set_result({'status': 'error', 'message': str(e)})
+                futures.append(failed)
+        results = await asyncio.gather(*futures)
+
+        now = datetime.utcnow()
+        committed, unconfirmed = len(on_chain), len(unchecked)
+        async with self.database.get_async_session() as session:
+            for batch in pending:
+                if batch.id in on_chain:
+                    await self._mark_committed(
+                        session, batch.id, batch.blockchain_tx_hash, None,
+                        datetime.utcfromtimestamp(on_chain[batch.id]))
+            for batch, result in zip(to_submit, results):
+                if result.get('status') == RECEIPT_TIMEOUT:
+                    # La radice può essere ancora minata: niente reinvio alla cieca
+                    unconfirmed += 1
+                    await session.execute(
+                        update(transformation_batches)
+                        .where(transformation_batches.c.id == batch.id)
+                        .values(status='unconfirmed',
+                                blockchain_tx_hash=result.get('transaction_hash')))
+                    continue
+                if result.get('status') not in CONFIRMED_STATUSES:
+                    await session.execute(
+                        update(transformation_batches)
+                        .where(transformation_batches.c.id == batch.id)
+                        .values(status='failed'))
+                    continue
+                committed += 1
+                await self._mark_committed(session, batch.id, result.get('transaction_hash'),
+                                           result.get('block_number'), now)
+
+        failed = len(pending) - committed - unconfirmed
+        if on_chain:
+            logger.info(f"Found {len(on_chain)} batch roots already committed on-chain")
+        if failed:
+            logger.warning(f"Root commit failed for {failed} batches")
+        if unconfirmed:
+            logger.warning(f"Root receipt timed out for {unconfirmed} batches")
+        return {'committed': committed, 'failed': failed, 'unconfirmed': unconfirmed}
+
+    async def record(self, blockchain_service, addresses: Mapping[int, str],
+                     until: Optional[datetime] = None) -> Dict:
+        """Chiude la finestra fino a `until` e pubblica le radici in attesa"""
+        try:
+            built = await self.build_batches(addresses, until)
+            committed = await self.commit_pending(blockchain_service)
+            leaves = sum(batch['leaves'] for batch in built['batches'])
+            logger.info(f"Recorded {leaves} transformations in "
+                        f"{len(built['batches'])} Merkle batches")
+            done = not committed['failed'] and not committed['unconfirmed']
+            return {'status': 'success' if done else 'partial',
+                    'batches': built['batches'], 'skipped': built['skipped'], **committed}
+
+        except Exception as e:
+            logger.error(f"Merkle batch recording failed: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    async def get_proof(self, transformation_id: int, user_id: Optional[int] = None) -> Dict:
+        """Prova di inclusione di una trasformazione nella radice del suo lotto"""
+        try:
+            query = (select(transformation_leaves, transformation_batches.c.merkle_root,
+                            transformation_batches.c.status.label('batch_status'),
+                            transformation_batches.c.blockchain_tx_hash,
+                            transformation_batches.c.block_number)
+                     .select_from(transformation_leaves.join(
+                         transformation_batches,
+                         transformation_batches.c.id == transformation_leaves.c.batch_id))
+                     .where(transformation_leaves.c.transformation_id == transformation_id))
+            if user_id is not None:
+                query = query.where(transformation_leaves.c.transformation_id.in_(
+                    select(gold_transformations.c.id)
+                    .where(gold_transformations.c.user_id == user_id)))
+
+            async with self.database.get_async_session() as session:
+                row = (await session.execute(query)).one_or_none()
+            if row is None:
+                return {'status': 'error', 'message': 'Transformation not batched'}
+
+            return {
+                'status': 'success',
+                'transformation_id': transformation_id,
+                'address': row.address,
+                'euro_cents': row.euro_cents,
+                'gold_units': row.gold_units,
+                'leaf': row.leaf_hash,
+                'leaf_index': row.leaf_index,
+                'proof': json.loads(row.proof),
+                'merkle_root': row.merkle_root,
+                'batch_status': row.batch_status,
+                'transaction_hash': row.blockchain_tx_hash,
+                'block_number': row.block_number
+            }
+
+        except Exception as e:
+            logger.error(f"Error reading inclusion proof: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
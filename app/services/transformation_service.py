@@ -4,6 +4,9 @@ from datetime import datetime
 from typing import Dict, Any
 from app.utils.monitoring.gold_metrics import track_distribution_metrics
 from app.core.exceptions import TransformationError
+from app.services.gold import fixed_point
+from app.services.network_volume_service import record_volumes
+from app.services.achievement_engine import achievement_engine
 from app.models import db
 from app.models.models import User, GoldAccount, MoneyAccount, GoldTransformation
 
@@ -47,11 +50,13 @@ class TransformationService:
                 raise TransformationError(f"Amount must be between {self.MIN_AMOUNT} and {self.MAX_AMOUNT} EUR")
 
             fixing_price = await self._get_current_fixing_price()
-            spread = self._calculate_spread(euro_amount)
-            net_amount = euro_amount - spread
 
-            # Calcola grammi oro con precisione standard
-            gold_grams = (net_amount / fixing_price).quantize(Decimal('0.0001'), rounding=ROUND_DOWN)
+            # Spread e grammi oro (0.0001 g, ROUND_DOWN) dal kernel in virgola fissa
+            spread_units, gold_units = fixed_point.scalar(fixed_point.transformation_spread(
+                [fixed_point.to_cents(euro_amount)],
+                fixed_point.price_to_units(fixing_price)))
+            spread = fixed_point.units_to_decimal(spread_units, -5)
+            gold_grams = fixed_point.units_to_decimal(gold_units)
 
             async with self.db.begin():
                 user = await self.db.query(User).get(user_id)
@@ -75,6 +80,7 @@ class TransformationService:
                     status='completed'
                 )
                 self.db.add(transformation)
+                await record_volumes(self.db, [(user_id, euro_amount)], achievement_engine)
 
                 await self.db.commit()
 
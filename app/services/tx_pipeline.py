@@ -0,0 +1,248 @@
+"""Invio pipelined delle transazioni on-chain con nonce gestito in locale.
+
+Il nonce viene letto dal nodo una sola volta e poi assegnato in memoria,
+così più transazioni possono essere firmate e trasmesse senza attendere la
+ricevuta della precedente. Ogni invio restituisce un future che si risolve
+quando un unico task di polling trova la ricevuta. I nonce riservati ma
+mai trasmessi tornano disponibili e vengono riusati per primi; dopo errori
+di nonce o transazioni scartate il gestore si riallinea al nodo e colma i
+buchi rimasti.
+
+I nonce sono di un account: pipeline_for tiene un solo pipeline per
+(processo, indirizzo), condiviso da tutte le istanze che firmano con
+quell'account. Una ricevuta che non arriva entro receipt_timeout risolve
+il future con stato 'timeout': la transazione può ancora essere minata,
+per cui chi la riceve non deve trattarla come fallita né reinviarla alla
+cieca.
+"""
+import asyncio
+import heapq
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import logging
+
+from web3.exceptions import TransactionNotFound
+
+from app.utils.web3_provider import resolve
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GAS = 200000
+NONCE_ERRORS = ('nonce too low', 'already known', 'replacement transaction underpriced')
+RECEIPT_TIMEOUT = 'timeout'
+
+
+def _is_nonce_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in NONCE_ERRORS)
+
+
+class NonceManager:
+
+    def __init__(self, fetch_count: Callable[[], Any]):
+        self._fetch_count = fetch_count
+        self._next: Optional[int] = None
+        self._gaps: List[int] = []
+        self._lock = asyncio.Lock()
+
+    async def reserve(self) -> int:
+        """Prossimo nonce libero, riusando per primi i buchi"""
+        async with self._lock:
+            if self._gaps:
+                return heapq.heappop(self._gaps)
+            if self._next is None:
+                self._next = await resolve(self._fetch_count())
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    async def release(self, nonce: int) -> None:
+        """Nonce riservato ma mai trasmesso: torna disponibile"""
+        async with self._lock:
+            heapq.heappush(self._gaps, nonce)
+
+    async def resync(self, in_flight: Iterable[int] = ()) -> None:
+        """Riallinea al conteggio pending del nodo.
+
+        I nonce tra il valore del nodo e il prossimo locale che non sono in
+        volo (es. transazioni scartate dal mempool) diventano buchi da
+        riusare.
+        """
+        async with self._lock:
+            chain = await resolve(self._fetch_count())
+            local = chain if self._next is None else max(self._next, chain)
+            busy = set(in_flight)
+            gaps = {nonce for nonce in self._gaps if nonce >= chain}
+            gaps.update(nonce for nonce in range(chain, local) if nonce not in busy)
+            self._gaps = sorted(gaps)
+            self._next = local
+            if gaps:
+                logger.warning(f"Nonce resync at {chain}: {len(gaps)} gaps to refill")
+
+
+class InFlight(NamedTuple):
+    nonce: int
+    future: asyncio.Future
+    sent_at: float
+
+
+class TransactionPipeline:
+
+    def __init__(self, web3_client, account, private_key: str, max_in_flight: int = 64,
+                 gas: int = DEFAULT_GAS, max_gas_price: Optional[int] = None,
+                 gas_price_ttl: float = 5.0, poll_interval: float = 1.0,
+                 receipt_timeout: float = 180.0):
+        self.web3_client = web3_client
+        self.account = account
+        self.private_key = private_key
+        self.gas = gas
+        self.max_gas_price = max_gas_price
+        self.gas_price_ttl = gas_price_ttl
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.nonces = NonceManager(
+            lambda: web3_client.eth.get_transaction_count(account.address, 'pending'))
+        self.stats = {'submitted': 0, 'confirmed': 0, 'failed': 0, RECEIPT_TIMEOUT: 0}
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._in_flight: Dict[Any, InFlight] = {}
+        self._gas_price: Optional[int] = None
+        self._gas_price_at = 0.0
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def _current_gas_price(self) -> int:
+        if self._gas_price is None or time.monotonic() - self._gas_price_at > self.gas_price_ttl:
+            price = await resolve(self.web3_client.eth.gas_price)
+            self._gas_price = min(price, self.max_gas_price) if self.max_gas_price else price
+            self._gas_price_at = time.monotonic()
+        return self._gas_price
+
+    async def _broadcast(self, func_call, value: int, retry: bool = True):
+        nonce = await self.nonces.reserve()
+        try:
+            transaction = await resolve(func_call.build_transaction({
+                'from': self.account.address,
+                'nonce': nonce,
+                'gas': self.gas,
+                'gasPrice': await self._current_gas_price(),
+                'value': value
+            }))
+            signed = self.web3_client.eth.account.sign_transaction(transaction, self.private_key)
+            tx_hash = await resolve(self.web3_client.eth.send_raw_transaction(
+                signed.rawTransaction))
+            return tx_hash, nonce
+        except Exception as e:
+            if _is_nonce_error(e):
+                # Il nonce è già usato on-chain: non va rilasciato
+                await self.nonces.resync(entry.nonce for entry in self._in_flight.values())
+                if retry:
+                    return await self._broadcast(func_call, value, retry=False)
+            else:
+                await self.nonces.release(nonce)
+            raise
+
+    async def submit(self, func_call, value: int = 0) -> asyncio.Future:
+        """Firma e trasmette; il future si risolve con il dict di stato della ricevuta.
+
+        Attende solo se ci sono già max_in_flight transazioni in volo.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._slots.acquire()
+        try:
+            tx_hash, nonce = await self._broadcast(func_call, value)
+        except Exception as e:
+            self._slots.release()
+            self.stats['failed'] += 1
+            logger.error(f"Transaction submission failed: {e}")
+            future.set_result({'status': 'error', 'message': str(e)})
+            return future
+
+        self.stats['submitted'] += 1
+        self._in_flight[tx_hash] = InFlight(nonce, future, time.monotonic())
+        # Il registro sopravvive al loop che ha avviato il poller (es. asyncio.run)
+        if (self._poller is None or self._poller.done()
+                or self._poller.get_loop() is not asyncio.get_running_loop()):
+            self._poller = asyncio.create_task(self._poll_receipts())
+        return future
+
+    def _settle(self, tx_hash, result: Dict[str, Any]) -> None:
+        entry = self._in_flight.pop(tx_hash)
+        self._slots.release()
+        if result['status'] == 'completed':
+            self.stats['confirmed'] += 1
+        elif result['status'] == RECEIPT_TIMEOUT:
+            self.stats[RECEIPT_TIMEOUT] += 1
+        else:
+            self.stats['failed'] += 1
+        if not entry.future.done():
+            entry.future.set_result(result)
+
+    async def _poll_receipts(self) -> None:
+        """Risolve le ricevute in ordine di nonce finché ci sono transazioni in volo"""
+        while self._in_flight:
+            await asyncio.sleep(self.poll_interval)
+            dropped = False
+            for tx_hash, entry in sorted(self._in_flight.items(), key=lambda item: item[1].nonce):
+                try:
+                    receipt = await resolve(self.web3_client.eth.get_transaction_receipt(tx_hash))
+                except TransactionNotFound:
+                    receipt = None
+                except Exception as e:
+                    logger.warning(f"Receipt lookup failed: {e}")
+                    break
+
+                if receipt is None:
+                    if time.monotonic() - entry.sent_at > self.receipt_timeout:
+                        # Esito ignoto, non un fallimento: può ancora essere minata
+                        self._settle(tx_hash, {'status': RECEIPT_TIMEOUT,
+                                               'message': 'Receipt timeout',
+                                               'transaction_hash': _hex(tx_hash)})
+                        dropped = True
+                        continue
+                    # Le successive dello stesso mittente non possono essere già minate
+                    break
+
+                if receipt.status != 1:
+                    self._settle(tx_hash, {'status': 'error', 'message': 'Transaction failed',
+                                           'transaction_hash': _hex(receipt.transactionHash),
+                                           'block_number': receipt.blockNumber})
+                else:
+                    self._settle(tx_hash, {'status': 'completed',
+                                           'transaction_hash': _hex(receipt.transactionHash),
+                                           'block_number': receipt.blockNumber})
+            if dropped:
+                await self.nonces.resync(entry.nonce for entry in self._in_flight.values())
+
+    async def drain(self) -> None:
+        """Attende la risoluzione di tutte le transazioni in volo"""
+        futures = [entry.future for entry in self._in_flight.values()]
+        if futures:
+            await asyncio.gather(*futures)
+
+    async def close(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+
+_pipelines: Dict[Tuple[int, str], TransactionPipeline] = {}
+
+
+def pipeline_for(web3_client, account, private_key: str, **options) -> TransactionPipeline:
+    """Pipeline condiviso dell'account in questo processo, creato al primo uso"""
+    pid = os.getpid()
+    for key in [key for key in _pipelines if key[0] != pid]:
+        # Ereditati dal processo padre dopo un fork: nonce e ricevute non sono nostri
+        del _pipelines[key]
+    key = (pid, account.address)
+    if key not in _pipelines:
+        _pipelines[key] = TransactionPipeline(web3_client, account, private_key, **options)
+    return _pipelines[key]
+
+
+def _hex(value) -> str:
+    return value.hex() if hasattr(value, 'hex') else str(value)
@@ -1,81 +1,146 @@
-
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import logging
+from sqlalchemy import case, select, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
 from app.database import db
-from app.models.weekly_amount import WeeklyAmount
+from app.models.weekly_amount import WeeklyAmount, WeeklyUserTotal
 from app.utils.audit_logger import audit_logger
 
+logger = logging.getLogger(__name__)
+
+weekly_amounts = WeeklyAmount.__table__
+weekly_totals = WeeklyUserTotal.__table__
+
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def week_bounds(moment: datetime) -> Tuple[datetime, datetime]:
+    """Inizio (lunedì 00:00) e fine (domenica 23:59:59) della settimana"""
+    week_start = datetime(moment.year, moment.month, moment.day) - timedelta(days=moment.weekday())
+    return week_start, week_start + timedelta(days=7, microseconds=-1)
+
+
+def _upsert_total(dialect_name: str, user_id: int, amount: Decimal,
+                  week_start: datetime, week_end: datetime, now: datetime):
+    """INSERT ... ON CONFLICT che somma il versamento al totale della settimana.
+
+    Su una settimana già elaborata il totale riparte dal nuovo versamento:
+    la parte elaborata è già stata convertita.
+    """
+    statement = UPSERT_DIALECTS[dialect_name](weekly_totals).values(
+        user_id=user_id, week_start=week_start, week_end=week_end,
+        total=amount, deposits=1, processed=False, updated_at=now)
+    pending = weekly_totals.c.processed.is_(False)
+    return statement.on_conflict_do_update(
+        index_elements=[weekly_totals.c.user_id, weekly_totals.c.week_start],
+        set_={'total': case((pending, weekly_totals.c.total + statement.excluded.total),
+                            else_=statement.excluded.total),
+              'deposits': case((pending, weekly_totals.c.deposits + 1), else_=1),
+              'processed': False,
+              'updated_at': statement.excluded.updated_at})
+
+
+def _mark_processed(*conditions):
+    return (update(weekly_totals)
+            .where(weekly_totals.c.processed.is_(False), *conditions)
+            .values(processed=True, updated_at=datetime.utcnow()))
+
+
+async def mark_weeks_processed(session, now: datetime) -> int:
+    """Segna elaborati i versamenti registrati fino a `now`, settimana in corso inclusa.
+
+    Va chiamato nella sessione che converte i saldi: il job converte
+    l'intero saldo, quindi anche i versamenti della settimana in corso.
+    Aggiorna sia weekly_amounts sia weekly_user_totals; restituisce i
+    totali chiusi.
+    """
+    await session.execute(
+        update(weekly_amounts)
+        .where(weekly_amounts.c.processed.is_(False), weekly_amounts.c.created_at <= now)
+        .values(processed=True))
+    result = await session.execute(
+        _mark_processed(weekly_totals.c.week_start <= week_bounds(now)[0]))
+    return result.rowcount
+
+
 class WeeklyAmountService:
+    """Versamenti settimanali con totale per utente mantenuto a ogni scrittura.
+
+    weekly_amounts conserva ogni versamento; weekly_user_totals ha una riga
+    per utente e settimana aggiornata nella stessa transazione, così letture
+    dei totali e job settimanale non riaggregano i versamenti.
+    """
+
     @staticmethod
-    async def record_amount(user_id: int, amount: Decimal) -> Dict:
+    async def record_amount(user_id: int, amount: Decimal, database=None) -> Dict:
         """Record a new weekly amount"""
+        database = database or db
         try:
             now = datetime.utcnow()
-            week_start = now - timedelta(days=now.weekday())
-            week_end = week_start + timedelta(days=6)
-            
-            existing = await WeeklyAmount.query.filter(
-                WeeklyAmount.user_id == user_id,
-                WeeklyAmount.week_start <= now,
-                WeeklyAmount.week_end >= now
-            ).first()
-            
-            if existing:
-                existing.amount += amount
-                await db.session.commit()
-                entry_id = existing.id
-            else:
-                entry = WeeklyAmount(
-                    user_id=user_id,
-                    amount=amount,
-                    week_start=week_start,
-                    week_end=week_end
-                )
-                db.session.add(entry)
-                await db.session.commit()
-                entry_id = entry.id
-            
-            audit_logger.info(f"Recorded weekly amount {amount} for user {user_id}")
+            week_start, week_end = week_bounds(now)
+
+            async with database.get_async_session() as session:
+                result = await session.execute(
+                    insert(weekly_amounts).values(
+                        user_id=user_id, amount=amount, week_start=week_start,
+                        week_end=week_end, processed=False, created_at=now))
+                await session.execute(_upsert_total(
+                    session.bind.dialect.name, user_id, amount,
+                    week_start, week_end, now))
+                entry_id = result.inserted_primary_key[0]
+
+            audit_logger.log_action('weekly_amount', user_id,
+                                    f"Recorded weekly amount {amount}")
             return {"status": "success", "entry_id": entry_id}
 
         except Exception as e:
-            await db.session.rollback()
-            audit_logger.error(f"Failed to record weekly amount: {str(e)}")
+            logger.error(f"Failed to record weekly amount: {str(e)}")
             return {"status": "error", "message": str(e)}
 
     @staticmethod
-    async def get_user_weekly_total(user_id: int) -> Optional[Decimal]:
+    async def get_user_weekly_total(user_id: int, database=None) -> Optional[Decimal]:
         """Get total amount for current week"""
+        database = database or db
         try:
-            now = datetime.utcnow()
-            amount = await WeeklyAmount.query.filter(
-                WeeklyAmount.user_id == user_id,
-                WeeklyAmount.week_start <= now,
-                WeeklyAmount.week_end >= now
-            ).with_entities(WeeklyAmount.amount).scalar()
-            
-            return amount or Decimal('0')
+            week_start, _ = week_bounds(datetime.utcnow())
+            async with database.get_async_session() as session:
+                amount = (await session.execute(
+                    select(weekly_totals.c.total).where(
+                        weekly_totals.c.user_id == user_id,
+                        weekly_totals.c.week_start == week_start))).scalar()
+
+            return Decimal(str(amount)) if amount is not None else Decimal('0')
         except Exception as e:
-            audit_logger.error(f"Error getting weekly total: {str(e)}")
+            logger.error(f"Error getting weekly total: {str(e)}")
             return None
 
     @staticmethod
-    async def get_pending_amounts() -> List[WeeklyAmount]:
-        """Get all unprocessed weekly amounts"""
-        return await WeeklyAmount.query.filter_by(processed=False).all()
+    async def get_pending_amounts(week_start: Optional[datetime] = None,
+                                  database=None) -> List[Dict]:
+        """Totali non elaborati, una riga per utente e settimana"""
+        database = database or db
+        query = (select(weekly_totals.c.user_id, weekly_totals.c.week_start,
+                        weekly_totals.c.total, weekly_totals.c.deposits)
+                 .where(weekly_totals.c.processed.is_(False))
+                 .order_by(weekly_totals.c.week_start, weekly_totals.c.user_id))
+        if week_start is not None:
+            query = query.where(weekly_totals.c.week_start == week_start)
+
+        async with database.get_async_session() as session:
+            rows = (await session.execute(query)).all()
+        return [row._asdict() for row in rows]
 
     @staticmethod
-    async def mark_as_processed(entry_id: int) -> bool:
-        """Mark a weekly amount as processed"""
+    async def mark_as_processed(week_start: datetime, database=None) -> int:
+        """Segna come elaborata un'intera settimana; restituisce le righe aggiornate"""
+        database = database or db
         try:
-            entry = await WeeklyAmount.query.get(entry_id)
-            if entry:
-                entry.processed = True
-                await db.session.commit()
-                return True
-            return False
+            async with database.get_async_session() as session:
+                result = await session.execute(_mark_processed(
+                    weekly_totals.c.week_start == week_bounds(week_start)[0]))
+            return result.rowcount
         except Exception as e:
-            await db.session.rollback()
-            audit_logger.error(f"Error marking amount as processed: {str(e)}")
-            return False
+            logger.error(f"Error marking week as processed: {str(e)}")
+            return 0
@@ -3,70 +3,74 @@ import logging
 from datetime import datetime
 from typing import Dict
 from app.database import db
-from app.models.models import User, EuroAccount, GoldAccount, GoldTransformation
+from app.services.gold import fixed_point
+from app.services.gold.weekly_distribution import ELIGIBLE_BALANCES, CREDIT_GOLD, DEBIT_EURO
+from app.services.config_cache import config_cache
+from app.services.ledger_writer import LedgerWriter
+from app.services.network_volume_service import record_volumes
+from app.services.achievement_engine import achievement_engine
+from app.services.weekly_amount_service import mark_weeks_processed
 from app.utils.monitoring.performance_monitor import system_performance_monitor
 
 logger = logging.getLogger(__name__)
 
 @system_performance_monitor.track_time('transformation_service')
 class WeeklyProcessor:
-    def __init__(self):
+    def __init__(self, database=None):
+        self.database = database or db
+        self.ledger = LedgerWriter('gold_transformations')
         self.structure_fee = Decimal('0.05')  # 5%
-        self.referral_rates = {
-            1: Decimal('0.007'),  # Livello 1: 0.7%
-            2: Decimal('0.005'),  # Livello 2: 0.5%
-            3: Decimal('0.005')   # Livello 3: 0.5%
-        }
         self.max_referral_level = 3
 
+    @property
+    def referral_rates(self) -> Dict[int, Decimal]:
+        """Percentuali referral per livello, dallo snapshot di configurazione"""
+        return dict(config_cache.bonus_rates)
+
     @system_performance_monitor.track_time('weekly_processing')
     async def process_weekly_transformations(self, fixing_price: Decimal) -> Dict:
         try:
-            from app.services.weekly_amount_service import WeeklyAmountService
-
-            processed_count = 0
-            total_gold = Decimal('0')
-            weekly_amounts = await WeeklyAmountService.get_pending_amounts()
-
-            async with db.session.begin():
-                users = await User.query.join(EuroAccount).filter(
-                    EuroAccount.balance > 0
-                ).all()
-
-                for user in users:
-                    euro_amount = user.money_account.balance
-                    gold_grams = (euro_amount / fixing_price).quantize(Decimal('0.01'))
-                    if gold_grams * 100 != int(gold_grams * 100):
-                        raise ValueError("La quantità di oro deve essere in centesimi di grammo pieni")
-                    net_gold_grams = (gold_grams * (1 - self.structure_fee)).quantize(Decimal('0.01'))
-                    if net_gold_grams * 100 != int(net_gold_grams * 100):
-                        raise ValueError("La quantità netta di oro deve essere in centesimi di grammo pieni")
-
-                    # Create transformation record
-                    transformation = GoldTransformation(
-                        user_id=user.id,
-                        euro_amount=euro_amount,
-                        gold_grams=gold_grams,
-                        fixing_price=fixing_price,
-                        fee_amount=euro_amount * self.structure_fee,
-                        status='verified',
-                        transaction_type='weekly'
-                    )
-
-                    # Update accounts
-                    user.euro_account.balance = Decimal('0')
-                    user.gold_account.balance += gold_grams
-                    user.gold_account.last_update = datetime.utcnow()
-
-                    db.session.add(transformation)
-                    processed_count += 1
-                    total_gold += gold_grams
-
-                await db.session.commit()
+            await config_cache.ensure_fresh(self.database)
+            now = datetime.utcnow()
+
+            async with self.database.get_async_session() as session:
+                accounts = (await session.execute(ELIGIBLE_BALANCES)).all()
+
+                # Conversione vettoriale di tutti i saldi in centesimi di grammo
+                result = fixed_point.weekly_transformation(
+                    [fixed_point.to_cents(balance) for _, balance in accounts],
+                    fixed_point.price_to_units(fixing_price))
+
+                gold_params = []
+                euro_params = []
+                transformations = []
+                for i, (user_id, euro_amount) in enumerate(accounts):
+                    gold_grams = fixed_point.units_to_decimal(result.gold[i])
+                    gold_params.append({'gold': gold_grams, 'user_id': user_id})
+                    euro_params.append({'euro': euro_amount, 'user_id': user_id})
+                    transformations.append({
+                        'user_id': user_id,
+                        'euro_amount': euro_amount,
+                        'gold_grams': gold_grams,
+                        'fixing_price': fixing_price,
+                        'status': 'verified',
+                        'created_at': now
+                    })
+
+                if accounts:
+                    await session.execute(CREDIT_GOLD, gold_params)
+                    await session.execute(DEBIT_EURO, euro_params)
+                    await self.ledger.write(session, transformations)
+                    await record_volumes(session, accounts, achievement_engine)
+                weeks_processed = await mark_weeks_processed(session, now)
+
+            processed_count = len(accounts)
+            total_gold = fixed_point.units_to_decimal(result.gold.sum())
 
             return {
                 'status': 'success',
                 'processed_users': processed_count,
+                'weekly_totals_processed': weeks_processed,
                 'total_gold_grams': float(total_gold),
                 'fixing_price': float(fixing_price),
                 'timestamp': datetime.utcnow().isoformat()
@@ -74,8 +78,6 @@ class WeeklyProcessor:
 
         except Exception as e:
             logger.error(f"Weekly transformation processing failed: {str(e)}")
-            if 'db.session' in locals():
-                await db.session.rollback()
             return {
                 'status': 'error',
                 'message': str(e),
@@ -8,7 +8,10 @@ from app.utils.monitoring.performance_monitor import init_performance_monitor
 from app.utils.logging_config import logger
 from app.models import db
 from app.models.models import Transaction
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
+from app.utils.web3_provider import create_web3, install_pooled_session, resolve
+from app.utils.monitoring.receipt_reconciler import (COMPLETED, FAILED, PENDING,
+                                                     ReceiptReconciler)
 from dataclasses import dataclass
 
 @dataclass
@@ -75,7 +78,8 @@ class BlockchainMonitor:
 
 class BlockchainMetricsCollector:
     def __init__(self, web3_provider, metrics):
-        self.w3 = web3_provider if isinstance(web3_provider, Web3) else Web3(Web3.HTTPProvider(web3_provider))
+        # Client già pronto oppure URL: il provider (sync/async) segue WEB3_PROVIDER
+        self.w3 = web3_provider if isinstance(web3_provider, (Web3, AsyncWeb3)) else create_web3(web3_provider)
         self.last_block = 0
         self.pending_transactions: Dict[str, datetime] = {}
         self.event_handlers = {}
@@ -90,9 +94,11 @@ class BlockchainMetricsCollector:
             'monthly_blockchain_performance': {}
         }
         self.blockchain_monitor = BlockchainMonitor()
+        self.reconciler = None
 
     async def start_blockchain_monitoring(self):
         """Starts the standardized blockchain monitoring process"""
+        await install_pooled_session(self.w3)
         while True:
             try:
                 await self._monitor_blockchain_transactions()
@@ -104,12 +110,12 @@ class BlockchainMetricsCollector:
 
     async def _monitor_blockchain_transactions(self):
         """Monitors blockchain transactions using the standard protocol"""
-        current_block = self.w3.eth.block_number
+        current_block = await resolve(self.w3.eth.block_number)
         if current_block <= self.last_block:
             return
 
         for block_number in range(self.last_block + 1, current_block + 1):
-            block = self.w3.eth.get_block(block_number, full_transactions=True)
+            block = await resolve(self.w3.eth.get_block(block_number, full_transactions=True))
             for tx in block.transactions:
                 await self._process_blockchain_transaction(tx)
 
@@ -132,15 +138,15 @@ class BlockchainMetricsCollector:
         """Processes a single blockchain transaction"""
         try:
             transaction = Transaction.query.filter_by(blockchain_tx=tx['hash'].hex()).first()
-            if transaction and transaction.status == 'PENDING':
-                receipt = self.w3.eth.get_transaction_receipt(tx['hash'])
+            if transaction and transaction.status == PENDING:
+                receipt = await resolve(self.w3.eth.get_transaction_receipt(tx['hash']))
                 if receipt['status'] == 1:  # Success
-                    transaction.status = 'COMPLETED'
+                    transaction.status = COMPLETED
                     transaction.confirmed_at = datetime.utcnow()
                     db.session.commit()
                     logger.info(f"Transaction {tx['hash'].hex()} confirmed")
                 else:
-                    transaction.status = 'FAILED'
+                    transaction.status = FAILED
                     db.session.commit()
                     logger.error(f"Transaction {tx['hash'].hex()} failed")
                     await self.blockchain_monitor.record_error('transaction_error')
@@ -151,29 +157,28 @@ class BlockchainMetricsCollector:
 
     async def _validate_pending_transactions(self):
         """Checks the status of pending transactions"""
-        timeout = datetime.utcnow() - timedelta(minutes=30)
-        pending_transactions = Transaction.query.filter_by(status='PENDING')\
-                                     .filter(Transaction.created_at < timeout)\
-                                     .all()
+        if self.reconciler is None:
+            self.reconciler = ReceiptReconciler(self.w3.provider.endpoint_uri)
+        result = await self.reconciler.run()
+        if result['status'] != 'success':
+            await self.blockchain_monitor.record_error('verification_error')
+            return
 
-        for tx in pending_transactions:
-            try:
-                receipt = self.w3.eth.get_transaction_receipt(tx.blockchain_tx)
-                if receipt:
-                    tx.status = 'COMPLETED' if receipt['status'] == 1 else 'FAILED'
-                    tx.confirmed_at = datetime.utcnow()
-                    db.session.commit()
-            except Exception as e:
-                logger.error(f"Error verifying transaction {tx.blockchain_tx}: {str(e)}")
-                await self.blockchain_monitor.record_error('verification_error')
+        self.metrics['daily_blockchain_performance'].update({
+            'pending_checked': result['checked'],
+            'pending_confirmed': result['completed'] + result['failed'],
+            'pending_checked_per_second': self.reconciler.metrics['last_rate']
+        })
+        if result['rpc_errors']:
+            await self.blockchain_monitor.record_error('verification_error')
 
 
     async def validate_blockchain_transaction(self, tx_hash: str) -> Dict[str, Any]:
         """Validates the blockchain transaction with standard metrics"""
         try:
-            receipt = await self.w3.eth.get_transaction_receipt(tx_hash)
+            receipt = await resolve(self.w3.eth.get_transaction_receipt(tx_hash))
             block_number = receipt.get('blockNumber', 0)
-            confirmations = self.w3.eth.block_number - block_number if block_number else 0
+            confirmations = await resolve(self.w3.eth.block_number) - block_number if block_number else 0
 
             return {
                 'transaction_status': 'success' if receipt.get('status') == 1 else 'failed',
@@ -187,13 +192,13 @@ class BlockchainMetricsCollector:
 
     async def validate_gas_price(self) -> bool:
         """Validates if current gas price is within acceptable range"""
-        gas_price = self.w3.eth.gas_price
+        gas_price = await resolve(self.w3.eth.gas_price)
         return 0 <= gas_price <= self.alert_thresholds['gas_price_max_gwei'] * 1e9
 
     async def process_block_transactions(self, block_number: int) -> Dict[str, Any]:
         """Process transactions from a specific block"""
         try:
-            block = await self.w3.eth.get_block(block_number)
+            block = await resolve(self.w3.eth.get_block(block_number))
             return {
                 'status': 'success',
                 'transactions': block.get('transactions', []),
@@ -206,8 +211,8 @@ class BlockchainMetricsCollector:
     async def monitor_blockchain_transactions(self):
         """Monitors blockchain transactions with improved error handling"""
         try:
-            last_block = await self.w3.eth.block_number
-            pending_count = len(await self.w3.eth.get_block('pending')['transactions'])
+            last_block = await resolve(self.w3.eth.block_number)
+            pending_count = len((await resolve(self.w3.eth.get_block('pending')))['transactions'])
             return last_block, pending_count
         except Exception as e:
             logger.error(f"Blockchain monitoring error: {str(e)}")
@@ -226,7 +231,7 @@ class BlockchainMetricsCollector:
     async def check_block_updates(self) -> Dict[str, Any]:
         """Check for new blocks with standardized response"""
         try:
-            current_block = self.w3.eth.block_number
+            current_block = await resolve(self.w3.eth.block_number)
             has_updates = current_block > self.last_processed_block
             return {
                 'has_updates': has_updates,
@@ -353,9 +358,9 @@ class ValidatoreBlockchain:
 
 async def verify_transaction(self, tx_hash: str) -> Dict[str, Any]:
     try:
-        receipt = await self.w3.eth.get_transaction_receipt(tx_hash)
+        receipt = await resolve(self.w3.eth.get_transaction_receipt(tx_hash))
         block_number = receipt.get('blockNumber', 0)
-        confirmations = self.w3.eth.block_number - block_number if block_number else 0
+        confirmations = await resolve(self.w3.eth.block_number) - block_number if block_number else 0
 
         return {
             'transaction_status': 'success' if receipt.get('status') == 1 else 'failed',
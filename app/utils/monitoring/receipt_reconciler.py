@@ -0,0 +1,134 @@
+"""Riconciliazione delle transazioni pending con le ricevute on-chain.
+
+Le transazioni rimaste pending oltre stale_after vengono lette a pagine
+con paginazione keyset su (status, id). Le ricevute di una pagina sono
+chieste in richieste JSON-RPC batch da batch_size hash, al più
+max_concurrency in volo. Gli esiti vengono scritti con un solo UPDATE per
+pagina. Le transazioni senza ricevuta, o la cui lettura è fallita,
+restano pending per il giro successivo.
+
+Gli stati sono quelli scritti da chi crea le transazioni (default del
+modello e BatchCollectionService), in minuscolo.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+import logging
+
+from sqlalchemy import case, select, update
+
+from app.database import db
+from app.models.models import Transaction
+from app.utils.web3_provider import rpc_batch
+
+logger = logging.getLogger(__name__)
+
+transactions = Transaction.__table__
+
+PENDING = 'pending'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class ReceiptReconciler:
+
+    def __init__(self, endpoint: str, database=None,
+                 stale_after: timedelta = timedelta(minutes=30), page_size: int = 1000,
+                 batch_size: int = 100, max_concurrency: int = 8, timeout: int = 30):
+        self.endpoint = endpoint
+        self.database = database or db
+        self.stale_after = stale_after
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.metrics = {'runs': 0, 'checked': 0, 'completed': 0, 'failed': 0,
+                        'rpc_batches': 0, 'rpc_errors': 0,
+                        'last_run_seconds': 0.0, 'last_rate': 0.0}
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def _fetch_batch(self, hashes: Sequence[str]) -> List:
+        async with self._slots:
+            try:
+                results = await rpc_batch(
+                    self.endpoint,
+                    [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in hashes],
+                    self.timeout)
+            except Exception as e:
+                logger.warning(f"Receipt batch of {len(hashes)} failed: {e}")
+                results = [e] * len(hashes)
+        self.metrics['rpc_batches'] += 1
+        self.metrics['rpc_errors'] += sum(isinstance(result, Exception) for result in results)
+        return results
+
+    async def _fetch_receipts(self, hashes: Sequence[str]) -> List:
+        """Ricevute nell'ordine di `hashes`: dict, None se assente, eccezione se fallita"""
+        batches = [hashes[i:i + self.batch_size] for i in range(0, len(hashes), self.batch_size)]
+        results = await asyncio.gather(*(self._fetch_batch(batch) for batch in batches))
+        return [receipt for batch in results for receipt in batch]
+
+    async def _settle_page(self, completed: List[int], failed: List[int], now: datetime) -> None:
+        async with self.database.get_async_session() as session:
+            await session.execute(
+                update(transactions)
+                .where(transactions.c.id.in_(completed + failed),
+                       transactions.c.status == PENDING)
+                .values(status=case((transactions.c.id.in_(completed), COMPLETED),
+                                    else_=FAILED),
+                        confirmed_at=now))
+
+    async def run(self, now: Optional[datetime] = None) -> Dict:
+        """Un giro completo sulle transazioni pending più vecchie di stale_after"""
+        now = now or datetime.utcnow()
+        cutoff = now - self.stale_after
+        started = time.perf_counter()
+        checked = completed_total = failed_total = 0
+        errors_before = self.metrics['rpc_errors']
+        after_id = 0
+        try:
+            while True:
+                async with self.database.get_async_session() as session:
+                    rows = (await session.execute(
+                        select(transactions.c.id, transactions.c.blockchain_tx)
+                        .where(transactions.c.status == PENDING,
+                               transactions.c.id > after_id,
+                               transactions.c.date < cutoff,
+                               transactions.c.blockchain_tx.isnot(None))
+                        .order_by(transactions.c.id)
+                        .limit(self.page_size))).all()
+                if not rows:
+                    break
+                after_id = rows[-1].id
+
+                receipts = await self._fetch_receipts([row.blockchain_tx for row in rows])
+                completed, failed = [], []
+                for row, receipt in zip(rows, receipts):
+                    if isinstance(receipt, dict):
+                        (completed if int(receipt.get('status') or '0x0', 16) == 1
+                         else failed).append(row.id)
+                if completed or failed:
+                    await self._settle_page(completed, failed, now)
+
+                checked += len(rows)
+                completed_total += len(completed)
+                failed_total += len(failed)
+
+            seconds = time.perf_counter() - started
+            self.metrics['runs'] += 1
+            self.metrics['checked'] += checked
+            self.metrics['completed'] += completed_total
+            self.metrics['failed'] += failed_total
+            self.metrics['last_run_seconds'] = round(seconds, 3)
+            self.metrics['last_rate'] = round(checked / max(seconds, 1e-9), 1)
+            if checked:
+                logger.info(f"Reconciled {checked} pending transactions in {seconds:.1f}s: "
+                            f"{completed_total} completed, {failed_total} failed")
+            return {'status': 'success', 'checked': checked, 'completed': completed_total,
+                    'failed': failed_total,
+                    'still_pending': checked - completed_total - failed_total,
+                    'rpc_errors': self.metrics['rpc_errors'] - errors_before,
+                    'seconds': round(seconds, 3)}
+
+        except Exception as e:
+            logger.error(f"Receipt reconciliation failed: {str(e)}")
+            return {'status': 'error', 'message': str(e), 'checked': checked}
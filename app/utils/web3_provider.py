@@ -0,0 +1,121 @@
+"""Client Web3 sincrono o asincrono, scelto da configurazione.
+
+WEB3_PROVIDER=sync (default) usa Web3.HTTPProvider come finora: ogni RPC
+blocca il loop asyncio del chiamante. WEB3_PROVIDER=async usa AsyncWeb3 con
+AsyncHTTPProvider su una sessione aiohttp keep-alive condivisa per endpoint
+(WEB3_POOL_SIZE connessioni), così più coroutine possono avere richieste in
+volo insieme. I servizi passano ogni risultato RPC da resolve(), che
+attende solo quando il client è asincrono: la stessa API funziona con
+entrambi i provider. rpc_batch invia più chiamate in un'unica richiesta
+JSON-RPC batch sulla stessa sessione, qualunque sia il provider.
+"""
+import asyncio
+import inspect
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+import aiohttp
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_SYNC = 'sync'
+PROVIDER_ASYNC = 'async'
+PROVIDERS = (PROVIDER_SYNC, PROVIDER_ASYNC)
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_POOL_SIZE = 100
+KEEPALIVE_SECONDS = 30
+
+# Sessioni condivise per (loop, endpoint): una sessione aiohttp vive in un solo loop
+_sessions: Dict[Tuple[int, str], aiohttp.ClientSession] = {}
+
+
+def provider_mode() -> str:
+    mode = os.getenv('WEB3_PROVIDER', PROVIDER_SYNC).lower()
+    if mode not in PROVIDERS:
+        raise ValueError(f"Unknown WEB3_PROVIDER: {mode}")
+    return mode
+
+
+def is_async(client) -> bool:
+    return isinstance(client, AsyncWeb3)
+
+
+async def resolve(value):
+    """Attende `value` se è awaitable (provider async), altrimenti lo restituisce"""
+    return await value if inspect.isawaitable(value) else value
+
+
+def create_web3(endpoint: str, mode: Optional[str] = None, timeout: int = DEFAULT_TIMEOUT):
+    """Client per `endpoint`; in modalità async va poi chiamato install_pooled_session"""
+    mode = mode or provider_mode()
+    if mode == PROVIDER_ASYNC:
+        return AsyncWeb3(AsyncHTTPProvider(
+            endpoint, request_kwargs={'timeout': aiohttp.ClientTimeout(total=timeout)}))
+    return Web3(Web3.HTTPProvider(endpoint, request_kwargs={'timeout': timeout,
+                                                           'verify': True}))
+
+
+class RPCBatchError(Exception):
+    pass
+
+
+def pooled_session(endpoint: str, pool_size: Optional[int] = None) -> aiohttp.ClientSession:
+    """Sessione keep-alive condivisa per `endpoint` nel loop corrente"""
+    key = (id(asyncio.get_running_loop()), endpoint)
+    session = _sessions.get(key)
+    if session is None or session.closed:
+        limit = pool_size or int(os.getenv('WEB3_POOL_SIZE', DEFAULT_POOL_SIZE))
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+            limit=limit, limit_per_host=limit, keepalive_timeout=KEEPALIVE_SECONDS))
+        _sessions[key] = session
+        logger.info(f"Pooled RPC session for {endpoint} ({limit} connections)")
+    return session
+
+
+async def install_pooled_session(client, pool_size: Optional[int] = None) -> None:
+    """Usa per il provider async la sessione keep-alive condivisa del suo endpoint"""
+    if not is_async(client):
+        return
+    await client.provider.cache_async_session(
+        pooled_session(client.provider.endpoint_uri, pool_size))
+
+
+async def rpc_batch(endpoint: str, calls: Sequence[Tuple[str, List]],
+                    timeout: int = DEFAULT_TIMEOUT) -> List[Any]:
+    """Invia `calls` (metodo, parametri) come un'unica richiesta JSON-RPC batch.
+
+    Restituisce, nell'ordine delle chiamate, il risultato grezzo oppure un
+    RPCBatchError per le chiamate fallite; solleva RPCBatchError se il nodo
+    rifiuta l'intero batch.
+    """
+    payload = [{'jsonrpc': '2.0', 'id': index, 'method': method, 'params': params}
+               for index, (method, params) in enumerate(calls)]
+    async with pooled_session(endpoint).post(
+            endpoint, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        response.raise_for_status()
+        replies = await response.json(content_type=None)
+    if not isinstance(replies, list):
+        error = replies.get('error') if isinstance(replies, dict) else replies
+        raise RPCBatchError(f"Batch rejected: {error}")
+
+    by_id = {reply.get('id'): reply for reply in replies}
+    results = []
+    for index in range(len(calls)):
+        reply = by_id.get(index)
+        if reply is None:
+            results.append(RPCBatchError('Missing reply'))
+        elif reply.get('error'):
+            results.append(RPCBatchError(reply['error'].get('message', str(reply['error']))))
+        else:
+            results.append(reply.get('result'))
+    return results
+
+
+async def close_pooled_sessions() -> None:
+    """Chiude le sessioni create nel loop corrente"""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [key for key in _sessions if key[0] == loop_id]:
+        await _sessions.pop(key).close()
@@ -6,6 +6,7 @@ import "@openzeppelin/contracts/token/ERC20/IERC20.sol";
 import "@openzeppelin/contracts/access/AccessControl.sol";
 import "@openzeppelin/contracts/security/Pausable.sol";
 import "@openzeppelin/contracts/security/ReentrancyGuard.sol";
+import "@openzeppelin/contracts/utils/cryptography/MerkleProof.sol";
 
 contract GoldSystem is AccessControl, Pausable, ReentrancyGuard {
     bytes32 public constant OPERATOR_ROLE = keccak256("OPERATOR_ROLE");
@@ -27,10 +28,13 @@ contract GoldSystem is AccessControl, Pausable, ReentrancyGuard {
     mapping(address => Noble) public nobles;
     mapping(address => GoldTransaction[]) private transactions;
     mapping(address => uint256) public goldBalances;
+    // Radice Merkle di un lotto di trasformazioni => timestamp di pubblicazione
+    mapping(bytes32 => uint256) public transformationRoots;
     
     uint256 public constant MINIMUM_INVESTMENT = 1000 ether;
     uint256 public constant MAX_TRANSACTION_AMOUNT = 1000000 ether;
     
+    event TransformationRootCommitted(bytes32 indexed root, uint256 leafCount, uint256 timestamp);
     event NobleRankUpdated(address indexed user, string newRank, uint256 timestamp);
     event GoldTransactionExecuted(
         address indexed user,
@@ -83,6 +87,32 @@ contract GoldSystem is AccessControl, Pausable, ReentrancyGuard {
         );
     }
     
+    function commitTransformationRoot(
+        bytes32 root,
+        uint256 leafCount
+    ) external onlyRole(OPERATOR_ROLE) whenNotPaused {
+        require(root != bytes32(0), "Empty root");
+        require(leafCount > 0, "Empty batch");
+        require(transformationRoots[root] == 0, "Root already committed");
+
+        transformationRoots[root] = block.timestamp;
+        emit TransformationRootCommitted(root, leafCount, block.timestamp);
+    }
+
+    function verifyTransformation(
+        bytes32 root,
+        uint256 transformationId,
+        address user,
+        uint256 euroCents,
+        uint256 goldUnits,
+        bytes32[] calldata proof
+    ) external view returns (bool) {
+        require(transformationRoots[root] > 0, "Unknown root");
+        bytes32 leaf = keccak256(bytes.concat(keccak256(
+            abi.encode(transformationId, user, euroCents, goldUnits))));
+        return MerkleProof.verify(proof, root, leaf);
+    }
+
     function updateNobleRank(
         address user,
         string calldata newRank,
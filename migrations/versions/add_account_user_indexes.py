@@ -0,0 +1,22 @@
+"""add user_id indexes on money and gold accounts
+
+Revision ID: add_account_user_indexes
+Revises: create_notifications_table
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_account_user_indexes'
+down_revision = 'create_notifications_table'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index(op.f('ix_money_accounts_user_id'), 'money_accounts', ['user_id'], unique=False)
+    op.create_index(op.f('ix_gold_accounts_user_id'), 'gold_accounts', ['user_id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_gold_accounts_user_id'), table_name='gold_accounts')
+    op.drop_index(op.f('ix_money_accounts_user_id'), table_name='money_accounts')
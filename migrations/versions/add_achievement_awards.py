@@ -0,0 +1,32 @@
+"""add achievement awards
+
+Revision ID: add_achievement_awards
+Revises: add_network_volumes
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_achievement_awards'
+down_revision = 'add_network_volumes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('achievement_awards',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('level', sa.String(length=20), nullable=False),
+        sa.Column('threshold', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('reward_amount', sa.Numeric(precision=10, scale=4), nullable=False),
+        sa.Column('volume', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'level', name='unique_user_achievement')
+    )
+
+def downgrade():
+    op.drop_table('achievement_awards')
@@ -0,0 +1,32 @@
+"""add weekly affiliate bonus projection
+
+Revision ID: add_affiliate_bonus_weeks
+Revises: add_noble_relations_referred_level_index
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_affiliate_bonus_weeks'
+down_revision = 'add_noble_relations_referred_level_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('affiliate_bonus_weeks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('week_start', sa.DateTime(), nullable=False),
+        sa.Column('level', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=15, scale=4), nullable=False),
+        sa.Column('bonuses', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'week_start', 'level', name='unique_user_week_level')
+    )
+
+def downgrade():
+    op.drop_table('affiliate_bonus_weeks')
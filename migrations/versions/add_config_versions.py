@@ -0,0 +1,27 @@
+"""add config version counter
+
+Revision ID: add_config_versions
+Revises: add_rank_engine
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_config_versions'
+down_revision = 'add_rank_engine'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    config_versions = op.create_table('config_versions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(config_versions, [{'id': 1, 'version': 1}])
+
+def downgrade():
+    op.drop_table('config_versions')
@@ -0,0 +1,27 @@
+"""add checkpoint columns to weekly distribution logs
+
+Revision ID: add_distribution_checkpoints
+Revises: add_account_user_indexes
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_distribution_checkpoints'
+down_revision = 'add_account_user_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('weekly_distribution_logs') as batch_op:
+        batch_op.add_column(sa.Column('last_user_id', sa.Integer(), server_default='0'))
+        batch_op.add_column(sa.Column('chunks_committed', sa.Integer(), server_default='0'))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('weekly_distribution_logs') as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('chunks_committed')
+        batch_op.drop_column('last_user_id')
@@ -0,0 +1,37 @@
+"""add distribution journal
+
+Revision ID: add_distribution_journal
+Revises: add_distribution_checkpoints
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_distribution_journal'
+down_revision = 'add_distribution_checkpoints'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('distribution_journal',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('distribution_id', sa.Integer(), nullable=False),
+        sa.Column('account_type', sa.String(length=10), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('balance_before', sa.Numeric(precision=10, scale=4), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('distribution_id', 'account_type', 'user_id', name='unique_journal_entry')
+    )
+    with op.batch_alter_table('distribution_snapshots') as batch_op:
+        batch_op.add_column(sa.Column('distribution_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_distribution_snapshots_distribution_id'), 'distribution_snapshots', ['distribution_id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_distribution_snapshots_distribution_id'), table_name='distribution_snapshots')
+    with op.batch_alter_table('distribution_snapshots') as batch_op:
+        batch_op.drop_column('distribution_id')
+    op.drop_table('distribution_journal')
@@ -0,0 +1,29 @@
+"""add network volumes
+
+Revision ID: add_network_volumes
+Revises: add_weekly_user_totals
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_network_volumes'
+down_revision = 'add_weekly_user_totals'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('network_volumes',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('personal_volume', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('network_volume', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    # I contatori si popolano con scripts/rebuild_network_volumes.py
+
+def downgrade():
+    op.drop_table('network_volumes')
@@ -0,0 +1,21 @@
+"""add (referred_id, level) index on noble_relations
+
+Revision ID: add_noble_relations_referred_level_index
+Revises: add_config_versions
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_noble_relations_referred_level_index'
+down_revision = 'add_config_versions'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_noble_relations_referred_level', 'noble_relations',
+                    ['referred_id', 'level'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_noble_relations_referred_level', table_name='noble_relations')
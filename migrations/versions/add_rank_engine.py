@@ -0,0 +1,49 @@
+"""add rank engine tables and users.noble_rank_id
+
+Revision ID: add_rank_engine
+Revises: add_referral_intervals
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_rank_engine'
+down_revision = 'add_referral_intervals'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('network_volumes') as batch_op:
+        batch_op.add_column(sa.Column('rank_dirty', sa.Boolean(), nullable=False,
+                                      server_default=sa.true()))
+    op.create_index('ix_network_volumes_rank_dirty', 'network_volumes', ['rank_dirty'], unique=False)
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('noble_rank_id', sa.Integer(), nullable=True,
+                                      comment='Current noble rank (see RankEngine)'))
+        batch_op.create_foreign_key('fk_users_noble_rank_id', 'noble_ranks',
+                                    ['noble_rank_id'], ['id'])
+    op.create_table('rank_changes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('previous_rank', sa.Integer(), nullable=False),
+        sa.Column('new_rank', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('pushed_at', sa.DateTime(), nullable=True),
+        sa.Column('tx_hash', sa.String(length=66), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_rank_changes_pushed_at', 'rank_changes', ['pushed_at'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_rank_changes_pushed_at', table_name='rank_changes')
+    op.drop_table('rank_changes')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_constraint('fk_users_noble_rank_id', type_='foreignkey')
+        batch_op.drop_column('noble_rank_id')
+    op.drop_index('ix_network_volumes_rank_dirty', table_name='network_volumes')
+    with op.batch_alter_table('network_volumes') as batch_op:
+        batch_op.drop_column('rank_dirty')
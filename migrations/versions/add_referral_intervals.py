@@ -0,0 +1,34 @@
+"""add referral intervals
+
+Revision ID: add_referral_intervals
+Revises: add_achievement_awards
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_referral_intervals'
+down_revision = 'add_achievement_awards'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('referral_intervals',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('root_id', sa.Integer(), nullable=False),
+        sa.Column('parent_id', sa.Integer(), nullable=True),
+        sa.Column('lft', sa.BigInteger(), nullable=False),
+        sa.Column('rgt', sa.BigInteger(), nullable=False),
+        sa.Column('next_child', sa.BigInteger(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index('ix_referral_intervals_root_lft', 'referral_intervals', ['root_id', 'lft'], unique=False)
+    # Gli intervalli si calcolano con scripts/rebuild_referral_intervals.py
+
+def downgrade():
+    op.drop_index('ix_referral_intervals_root_lft', table_name='referral_intervals')
+    op.drop_table('referral_intervals')
@@ -0,0 +1,27 @@
+"""add distribution id to achievement awards and gold rewards
+
+Revision ID: add_reward_distribution_id
+Revises: add_transaction_receipt_fields
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_reward_distribution_id'
+down_revision = 'add_transaction_receipt_fields'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    for table in ('achievement_awards', 'gold_rewards'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('distribution_id', sa.Integer(), nullable=True))
+        op.create_index(op.f(f'ix_{table}_distribution_id'), table, ['distribution_id'], unique=False)
+
+def downgrade():
+    for table in ('gold_rewards', 'achievement_awards'):
+        op.drop_index(op.f(f'ix_{table}_distribution_id'), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('distribution_id')
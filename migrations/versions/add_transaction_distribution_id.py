@@ -0,0 +1,25 @@
+"""add transaction distribution id
+
+Revision ID: add_transaction_distribution_id
+Revises: add_distribution_journal
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_transaction_distribution_id'
+down_revision = 'add_distribution_journal'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.add_column(sa.Column('distribution_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_transactions_distribution_id'), 'transactions', ['distribution_id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_transactions_distribution_id'), table_name='transactions')
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_column('distribution_id')
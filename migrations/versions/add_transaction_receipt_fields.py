@@ -0,0 +1,27 @@
+"""add transaction receipt fields
+
+Revision ID: add_transaction_receipt_fields
+Revises: add_transformation_batches
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_transaction_receipt_fields'
+down_revision = 'add_transformation_batches'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.add_column(sa.Column('blockchain_tx', sa.String(length=66), nullable=True))
+        batch_op.add_column(sa.Column('confirmed_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_transactions_status_id', 'transactions', ['status', 'id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_transactions_status_id', table_name='transactions')
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_column('confirmed_at')
+        batch_op.drop_column('blockchain_tx')
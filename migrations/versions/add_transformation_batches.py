@@ -0,0 +1,53 @@
+"""add merkle batches of gold transformations
+
+Revision ID: add_transformation_batches
+Revises: add_affiliate_bonus_weeks
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_transformation_batches'
+down_revision = 'add_affiliate_bonus_weeks'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('transformation_batches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('merkle_root', sa.String(length=66), nullable=False),
+        sa.Column('leaf_count', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('blockchain_tx_hash', sa.String(length=66), nullable=True),
+        sa.Column('block_number', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('committed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('merkle_root')
+    )
+    op.create_index('ix_transformation_batches_status', 'transformation_batches', ['status'])
+
+    op.create_table('transformation_leaves',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('batch_id', sa.Integer(), nullable=False),
+        sa.Column('transformation_id', sa.Integer(), nullable=False),
+        sa.Column('leaf_index', sa.Integer(), nullable=False),
+        sa.Column('address', sa.String(length=42), nullable=False),
+        sa.Column('euro_cents', sa.BigInteger(), nullable=False),
+        sa.Column('gold_units', sa.BigInteger(), nullable=False),
+        sa.Column('leaf_hash', sa.String(length=66), nullable=False),
+        sa.Column('proof', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['batch_id'], ['transformation_batches.id'], ),
+        sa.ForeignKeyConstraint(['transformation_id'], ['gold_transformations.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('transformation_id')
+    )
+    op.create_index('ix_transformation_leaves_batch_id', 'transformation_leaves', ['batch_id'])
+
+def downgrade():
+    op.drop_index('ix_transformation_leaves_batch_id', table_name='transformation_leaves')
+    op.drop_table('transformation_leaves')
+    op.drop_index('ix_transformation_batches_status', table_name='transformation_batches')
+    op.drop_table('transformation_batches')
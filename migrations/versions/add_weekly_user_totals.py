@@ -0,0 +1,74 @@
+"""add weekly user totals
+
+Revision ID: add_weekly_user_totals
+Revises: add_transaction_distribution_id
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from datetime import datetime, timedelta
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_weekly_user_totals'
+down_revision = 'add_transaction_distribution_id'
+branch_labels = None
+depends_on = None
+
+def _monday(moment):
+    """Lunedì 00:00 della settimana, come week_bounds del servizio"""
+    return datetime(moment.year, moment.month, moment.day) - timedelta(days=moment.weekday())
+
+def upgrade():
+    weekly_user_totals = op.create_table('weekly_user_totals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('week_start', sa.DateTime(), nullable=False),
+        sa.Column('week_end', sa.DateTime(), nullable=False),
+        sa.Column('total', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('deposits', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Boolean(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'week_start', name='unique_user_week')
+    )
+    op.create_index('ix_weekly_user_totals_week_processed', 'weekly_user_totals', ['week_start', 'processed'], unique=False)
+
+    # Riporta i versamenti esistenti nei totali. week_start dei versamenti
+    # può avere un orario qualsiasi: le righe vengono raggruppate per lunedì
+    # 00:00, la stessa chiave che usa il servizio a ogni nuovo versamento.
+    bind = op.get_bind()
+    if 'weekly_amounts' in sa.inspect(bind).get_table_names():
+        weekly_amounts = sa.table('weekly_amounts',
+                                  sa.column('user_id', sa.Integer()),
+                                  sa.column('week_start', sa.DateTime()),
+                                  sa.column('amount', sa.Numeric(10, 2)),
+                                  sa.column('processed', sa.Boolean()),
+                                  sa.column('created_at', sa.DateTime()))
+        rows = bind.execute(
+            sa.select(weekly_amounts.c.user_id, weekly_amounts.c.week_start,
+                      sa.func.sum(weekly_amounts.c.amount), sa.func.count(),
+                      sa.func.min(sa.case((weekly_amounts.c.processed, 1), else_=0)),
+                      sa.func.max(weekly_amounts.c.created_at))
+            .where(weekly_amounts.c.week_start.isnot(None))
+            .group_by(weekly_amounts.c.user_id, weekly_amounts.c.week_start))
+
+        totals = {}
+        for user_id, week_start, amount, deposits, processed, updated_at in rows:
+            key = (user_id, _monday(week_start))
+            entry = totals.setdefault(key, {'user_id': user_id, 'week_start': key[1],
+                                            'week_end': key[1] + timedelta(days=7, microseconds=-1),
+                                            'total': 0, 'deposits': 0, 'processed': True,
+                                            'updated_at': updated_at})
+            entry['total'] += amount or 0
+            entry['deposits'] += deposits
+            entry['processed'] = entry['processed'] and processed == 1
+            if updated_at and (entry['updated_at'] is None or updated_at > entry['updated_at']):
+                entry['updated_at'] = updated_at
+        if totals:
+            op.bulk_insert(weekly_user_totals, list(totals.values()))
+
+def downgrade():
+    op.drop_index('ix_weekly_user_totals_week_processed', table_name='weekly_user_totals')
+    op.drop_table('weekly_user_totals')
@@ -0,0 +1,52 @@
+"""Importa una rete di referral da CSV (referrer_id,referred_id).
+
+Uso:
+    python -m scripts.import_referrals rete.csv [--database-url URL] [--chunk-size 5000]
+
+La prima riga può essere un'intestazione. Se ci sono coppie non valide
+(auto-referral, cicli, utenti già collegati a un altro referrer) non viene
+importato nulla e le coppie scartate sono stampate con il motivo.
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import sys
+
+from app.database import DatabaseManager, db
+from app.services.referral_service import ReferralService
+
+
+def read_pairs(path):
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip().isdigit():
+                continue
+            yield int(row[0]), int(row[1])
+
+
+async def import_file(path, database_url=None, chunk_size=5000):
+    database = DatabaseManager(database_url) if database_url else db
+    try:
+        return await ReferralService().import_referrals(
+            list(read_pairs(path)), database=database, chunk_size=chunk_size)
+    finally:
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_file')
+    parser.add_argument('--database-url', help='URL async del database (default: configurazione app)')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    result = asyncio.run(import_file(args.csv_file, args.database_url, args.chunk_size))
+    for pair in result.get('rejected', []):
+        print(f"REJECTED {pair['referrer_id']} -> {pair['referred_id']}: {pair['reason']}")
+    print({k: v for k, v in result.items() if k != 'rejected'})
+    if result['status'] != 'success':
+        sys.exit(1)
@@ -0,0 +1,29 @@
+"""Ricalcola gli intervalli annidati della foresta referral da noble_relations.
+
+Uso:
+    python -m scripts.rebuild_referral_intervals [--database-url URL]
+"""
+import argparse
+import asyncio
+import logging
+
+from app.database import DatabaseManager, db
+from app.services.referral_intervals import ReferralIntervalTree
+
+
+async def rebuild(database_url=None):
+    database = DatabaseManager(database_url) if database_url else db
+    try:
+        return await ReferralIntervalTree(database).rebuild()
+    finally:
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='URL async del database (default: configurazione app)')
+    args = parser.parse_args()
+    print(asyncio.run(rebuild(args.database_url)))
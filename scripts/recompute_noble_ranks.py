@@ -0,0 +1,32 @@
+"""Ricalcola i ranghi nobiliari degli utenti segnati come da rivalutare.
+
+Uso:
+    python -m scripts.recompute_noble_ranks [--database-url URL] [--batch-size N]
+"""
+import argparse
+import asyncio
+import logging
+
+from app.database import DatabaseManager, db
+from app.services.rank_engine import RankEngine
+
+
+async def recompute(database_url=None, batch_size=5000):
+    database = DatabaseManager(database_url) if database_url else db
+    try:
+        result = await RankEngine(database, batch_size=batch_size).recompute()
+        result.pop('changes', None)
+        return result
+    finally:
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='URL async del database (default: configurazione app)')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+    print(asyncio.run(recompute(args.database_url, args.batch_size)))
@@ -0,0 +1,227 @@
+"""Benchmark della pipeline settimanale su una popolazione sintetica.
+
+Uso:
+    python -m tests.performance.bench_pipeline --users 100000 --output baseline.json
+    python -m tests.performance.bench_pipeline --users 100000 --compare baseline.json
+
+La popolazione viene generata una volta (vedi synthetic_population) e
+ogni benchmark gira in un processo nuovo su una copia del database, così
+tempo, righe al secondo e picco di RSS sono misurati in isolamento. I
+risultati finiscono in un JSON; con --compare si confrontano con una
+baseline e si esce con codice 1 se un benchmark peggiora oltre la
+tolleranza. Un benchmark che fallisce viene registrato con status
+'error' e il messaggio, senza interrompere gli altri.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Dict, List
+
+from tests.performance.synthetic_population import PopulationSpec, build_population
+
+FIXING_PRICE = Decimal('85.13')
+BONUS_SAMPLE = 1000
+
+
+def _database(path: str):
+    from app.database import DatabaseManager
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+async def bench_distribution_bulk(database, population: Dict) -> int:
+    from app.services.gold.weekly_distribution import WeeklyGoldDistribution, MODE_BULK
+    result = await WeeklyGoldDistribution(database=database).process_distribution(
+        FIXING_PRICE, mode=MODE_BULK)
+    return result['users_processed']
+
+
+async def bench_distribution_row(database, population: Dict) -> int:
+    from app.services.gold.weekly_distribution import WeeklyGoldDistribution, MODE_ROW
+    result = await WeeklyGoldDistribution(database=database).process_distribution(
+        FIXING_PRICE, mode=MODE_ROW)
+    return result['users_processed']
+
+
+async def bench_weekly_processor(database, population: Dict) -> int:
+    from app.services.weekly_processing_service import WeeklyProcessor
+    result = await WeeklyProcessor(database=database).process_weekly_transformations(
+        FIXING_PRICE)
+    if result['status'] != 'success':
+        raise RuntimeError(result.get('message', result['status']))
+    return result['processed_users']
+
+
+async def bench_purchase_bonuses(database, population: Dict) -> int:
+    from app.services.bonus_distribution_service import BonusDistributionService
+    service = BonusDistributionService(database=database)
+    sample = range(population['users'], max(population['users'] - BONUS_SAMPLE, 0), -1)
+    for user_id in sample:
+        await service.calculate_purchase_bonuses(user_id, Decimal('10.0000'))
+    return len(sample)
+
+
+async def bench_cohort_bonuses(database, population: Dict, use_index: bool = True) -> int:
+    from app.services.bonus_distribution_service import BonusDistributionService
+    purchases = [(user_id, Decimal('1.2345')) for user_id in range(1, population['users'] + 1)]
+    result = await BonusDistributionService(
+        database=database, use_index=use_index).distribute_cohort_bonuses(purchases)
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    return len(purchases)
+
+
+async def bench_cohort_bonuses_sql(database, population: Dict) -> int:
+    return await bench_cohort_bonuses(database, population, use_index=False)
+
+
+async def bench_distribution_validator(database, population: Dict) -> int:
+    from app.services.gold.distribution_validator import DistributionValidator
+    if not await DistributionValidator(database=database).check_database_integrity():
+        raise RuntimeError("check_database_integrity returned False")
+    return population['users']
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'weekly_distribution_bulk': bench_distribution_bulk,
+    'weekly_distribution_row': bench_distribution_row,
+    'weekly_processor': bench_weekly_processor,
+    'purchase_bonuses': bench_purchase_bonuses,
+    'cohort_bonuses': bench_cohort_bonuses,
+    'cohort_bonuses_sql': bench_cohort_bonuses_sql,
+    'distribution_validator': bench_distribution_validator,
+}
+
+
+def _memory_kb(field: str) -> int:
+    """VmRSS o VmHWM del processo corrente, in KB.
+
+    ru_maxrss sopravvive a fork+exec e nel figlio riporta il picco del
+    padre; VmHWM appartiene allo spazio di indirizzi del processo. Dove
+    /proc non c'è (macOS) si ripiega su ru_maxrss, in byte.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_benchmark(name: str, path: str, population: Dict) -> Dict:
+    """Esegue un benchmark nel processo corrente (un figlio del pool)"""
+    rss_at_start = _memory_kb('VmRSS')
+    database = _database(path)
+
+    async def measure():
+        start = time.perf_counter()
+        try:
+            rows = await BENCHMARKS[name](database, population)
+            return {'status': 'ok', 'rows': rows,
+                    'seconds': round(time.perf_counter() - start, 3)}
+        except Exception as e:
+            return {'status': 'error', 'error': f"{type(e).__name__}: {e}",
+                    'seconds': round(time.perf_counter() - start, 3)}
+        finally:
+            await database.engine.dispose()
+
+    result = asyncio.run(measure())
+    if result['status'] == 'ok':
+        result['rows_per_second'] = round(result['rows'] / max(result['seconds'], 1e-9), 1)
+    result['peak_rss_kb'] = _memory_kb('VmHWM')
+    result['rss_growth_kb'] = max(result['peak_rss_kb'] - rss_at_start, 0)
+    return result
+
+
+def run_suite(spec: PopulationSpec, names: List[str]) -> Dict:
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'population.db')
+        start = time.perf_counter()
+        population = build_population(template, spec)
+        population['build_seconds'] = round(time.perf_counter() - start, 3)
+
+        for name in names:
+            path = os.path.join(tmp, f"{name}.db")
+            shutil.copyfile(template, path)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results[name] = pool.submit(run_benchmark, name, path, population).result()
+            os.remove(path)
+            print(name, results[name])
+
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'population': population,
+        'results': results
+    }
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Benchmark più lenti o più pesanti della baseline oltre la tolleranza"""
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or previous.get('status') != 'ok':
+            continue
+        if current['status'] != 'ok':
+            regressions.append(f"{name}: {current['error']}")
+            continue
+        for metric in ('seconds', 'peak_rss_kb'):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fan-out', type=int, default=5)
+    parser.add_argument('--deposits', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS),
+                        default=list(BENCHMARKS))
+    parser.add_argument('--output', help='file JSON in cui scrivere i risultati')
+    parser.add_argument('--compare', help='baseline JSON con cui confrontare')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    spec = PopulationSpec(users=args.users, depth=args.depth, fan_out=args.fan_out,
+                          deposits_per_user=args.deposits, seed=args.seed)
+    report = run_suite(spec, args.only)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Benchmark del throughput RPC concorrente: provider sync contro async.
+
+Uso:
+    python -m tests.performance.bench_rpc --calls 2000 --concurrency 50 --latency 0.005
+    python -m tests.performance.bench_rpc --output rpc.json
+
+Avvia un nodo finto in locale (vedi rpc_stand_in) con una latenza per
+richiesta e lancia lo stesso carico di letture (eth_blockNumber e
+eth_getTransactionReceipt alternati) da `concurrency` coroutine,
+attraverso create_web3 in modalità sync e async. Con il provider sync
+ogni chiamata blocca il loop e le richieste si serializzano; con quello
+async le chiamate condividono la sessione keep-alive e restano in volo
+insieme fino al limite del pool. Infine confronta la lettura di rango e
+premi di `addresses` indirizzi con due eth_call per indirizzo contro
+NobleBatchReader (batch JSON-RPC da 100 indirizzi).
+"""
+import argparse
+import asyncio
+import json
+import platform
+import time
+from datetime import datetime
+from typing import Dict
+
+from app.utils.web3_provider import (PROVIDER_ASYNC, PROVIDER_SYNC, close_pooled_sessions,
+                                     create_web3, install_pooled_session, resolve)
+from app.services.noble_batch_reader import FIELDS, NobleBatchReader, encode_call
+from tests.performance.rpc_stand_in import StandInNode
+
+TX_HASH = '0x' + 'cd' * 32
+CONTRACT = '0x' + '99' * 20
+
+
+async def _read(client, index: int):
+    if index % 2:
+        return await resolve(client.eth.get_transaction_receipt(TX_HASH))
+    return await resolve(client.eth.block_number)
+
+
+async def run_load(url: str, mode: str, calls: int, concurrency: int,
+                   pool_size: int) -> Dict:
+    client = create_web3(url, mode=mode)
+    await install_pooled_session(client, pool_size=pool_size)
+    queue = iter(range(calls))
+
+    async def worker():
+        for index in queue:
+            await _read(client, index)
+
+    try:
+        await _read(client, 0)  # connessione e chain id fuori dalla misura
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        seconds = time.perf_counter() - start
+    finally:
+        await close_pooled_sessions()
+
+    return {'calls': calls, 'seconds': round(seconds, 3),
+            'calls_per_second': round(calls / max(seconds, 1e-9), 1)}
+
+
+async def run_noble_reads(url: str, batched: bool, addresses: int, concurrency: int) -> Dict:
+    targets = ['0x' + f'{index:040x}' for index in range(1, addresses + 1)]
+    try:
+        start = time.perf_counter()
+        if batched:
+            await NobleBatchReader(url, CONTRACT).read(targets)
+        else:
+            client = create_web3(url, mode=PROVIDER_ASYNC)
+            await install_pooled_session(client)
+            slots = asyncio.Semaphore(concurrency)
+
+            async def read(address):
+                async with slots:
+                    for _, selector in FIELDS:
+                        await client.eth.call({'to': CONTRACT,
+                                               'data': encode_call(selector, address)})
+
+            await asyncio.gather(*(read(address) for address in targets))
+        seconds = time.perf_counter() - start
+    finally:
+        await close_pooled_sessions()
+
+    return {'addresses': addresses, 'seconds': round(seconds, 3),
+            'addresses_per_second': round(addresses / max(seconds, 1e-9), 1)}
+
+
+def _guarded(name: str, results: Dict, coroutine) -> None:
+    try:
+        results[name] = dict(status='ok', **asyncio.run(coroutine))
+    except Exception as e:
+        results[name] = {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+    print(name, results[name])
+
+
+def run_suite(calls: int, concurrency: int, latency: float, pool_size: int,
+              addresses: int) -> Dict:
+    results = {}
+    with StandInNode(latency=latency) as node:
+        for mode in (PROVIDER_SYNC, PROVIDER_ASYNC):
+            _guarded(mode, results, run_load(node.url, mode, calls, concurrency, pool_size))
+        for name, batched in (('noble_stats_per_address', False), ('noble_stats_batched', True)):
+            _guarded(name, results, run_noble_reads(node.url, batched, addresses, concurrency))
+
+    if all(results[mode]['status'] == 'ok' for mode in (PROVIDER_SYNC, PROVIDER_ASYNC)):
+        results['speedup'] = round(results[PROVIDER_ASYNC]['calls_per_second']
+                                   / max(results[PROVIDER_SYNC]['calls_per_second'], 1e-9), 1)
+        print('speedup', results['speedup'])
+
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'load': {'calls': calls, 'concurrency': concurrency, 'latency': latency,
+                 'pool_size': pool_size, 'addresses': addresses},
+        'results': results
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='secondi di latenza per richiesta del nodo finto')
+    parser.add_argument('--pool-size', type=int, default=100)
+    parser.add_argument('--addresses', type=int, default=2000)
+    parser.add_argument('--output', help='file JSON in cui scrivere i risultati')
+    args = parser.parse_args()
+
+    report = run_suite(args.calls, args.concurrency, args.latency, args.pool_size,
+                       args.addresses)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark della distribuzione settimanale: per riga, bulk e a shard.
+
+Uso:
+    python -m tests.performance.bench_weekly_distribution --users 10000 100000 1000000
+
+Ogni misura parte da un database SQLite nuovo in una directory temporanea.
+Il percorso per riga viene saltato oltre --row-limit utenti perché a 1M
+utenti richiede decine di minuti. Su SQLite gli shard serializzano le
+scritture sul lock del file: la scalabilità con i core va misurata su
+PostgreSQL.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from decimal import Decimal
+
+from sqlalchemy import create_engine, insert
+
+from app.database import DatabaseManager
+from app.models.models import User, MoneyAccount, GoldAccount, Transaction
+from app.models.distribution import (WeeklyDistributionLog, DistributionSnapshot,
+                                     DistributionJournalEntry)
+from app.services.gold.weekly_distribution import (WeeklyGoldDistribution,
+                                                   MODE_ROW, MODE_BULK,
+                                                   MODE_SHARDED)
+
+FIXING_PRICE = Decimal('85.13')
+TABLES = [User.__table__, MoneyAccount.__table__, GoldAccount.__table__,
+          Transaction.__table__, WeeklyDistributionLog.__table__,
+          DistributionSnapshot.__table__, DistributionJournalEntry.__table__]
+
+
+def populate(path: str, users: int, seed: int = 42) -> None:
+    """Crea conti euro e oro per `users` utenti con saldi casuali"""
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for table in TABLES:
+            table.create(conn)
+        batch = 10000
+        for start in range(1, users + 1, batch):
+            ids = range(start, min(start + batch, users + 1))
+            conn.execute(insert(MoneyAccount.__table__), [
+                {'user_id': i,
+                 'balance': Decimal(rng.randint(10000, 500000)) / 100}
+                for i in ids
+            ])
+            conn.execute(insert(GoldAccount.__table__), [
+                {'user_id': i, 'balance': Decimal('0')} for i in ids
+            ])
+    engine.dispose()
+
+
+async def run_once(path: str, mode: str) -> dict:
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{path}")
+    manager.engine.sync_engine.echo = False
+    service = WeeklyGoldDistribution(database=manager)
+    start = time.perf_counter()
+    result = await service.process_distribution(FIXING_PRICE, mode=mode)
+    elapsed = time.perf_counter() - start
+    await manager.engine.dispose()
+    return {
+        'mode': mode,
+        'users': result['users_processed'],
+        'seconds': round(elapsed, 3),
+        'users_per_second': round(result['users_processed'] / elapsed, 1)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--row-limit', type=int, default=100000)
+    args = parser.parse_args()
+
+    for users in args.users:
+        modes = [MODE_BULK, MODE_SHARDED]
+        if users <= args.row_limit:
+            modes.insert(0, MODE_ROW)
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.db')
+                populate(path, users)
+                print(asyncio.run(run_once(path, mode)))
+
+
+if __name__ == '__main__':
+    main()
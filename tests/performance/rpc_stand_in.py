@@ -0,0 +1,121 @@
+"""Nodo JSON-RPC finto per benchmark e test dei client Web3.
+
+Risponde ai metodi usati dai servizi (eth_blockNumber, eth_chainId,
+eth_gasPrice, eth_getTransactionReceipt, eth_call, ...) con dati
+deterministici, anche in richieste batch, dopo una latenza artificiale
+che simula la distanza dal nodo reale. Gira in un thread con il proprio
+loop, così anche un client sincrono che blocca il loop del chiamante
+può interrogarlo.
+"""
+import asyncio
+import threading
+from typing import Callable, Dict, Optional
+
+from aiohttp import web
+
+CHAIN_ID = 1337
+BLOCK_NUMBER = 1000
+GAS_PRICE = 10 ** 9
+ZERO_WORD = '0x' + '00' * 32
+
+
+def _receipt(tx_hash: str) -> Dict:
+    return {
+        'transactionHash': tx_hash,
+        'transactionIndex': '0x0',
+        'blockHash': '0x' + 'ab' * 32,
+        'blockNumber': hex(BLOCK_NUMBER),
+        'from': '0x' + '11' * 20,
+        'to': '0x' + '22' * 20,
+        'cumulativeGasUsed': '0x5208',
+        'gasUsed': '0x5208',
+        'effectiveGasPrice': hex(GAS_PRICE),
+        'contractAddress': None,
+        'logs': [],
+        'logsBloom': '0x' + '00' * 256,
+        'status': '0x1',
+        'type': '0x0'
+    }
+
+
+DEFAULT_METHODS: Dict[str, Callable] = {
+    'eth_chainId': lambda params: hex(CHAIN_ID),
+    'net_version': lambda params: str(CHAIN_ID),
+    'eth_blockNumber': lambda params: hex(BLOCK_NUMBER),
+    'eth_gasPrice': lambda params: hex(GAS_PRICE),
+    'eth_syncing': lambda params: False,
+    'net_peerCount': lambda params: '0x1',
+    'eth_getTransactionReceipt': lambda params: _receipt(params[0]),
+    'eth_call': lambda params: ZERO_WORD,
+}
+
+
+class StandInNode:
+
+    def __init__(self, latency: float = 0.005, methods: Optional[Dict[str, Callable]] = None):
+        self.latency = latency
+        self.methods = dict(DEFAULT_METHODS, **(methods or {}))
+        self.requests = 0
+        self.calls = 0
+        self.url: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _answer(self, call: Dict) -> Dict:
+        self.calls += 1
+        method = self.methods.get(call.get('method'))
+        if method is None:
+            return {'jsonrpc': '2.0', 'id': call.get('id'),
+                    'error': {'code': -32601, 'message': 'Method not found'}}
+        try:
+            result = method(call.get('params', []))
+        except Exception as e:
+            return {'jsonrpc': '2.0', 'id': call.get('id'),
+                    'error': {'code': -32000, 'message': str(e)}}
+        return {'jsonrpc': '2.0', 'id': call.get('id'), 'result': result}
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        if isinstance(payload, list):
+            return web.json_response([self._answer(call) for call in payload])
+        return web.json_response(self._answer(payload))
+
+    async def _start(self, ready: threading.Event) -> None:
+        app = web.Application()
+        app.router.add_post('/', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}/"
+        ready.set()
+
+    def start(self) -> 'StandInNode':
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start(ready))
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self) -> 'StandInNode':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,143 @@
+"""Generatore riproducibile di una popolazione sintetica su SQLite.
+
+Crea N utenti con conto euro e oro, una foresta di alberi referral con
+profondità e fan-out configurabili (relazioni fino a MAX_LEVEL livelli,
+come ReferralService) e i versamenti della settimana corrente, con i
+totali settimanali già aggregati. A parità di seed il database è identico.
+"""
+import random
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import create_engine, insert
+
+from app.models import db
+from app.models.models import (User, MoneyAccount, GoldAccount, NobleRelation,
+                               Transaction, GoldTransformation, BonusTransaction,
+                               GoldReward, KYCStatus, UserRole)
+from app.models.distribution import (WeeklyDistributionLog, DistributionSnapshot,
+                                     DistributionJournalEntry)
+from app.models.weekly_amount import WeeklyAmount, WeeklyUserTotal
+from app.models.network_volume import NetworkVolume
+from app.models.affiliate_bonus import AffiliateBonusWeek
+from app.models.achievement import AchievementAward
+from app.services.referral_service import ReferralService
+from app.services.weekly_amount_service import week_bounds
+
+TABLES = [User.__table__, MoneyAccount.__table__, GoldAccount.__table__,
+          NobleRelation.__table__, Transaction.__table__,
+          GoldTransformation.__table__, BonusTransaction.__table__,
+          GoldReward.__table__,
+          WeeklyAmount.__table__, WeeklyUserTotal.__table__,
+          WeeklyDistributionLog.__table__, DistributionSnapshot.__table__,
+          DistributionJournalEntry.__table__, NetworkVolume.__table__,
+          AffiliateBonusWeek.__table__, AchievementAward.__table__]
+
+BATCH_SIZE = 10000
+
+
+@dataclass
+class PopulationSpec:
+    users: int
+    depth: int = 4
+    fan_out: int = 5
+    deposits_per_user: int = 3
+    seed: int = 42
+
+    @property
+    def tree_size(self) -> int:
+        return sum(self.fan_out ** level for level in range(self.depth + 1))
+
+
+def parent_of(user_id: int, spec: PopulationSpec) -> Optional[int]:
+    """Referrer diretto: gli utenti riempiono gli alberi in ampiezza"""
+    local = (user_id - 1) % spec.tree_size
+    if local == 0:
+        return None
+    return user_id - local + (local - 1) // spec.fan_out
+
+
+def upline(user_id: int, spec: PopulationSpec,
+           max_level: int = ReferralService.MAX_LEVEL) -> List[Tuple[int, int]]:
+    """(referrer, livello) fino a max_level sopra l'utente"""
+    chain = []
+    current = parent_of(user_id, spec)
+    while current is not None and len(chain) < max_level:
+        chain.append((current, len(chain) + 1))
+        current = parent_of(current, spec)
+    return chain
+
+
+def _batches(start: int, stop: int) -> Iterator[range]:
+    for first in range(start, stop, BATCH_SIZE):
+        yield range(first, min(first + BATCH_SIZE, stop))
+
+
+def build_population(path: str, spec: PopulationSpec,
+                     reference: Optional[datetime] = None) -> Dict:
+    """Crea il database in `path` e restituisce i conteggi delle righe"""
+    rng = random.Random(spec.seed)
+    week_start, week_end = week_bounds(reference or datetime.utcnow())
+    counts = {'users': 0, 'relations': 0, 'deposits': 0}
+
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        db.metadata.create_all(conn, tables=TABLES)
+
+        for ids in _batches(1, spec.users + 1):
+            users, money, gold, relations, deposits, totals = [], [], [], [], [], []
+            for user_id in ids:
+                users.append({
+                    'id': user_id,
+                    'customer_code': f"CUST{user_id:08d}",
+                    'email': f"user{user_id}@bench.local",
+                    'password_hash': 'bench',
+                    'name': f"Utente {user_id}",
+                    'tax_code': f"TX{user_id:014d}",
+                    'kyc_status': KYCStatus.APPROVED,
+                    'role': UserRole.USER,
+                    'is_active': True,
+                    'created_at': week_start
+                })
+                relations.extend(
+                    {'referrer_id': referrer, 'referred_id': user_id,
+                     'level': level, 'created_at': week_start}
+                    for referrer, level in upline(user_id, spec))
+
+                amounts = [Decimal(rng.randint(1000, 200000)).scaleb(-2)
+                           for _ in range(spec.deposits_per_user)]
+                for i, amount in enumerate(amounts):
+                    deposits.append({
+                        'user_id': user_id, 'amount': amount,
+                        'week_start': week_start, 'week_end': week_end,
+                        'processed': False,
+                        'created_at': week_start + timedelta(hours=i)
+                    })
+                total = sum(amounts, Decimal('0'))
+                if amounts:
+                    totals.append({
+                        'user_id': user_id, 'week_start': week_start,
+                        'week_end': week_end, 'total': total,
+                        'deposits': len(amounts), 'processed': False,
+                        'updated_at': week_start
+                    })
+                money.append({'user_id': user_id, 'balance': total})
+                gold.append({'user_id': user_id, 'balance': Decimal('0')})
+
+            conn.execute(insert(User.__table__), users)
+            conn.execute(insert(MoneyAccount.__table__), money)
+            conn.execute(insert(GoldAccount.__table__), gold)
+            if relations:
+                conn.execute(insert(NobleRelation.__table__), relations)
+            if deposits:
+                conn.execute(insert(WeeklyAmount.__table__), deposits)
+                conn.execute(insert(WeeklyUserTotal.__table__), totals)
+
+            counts['users'] += len(users)
+            counts['relations'] += len(relations)
+            counts['deposits'] += len(deposits)
+
+    engine.dispose()
+    return {**asdict(spec), **counts, 'week_start': week_start.isoformat()}
@@ -0,0 +1,31 @@
+from sqlalchemy import create_engine, text
+from tests.performance.synthetic_population import (PopulationSpec, build_population,
+                                                    parent_of, upline)
+
+
+def test_tree_layout_fills_breadth_first():
+    spec = PopulationSpec(users=100, depth=2, fan_out=3)
+    assert spec.tree_size == 13
+    assert parent_of(1, spec) is None
+    assert [parent_of(i, spec) for i in (2, 4, 5, 13)] == [1, 1, 2, 4]
+    assert parent_of(14, spec) is None
+    assert upline(13, spec) == [(4, 1), (1, 2)]
+
+
+def test_population_is_reproducible(tmp_path):
+    spec = PopulationSpec(users=300, depth=4, fan_out=3, deposits_per_user=2, seed=7)
+    totals = []
+    for name in ('a.db', 'b.db'):
+        counts = build_population(str(tmp_path / name), spec)
+        engine = create_engine(f"sqlite:///{tmp_path / name}")
+        with engine.connect() as conn:
+            totals.append(conn.execute(text(
+                "SELECT SUM(balance) FROM money_accounts")).scalar())
+            assert conn.execute(text(
+                "SELECT SUM(total) FROM weekly_user_totals")).scalar() == totals[-1]
+            assert conn.execute(text(
+                "SELECT MAX(level) FROM noble_relations")).scalar() == 3
+        engine.dispose()
+
+    assert counts['users'] == 300 and counts['deposits'] == 600
+    assert totals[0] == totals[1]
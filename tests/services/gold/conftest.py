@@ -0,0 +1,46 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, insert
+from app.database import DatabaseManager
+from app.models.models import (MoneyAccount, GoldAccount, Transaction, NobleRelation,
+                               GoldReward)
+from app.models.network_volume import NetworkVolume
+from app.models.achievement import AchievementAward
+from app.models.distribution import (WeeklyDistributionLog, DistributionSnapshot,
+                                     DistributionJournalEntry)
+
+DISTRIBUTION_TABLES = [MoneyAccount.__table__, GoldAccount.__table__,
+                       Transaction.__table__, WeeklyDistributionLog.__table__,
+                       DistributionSnapshot.__table__,
+                       DistributionJournalEntry.__table__,
+                       NobleRelation.__table__, NetworkVolume.__table__,
+                       GoldReward.__table__, AchievementAward.__table__]
+
+SEEDED_USERS = 250
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Database SQLite su file con conti euro (100€ + id) e oro a zero"""
+    path = tmp_path / 'distribution.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for table in DISTRIBUTION_TABLES:
+            table.create(conn)
+        conn.execute(insert(MoneyAccount.__table__), [
+            {'user_id': i, 'balance': Decimal('100.00') + i}
+            for i in range(1, SEEDED_USERS + 1)
+        ])
+        conn.execute(insert(GoldAccount.__table__), [
+            {'user_id': i, 'balance': Decimal('0')}
+            for i in range(1, SEEDED_USERS + 1)
+        ])
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
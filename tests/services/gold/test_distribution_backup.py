@@ -1,56 +1,87 @@
 import pytest
+from datetime import datetime
 from decimal import Decimal
+from sqlalchemy import create_engine, insert, text
+from app.models.models import Transaction
 from app.services.gold.distribution_backup import DistributionBackup
-from app.database import db
+from app.services.gold.weekly_distribution import ledger_row
 
 pytestmark = [pytest.mark.asyncio, pytest.mark.gold]
 
-@pytest.mark.usefixtures("app", "test_db")
+
+def _query(db_path, query, params=None):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        result = conn.execute(text(query), params or {})
+        rows = result.all() if result.returns_rows else None
+    engine.dispose()
+    return rows
+
+
 class TestDistributionBackup:
-    # I test rimangono gli stessi
 
-    async def test_create_snapshot(self, test_db):
-        backup = DistributionBackup()
-        snapshot_id = await backup.create_snapshot()
+    async def test_create_snapshot(self, database):
+        backup = DistributionBackup(database=database)
+        snapshot_id = await backup.create_snapshot(distribution_id=1)
         assert snapshot_id > 0
+        # La stessa distribuzione riusa l'intestazione esistente
+        assert await backup.create_snapshot(distribution_id=1) == snapshot_id
 
-    async def test_restore_snapshot(self, test_db):
-        backup = DistributionBackup()
+    async def test_journal_records_only_touched_accounts(self, database, db_path):
+        backup = DistributionBackup(database=database)
+        await backup.create_snapshot(distribution_id=1)
 
-        # Create initial state
-        async with db.session() as session:
+        async with database.get_async_session() as session:
+            await backup.journal_accounts(session, 1, [1, 2, 3])
+            # Il secondo passaggio non sovrascrive il valore precedente
             await session.execute(
-                "UPDATE money_accounts SET balance = 100 WHERE id = 1")
-            await session.commit()
+                text("UPDATE money_accounts SET balance = 0 WHERE user_id = 1"))
+            await backup.journal_accounts(session, 1, [1])
 
-        # Create snapshot
-        snapshot_id = await backup.create_snapshot()
+        rows = _query(db_path, """SELECT account_type, user_id, balance_before
+                                  FROM distribution_journal ORDER BY account_type, user_id""")
+        assert len(rows) == 6
+        assert ('money', 1, 101) in [tuple(r) for r in rows]
 
-        # Modify state
-        async with db.session() as session:
-            await session.execute(
-                "UPDATE money_accounts SET balance = 200 WHERE id = 1")
-            await session.commit()
+    async def test_restore_snapshot(self, database, db_path):
+        backup = DistributionBackup(database=database)
+        await backup.create_snapshot(distribution_id=7)
+
+        async with database.get_async_session() as session:
+            await backup.journal_accounts(session, 7, [1])
+            await session.execute(text(
+                "UPDATE money_accounts SET balance = 0 WHERE user_id = 1"))
+            await session.execute(text(
+                "UPDATE gold_accounts SET balance = 1.25 WHERE user_id = 1"))
+            await session.execute(insert(Transaction.__table__).values(ledger_row(
+                1, Decimal('101'), Decimal('1.25'), Decimal('5.05'), datetime.utcnow(), 7)))
+
+        # Deposito arrivato dopo la distribuzione: il ripristino non lo cancella
+        _query(db_path, "UPDATE money_accounts SET balance = balance + 40 WHERE user_id = 1")
 
-        # Restore
         restored = await backup.restore_latest_snapshot()
         assert restored is True
 
-        # Verify
-        async with db.session() as session:
-            result = await session.execute(
-                "SELECT balance FROM money_accounts WHERE id = 1")
-            balance = result.scalar()
-            assert balance == Decimal('100')
+        money, gold = _query(db_path, """
+            SELECT m.balance, g.balance FROM money_accounts m
+            JOIN gold_accounts g ON g.user_id = m.user_id
+            WHERE m.user_id = 1""")[0]
+        assert Decimal(str(money)) == Decimal('141')
+        assert Decimal(str(gold)) == Decimal('0')
+        # Gli altri conti non sono stati toccati dal ripristino
+        assert _query(db_path, "SELECT balance FROM money_accounts WHERE user_id = 2")[0][0] == 102
+        assert _query(db_path, "SELECT COUNT(*) FROM transactions")[0][0] == 0
 
-    async def test_verify_snapshot_integrity(self, test_db):
-        backup = DistributionBackup()
-        snapshot_id = await backup.create_snapshot()
+    async def test_verify_snapshot_integrity(self, database):
+        backup = DistributionBackup(database=database)
+        snapshot_id = await backup.create_snapshot(distribution_id=3)
+        async with database.get_async_session() as session:
+            await backup.journal_accounts(session, 3, [5, 6])
 
         integrity_result = await backup.verify_snapshot_integrity(snapshot_id)
         assert integrity_result is True
 
-    async def test_snapshot_not_found(self, test_db):
-        backup = DistributionBackup()
+    async def test_snapshot_not_found(self, database):
+        backup = DistributionBackup(database=database)
         integrity_result = await backup.verify_snapshot_integrity(999999)
         assert integrity_result is False
@@ -0,0 +1,49 @@
+import pytest
+from decimal import Decimal
+from app.services.gold.distribution_planner import DistributionPlanner
+from app.services.gold.weekly_distribution import (WeeklyGoldDistribution,
+                                                   MODE_BULK)
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.gold]
+
+CANDIDATES = [Decimal('84.90'), Decimal('85.13'), Decimal('86.0025')]
+
+
+async def test_plan_matches_bulk_distribution(database):
+    planner = DistributionPlanner(database=database, fetch_size=64)
+    columns = await planner.load()
+    plans = planner.plan(CANDIDATES)
+
+    assert columns.user_ids.tolist() == list(range(1, 251))
+    assert [p['users'] for p in plans] == [250, 250, 250]
+    assert plans[0]['total_gold'] > plans[1]['total_gold'] > plans[2]['total_gold']
+
+    # Nessuna scrittura: la distribuzione reale parte dagli stessi saldi
+    service = WeeklyGoldDistribution(database=database, bulk_chunk_size=100)
+    result = await service.process_distribution(CANDIDATES[1], mode=MODE_BULK)
+
+    assert plans[1]['total_euro'] == Decimal('56375.00')
+    assert Decimal(str(result['total_gold'])) == plans[1]['client_gold']
+    assert (plans[1]['client_gold'] + plans[1]['affiliate_pool']
+            == plans[1]['total_gold'])
+
+
+async def test_breakdown_streams_per_user_conversions(database):
+    planner = DistributionPlanner(database=database)
+    await planner.load()
+    service = WeeklyGoldDistribution(database=database)
+
+    rows = planner.breakdown(Decimal('85.13'), batch_size=7)
+    first = next(rows)
+    assert first['user_id'] == 1 and first['euro'] == Decimal('101.00')
+
+    for row in [first, *rows]:
+        client_gold, affiliate_gold, fee = service._calculate_conversion(
+            row['euro'], Decimal('85.13'))
+        assert (row['client_gold'], row['affiliate_gold'], row['fee']) == (
+            client_gold, affiliate_gold, fee)
+
+
+async def test_plan_requires_loaded_balances(database):
+    with pytest.raises(RuntimeError):
+        DistributionPlanner(database=database).plan(CANDIDATES)
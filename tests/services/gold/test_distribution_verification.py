@@ -0,0 +1,78 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, text
+from app.services.gold.distribution_validator import (DistributionValidator,
+                                                      chunk_hash, genesis_hash)
+from app.services.gold.weekly_distribution import (WeeklyGoldDistribution,
+                                                   MODE_BULK)
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.gold]
+
+FIXING_PRICE = Decimal('85.13')
+
+
+async def _distribute(database):
+    service = WeeklyGoldDistribution(database=database, bulk_chunk_size=100)
+    return (await service.process_distribution(FIXING_PRICE, mode=MODE_BULK))['distribution_id']
+
+
+async def test_streaming_verification_balances_each_chunk(database):
+    distribution_id = await _distribute(database)
+    validator = DistributionValidator(database=database, chunk_size=60)
+
+    chunks = [c async for c in validator.iter_distribution_chunks(distribution_id)]
+    assert [c['users'] for c in chunks] == [60, 60, 60, 60, 10]
+    assert all(c['valid'] for c in chunks)
+    assert all(c['euro_before_cents'] == c['euro_converted_cents'] for c in chunks)
+
+    result = await validator.verify_distribution(distribution_id)
+    assert result['valid'] and result['matches_log']
+    assert result['total_euro'] == Decimal('56375.00')
+    assert result['hash'] == chunks[-1]['hash']
+
+
+async def test_hash_chain_can_be_recomputed(db_path, database):
+    distribution_id = await _distribute(database)
+    validator = DistributionValidator(database=database, chunk_size=100)
+    chunks = [c async for c in validator.iter_distribution_chunks(distribution_id)]
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT t.user_id, CAST(ROUND(j.balance_before * 100) AS INTEGER),
+                   CAST(ROUND(t.amount * 100) AS INTEGER),
+                   CAST(ROUND(t.net_amount * 10000) AS INTEGER)
+            FROM transactions t JOIN distribution_journal j
+              ON j.user_id = t.user_id AND j.account_type = 'money'
+            ORDER BY t.user_id""")).all()
+    engine.dispose()
+
+    expected = genesis_hash(distribution_id, 851300)
+    for i, chunk in enumerate(chunks):
+        expected = chunk_hash(expected, rows[i * 100:(i + 1) * 100])
+        assert chunk['hash'] == expected
+
+
+async def test_tampered_ledger_fails_verification(db_path, database):
+    distribution_id = await _distribute(database)
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE transactions SET net_amount = net_amount + 0.01 "
+                          "WHERE user_id = 42"))
+    engine.dispose()
+
+    validator = DistributionValidator(database=database, chunk_size=100)
+    result = await validator.verify_distribution(distribution_id)
+    assert result['valid'] is False
+    assert result['invalid_chunks'] == [1]
+
+
+async def test_system_status_blocks_runs_in_progress(db_path, database):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text("""INSERT INTO weekly_distribution_logs
+            (processing_date, fixing_price, status) VALUES
+            ('2026-10-12 00:00:00', 85.13, 'in_progress')"""))
+    engine.dispose()
+
+    assert await DistributionValidator(database=database).validate_system_status() is False
@@ -0,0 +1,67 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, text
+from app.services.gold.weekly_distribution import (WeeklyGoldDistribution,
+                                                   MODE_SHARDED)
+from app.services.gold.sharded_distribution import sync_database_url
+
+pytestmark = [pytest.mark.gold]
+
+FIXING_PRICE = Decimal('85.13')
+
+
+def _scalar(db_path, query):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        value = conn.execute(text(query)).scalar()
+    engine.dispose()
+    return value
+
+
+@pytest.mark.asyncio
+async def test_sharded_matches_bulk_totals(db_path, database):
+    service = WeeklyGoldDistribution(database=database, bulk_chunk_size=30,
+                                     shard_workers=4)
+    result = await service.process_distribution(FIXING_PRICE, mode=MODE_SHARDED)
+
+    assert result['status'] == 'success'
+    assert result['shards'] == 4
+    assert result['users_processed'] == 250
+    assert _scalar(db_path, "SELECT status FROM weekly_distribution_logs") == 'completed'
+    assert _scalar(db_path, "SELECT COUNT(*) FROM transactions "
+                            "WHERE distribution_id = 1") == 250
+    assert _scalar(db_path,
+                   "SELECT COUNT(*) FROM money_accounts WHERE balance != 0") == 0
+    # 250 utenti con 100€ + id
+    assert _scalar(db_path, "SELECT SUM(personal_volume) FROM network_volumes") == 56375
+
+    expected_gold = sum(
+        service._calculate_conversion(Decimal('100.00') + i, FIXING_PRICE)[0]
+        for i in range(1, 251))
+    assert Decimal(str(result['total_gold'])) == expected_gold
+
+
+@pytest.mark.asyncio
+async def test_failed_shard_rolls_back_every_shard(db_path, database):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM gold_accounts WHERE user_id = 200"))
+    engine.dispose()
+    service = WeeklyGoldDistribution(database=database, shard_workers=4)
+
+    with pytest.raises(Exception, match="shards failed"):
+        await service.process_distribution(FIXING_PRICE, mode=MODE_SHARDED)
+
+    assert _scalar(db_path, "SELECT status FROM weekly_distribution_logs") == 'failed'
+    assert _scalar(db_path, "SELECT COUNT(*) FROM transactions") == 0
+    assert _scalar(db_path, "SELECT COUNT(*) FROM distribution_journal") == 0
+    assert _scalar(db_path, "SELECT SUM(balance) FROM gold_accounts") == 0
+    assert _scalar(db_path, "SELECT SUM(personal_volume) FROM network_volumes") == 0
+    assert _scalar(db_path,
+                   "SELECT COUNT(*) FROM money_accounts WHERE balance = 0") == 0
+
+
+def test_sync_database_url():
+    assert sync_database_url("sqlite+aiosqlite:///tmp/x.db") == "sqlite:///tmp/x.db"
+    assert sync_database_url(
+        "postgresql+asyncpg://u:p@db/gold") == "postgresql://u:p@db/gold"
@@ -0,0 +1,168 @@
+import shutil
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, text
+from app.database import DatabaseManager
+from app.services.gold.weekly_distribution import (WeeklyGoldDistribution,
+                                                   MODE_ROW, MODE_BULK)
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.gold]
+
+FIXING_PRICE = Decimal('85.13')
+
+
+def _scalar(db_path, query):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        value = conn.execute(text(query)).scalar()
+    engine.dispose()
+    return value
+
+
+def _execute(db_path, *statements):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+    engine.dispose()
+
+
+def _rows(db_path, query):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        rows = conn.execute(text(query)).all()
+    engine.dispose()
+    return rows
+
+
+BALANCES = ("SELECT m.user_id, m.balance, g.balance FROM money_accounts m "
+            "JOIN gold_accounts g ON g.user_id = m.user_id ORDER BY m.user_id")
+LEDGER = ("SELECT user_id, amount, processing_fee, net_amount, transaction_type, status "
+          "FROM transactions ORDER BY user_id")
+
+
+async def test_bulk_matches_row_totals(db_path, database, tmp_path):
+    # Stesso database di partenza per le due modalità
+    row_path = tmp_path / 'row.db'
+    shutil.copy(db_path, row_path)
+    row_database = DatabaseManager(f"sqlite+aiosqlite:///{row_path}")
+    row_database.engine.sync_engine.echo = False
+
+    row = await WeeklyGoldDistribution(database=row_database).process_distribution(
+        FIXING_PRICE, mode=MODE_ROW)
+    await row_database.engine.dispose()
+    service = WeeklyGoldDistribution(database=database, bulk_chunk_size=40)
+    bulk = await service.process_distribution(FIXING_PRICE, mode=MODE_BULK)
+
+    assert row['status'] == bulk['status'] == 'success'
+    assert row['users_processed'] == bulk['users_processed'] == 250
+    assert bulk['chunks'] == 7
+    assert (row['total_euro'], row['total_gold']) == (bulk['total_euro'], bulk['total_gold'])
+    assert _rows(row_path, BALANCES) == _rows(db_path, BALANCES)
+    assert _rows(row_path, LEDGER) == _rows(db_path, LEDGER)
+    assert len(_rows(db_path, LEDGER)) == 250
+    assert _scalar(db_path,
+                   "SELECT COUNT(*) FROM money_accounts WHERE balance != 0") == 0
+
+
+async def test_bulk_resumes_from_last_checkpoint(db_path, database):
+    service = WeeklyGoldDistribution(database=database, bulk_chunk_size=50)
+    apply_chunk = service._apply_chunk
+    calls = {'count': 0}
+
+    async def failing_chunk(*args, **kwargs):
+        calls['count'] += 1
+        if calls['count'] == 3:
+            raise RuntimeError("simulated crash")
+        return await apply_chunk(*args, **kwargs)
+
+    service._apply_chunk = failing_chunk
+    with pytest.raises(Exception, match="simulated crash"):
+        await service.process_distribution(FIXING_PRICE, mode=MODE_BULK)
+
+    assert _scalar(db_path, "SELECT last_user_id FROM weekly_distribution_logs") == 100
+    assert _scalar(db_path, "SELECT COUNT(*) FROM transactions") == 100
+
+    with pytest.raises(Exception, match="in progress"):
+        await service.process_distribution(Decimal('90.00'), mode=MODE_BULK)
+
+    service._apply_chunk = apply_chunk
+    result = await service.process_distribution(FIXING_PRICE, mode=MODE_BULK)
+
+    assert result['resumed'] is True
+    assert result['users_processed'] == 250
+    assert _scalar(db_path, "SELECT COUNT(*) FROM transactions") == 250
+    assert _scalar(db_path, "SELECT status FROM weekly_distribution_logs") == 'completed'
+
+
+async def test_unknown_mode_rejected(database):
+    service = WeeklyGoldDistribution(database=database)
+    with pytest.raises(ValueError):
+        await service.process_distribution(FIXING_PRICE, mode='parallel')
+
+
+async def test_bulk_run_can_be_rolled_back_from_journal(db_path, database):
+    service = WeeklyGoldDistribution(database=database, bulk_chunk_size=100)
+    result = await service.process_distribution(FIXING_PRICE, mode=MODE_BULK)
+
+    assert _scalar(db_path, "SELECT COUNT(*) FROM distribution_journal") == 500
+    # Deposito e movimento d'oro committati tra la run e il ripristino
+    _execute(db_path, "UPDATE money_accounts SET balance = balance + 25 WHERE user_id = 1",
+             "UPDATE gold_accounts SET balance = balance + 0.5 WHERE user_id = 2")
+
+    assert await service.backup.restore_distribution(result['distribution_id'])
+    assert _scalar(db_path, "SELECT COUNT(*) FROM money_accounts WHERE balance = 0") == 0
+    assert _scalar(db_path, "SELECT balance FROM money_accounts WHERE user_id = 1") == 126
+    assert _scalar(db_path, "SELECT balance FROM gold_accounts WHERE user_id = 2") == 0.5
+    assert _scalar(db_path, "SELECT SUM(balance) FROM gold_accounts") == 0.5
+
+
+async def test_restored_crashed_run_is_not_resumed(db_path, database):
+    service = WeeklyGoldDistribution(database=database, bulk_chunk_size=50)
+    apply_chunk = service._apply_chunk
+    calls = {'count': 0}
+
+    async def failing_chunk(*args, **kwargs):
+        calls['count'] += 1
+        if calls['count'] == 3:
+            raise RuntimeError("simulated crash")
+        return await apply_chunk(*args, **kwargs)
+
+    service._apply_chunk = failing_chunk
+    with pytest.raises(Exception, match="simulated crash"):
+        await service.process_distribution(FIXING_PRICE, mode=MODE_BULK)
+    assert await service.backup.restore_distribution(1)
+
+    # Ledger e volumi annullati, log chiuso
+    assert _scalar(db_path, "SELECT COUNT(*) FROM transactions") == 0
+    assert _scalar(db_path, "SELECT SUM(personal_volume) FROM network_volumes") == 0
+    assert _scalar(db_path, "SELECT status FROM weekly_distribution_logs") == 'restored'
+
+    service._apply_chunk = apply_chunk
+    result = await service.process_distribution(FIXING_PRICE, mode=MODE_BULK)
+
+    assert result['resumed'] is False and result['users_processed'] == 250
+    assert _scalar(db_path, "SELECT COUNT(*) FROM transactions") == 250
+    assert _scalar(db_path,
+                   "SELECT COUNT(*) FROM money_accounts WHERE balance != 0") == 0
+
+
+async def test_restore_reverses_achievement_rewards(db_path, database):
+    # L'utente 1 e il suo referrer 300, fuori dalla coorte, superano il bronzo
+    _execute(db_path, "UPDATE money_accounts SET balance = 6000 WHERE user_id = 1",
+             "INSERT INTO gold_accounts (user_id, balance) VALUES (300, 0)",
+             "INSERT INTO noble_relations (referrer_id, referred_id, level) VALUES (300, 1, 1)")
+    service = WeeklyGoldDistribution(database=database, bulk_chunk_size=100)
+    result = await service.process_distribution(FIXING_PRICE, mode=MODE_BULK)
+    assert _scalar(db_path, "SELECT COUNT(*) FROM achievement_awards") == 2
+
+    assert await service.backup.restore_distribution(result['distribution_id'])
+    assert _scalar(db_path, "SELECT COUNT(*) FROM achievement_awards") == 0
+    assert _scalar(db_path, "SELECT COUNT(*) FROM gold_rewards") == 0
+    assert _scalar(db_path, "SELECT ROUND(SUM(balance), 4) FROM gold_accounts") == 0
+
+    rerun = await service.process_distribution(FIXING_PRICE, mode=MODE_BULK)
+    assert rerun['status'] == 'success'
+    assert _scalar(db_path, "SELECT COUNT(*) FROM achievement_awards") == 2
+    assert _scalar(db_path, "SELECT COUNT(*) FROM gold_rewards") == 2
+    assert _scalar(db_path, "SELECT balance FROM gold_accounts WHERE user_id = 300") == 0.1
@@ -0,0 +1,126 @@
+import asyncio
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, text
+from app.database import DatabaseManager
+from app.models.achievement import AchievementAward
+from app.models.models import GoldAccount, GoldReward, NobleRelation
+from app.models.network_volume import NetworkVolume
+from app.services.achievement_engine import AchievementEngine
+from app.services.bonus_distribution_service import PremiumDistributionService
+from app.services.network_volume_service import record_volumes
+
+THRESHOLDS = {'silver': Decimal('10000'), 'bronze': Decimal('5000'),
+              'gold': Decimal('25000')}
+REWARDS = {'bronze': Decimal('0.1000'), 'silver': Decimal('0.2500'),
+           'gold': Decimal('0.5000')}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'achievements.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for table in (GoldAccount, GoldReward, AchievementAward, NobleRelation, NetworkVolume):
+            table.__table__.create(conn)
+        conn.execute(insert(GoldAccount.__table__),
+                     [{'user_id': u, 'balance': Decimal('0')} for u in (1, 2)])
+        conn.execute(insert(NobleRelation.__table__),
+                     [{'referrer_id': 1, 'referred_id': 2, 'level': 1}])
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+def _scalar(db_path, query):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        value = conn.execute(text(query)).scalar()
+    engine.dispose()
+    return value
+
+
+def test_crossed_uses_sorted_bounds():
+    engine = AchievementEngine(THRESHOLDS, REWARDS)
+    assert engine.levels == ['bronze', 'silver', 'gold']
+    assert engine.crossed(Decimal('4999.99'), Decimal('5000')) == ['bronze']
+    assert engine.crossed(Decimal('5000'), Decimal('9999')) == []
+    assert engine.crossed(Decimal('0'), Decimal('30000')) == ['bronze', 'silver', 'gold']
+    assert engine.crossed(Decimal('30000'), Decimal('100')) == []
+    assert engine.level_for(Decimal('12000')) == 'silver'
+    assert engine.level_for(Decimal('10')) is None
+    with pytest.raises(ValueError):
+        AchievementEngine(THRESHOLDS, {'bronze': Decimal('1')})
+
+
+@pytest.mark.asyncio
+async def test_threshold_is_paid_once_under_concurrency(db_path, database):
+    engine = AchievementEngine(THRESHOLDS, REWARDS)
+
+    async def award():
+        async with database.get_async_session() as session:
+            return await engine.award(session, 1, Decimal('0'), Decimal('12000'))
+
+    results = await asyncio.gather(*[award() for _ in range(4)])
+    await database.engine.dispose()
+
+    assert sorted(len(r) for r in results) == [0, 0, 0, 2]
+    assert _scalar(db_path, "SELECT COUNT(*) FROM achievement_awards") == 2
+    assert _scalar(db_path, "SELECT COUNT(*) FROM gold_rewards") == 2
+    assert _scalar(db_path, "SELECT balance FROM gold_accounts WHERE user_id = 1") == 0.35
+
+
+@pytest.mark.asyncio
+async def test_premium_service_rewards_only_on_crossing(db_path, database):
+    service = PremiumDistributionService(database=database)
+
+    async def purchase(user_id, amount):
+        # Il volume lo registra chi salva l'acquisto, il servizio lo legge soltanto
+        async with database.get_async_session() as session:
+            await record_volumes(session, [(user_id, Decimal(amount))])
+        return await service.distribute_achievement_reward(
+            user_id, Decimal(amount), Decimal('85.13'))
+
+    result = await purchase(2, '4000')
+    assert result['status'] == 'no_achievement' and result['total_volume'] == '4000.00'
+    result = await purchase(2, '1500')
+    assert result['status'] == 'success' and result['achievement_level'] == 'bronze'
+    # Il volume di rete del referrer passa 5500 nella stessa transazione
+    assert result['upline_awards'] == {1: ['bronze']}
+    assert (await purchase(2, '100'))['status'] == 'no_achievement'
+
+    # Il bronze del referrer non si perde né si ripaga: il suo acquisto porta a silver
+    result = await purchase(1, '5000')
+    await database.engine.dispose()
+    assert result['levels'] == ['silver'] and result['total_volume'] == '10600.00'
+    assert _scalar(db_path, "SELECT SUM(reward_amount) FROM gold_rewards") == 0.45
+    assert _scalar(db_path, "SELECT balance FROM gold_accounts WHERE user_id = 1") == 0.35
+
+
+@pytest.mark.asyncio
+async def test_record_volumes_awards_uplines_up_to_third_level(db_path, database):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(insert(GoldAccount.__table__),
+                     [{'user_id': u, 'balance': Decimal('0')} for u in (3, 4, 5)])
+        # Catena 1 <- 2 <- 3 <- 4 <- 5: da 5 risalgono 4, 3, 2 (1 è al 4° livello)
+        conn.execute(insert(NobleRelation.__table__), [
+            {'referrer_id': referrer, 'referred_id': referred, 'level': referred - referrer}
+            for referred in (3, 4, 5) for referrer in range(max(1, referred - 3), referred)])
+    engine.dispose()
+
+    async with database.get_async_session() as session:
+        awards = await record_volumes(session, [(5, Decimal('6000'))],
+                                      AchievementEngine(THRESHOLDS, REWARDS))
+    await database.engine.dispose()
+
+    assert {user_id: [a['level'] for a in awarded]
+            for user_id, awarded in awards.items()} == {2: ['bronze'], 3: ['bronze'],
+                                                        4: ['bronze'], 5: ['bronze']}
+    assert _scalar(db_path, "SELECT COUNT(*) FROM achievement_awards WHERE user_id = 1") == 0
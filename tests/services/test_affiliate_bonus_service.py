@@ -0,0 +1,63 @@
+import pytest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine
+from app.database import DatabaseManager
+from app.models.affiliate_bonus import AffiliateBonusWeek
+from app.services.affiliate_bonus_service import (AffiliateBonusService,
+                                                  record_affiliate_bonuses,
+                                                  record_affiliate_bonuses_sync)
+
+pytestmark = [pytest.mark.asyncio]
+
+MONDAY = datetime(2026, 10, 12, 9, 30)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'affiliate.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        AffiliateBonusWeek.__table__.create(conn)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+async def test_credits_accumulate_per_week_and_level(db_path, database):
+    async with database.get_async_session() as session:
+        await record_affiliate_bonuses(session, [(1, 1, Decimal('0.0700'), 1),
+                                                 (1, 2, Decimal('0.0500'), 1)], MONDAY)
+        await record_affiliate_bonuses(session, [(1, 1, Decimal('0.0300'), 2),
+                                                 (2, 1, Decimal('0'), 1)],
+                                       MONDAY + timedelta(days=6))
+        await record_affiliate_bonuses(session, [(1, 3, Decimal('0.0100'), 1)],
+                                       MONDAY - timedelta(days=1))
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        record_affiliate_bonuses_sync(conn, [(1, 2, Decimal('0.0500'), 1)], MONDAY)
+    engine.dispose()
+
+    result = await AffiliateBonusService.get_earnings(1, weeks=2, until=MONDAY, database=database)
+    assert result['status'] == 'success'
+    assert result['weeks'] == [
+        {'week_start': '2026-10-12T00:00:00', 'levels': {'1': '0.1000', '2': '0.1000'},
+         'total': '0.2000', 'bonuses': 5},
+        {'week_start': '2026-10-05T00:00:00', 'levels': {'3': '0.0100'},
+         'total': '0.0100', 'bonuses': 1},
+    ]
+    assert result['total'] == '0.2100'
+
+    # Solo la settimana corrente; utente senza bonus
+    assert len((await AffiliateBonusService.get_earnings(
+        1, weeks=1, until=MONDAY, database=database))['weeks']) == 1
+    empty = await AffiliateBonusService.get_earnings(2, until=MONDAY, database=database)
+    await database.engine.dispose()
+    assert empty['weeks'] == [] and empty['total'] == '0'
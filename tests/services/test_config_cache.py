@@ -0,0 +1,121 @@
+import pytest
+from decimal import Decimal
+from types import SimpleNamespace
+from sqlalchemy import create_engine, event, insert
+from app.database import DatabaseManager
+from app.models.models import BonusRate, NobleRank, Parameter
+from app.models.config_version import ConfigVersion
+from app.services.config_cache import ConfigCache, DEFAULT_BONUS_RATES, bump_version
+
+pytestmark = [pytest.mark.asyncio]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'config.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for table in (Parameter, BonusRate, NobleRank, ConfigVersion):
+            table.__table__.create(conn)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+def _write(db_path, *statements):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(statement)
+        bump_version(conn)
+    engine.dispose()
+
+
+def _count_queries(database):
+    queries = []
+    event.listen(database.engine.sync_engine, 'before_cursor_execute',
+                 lambda *args: queries.append(args[2]))
+    return queries
+
+
+async def test_snapshot_reloads_only_on_version_change(db_path, database):
+    cache = ConfigCache(check_interval=0)
+    await cache.ensure_fresh(database)
+    assert cache.snapshot.version == 0
+    assert cache.bonus_rates == DEFAULT_BONUS_RATES
+
+    _write(db_path,
+           insert(BonusRate.__table__).values(id=1, level=1, rate=Decimal('0.0100'), name='Bronze'),
+           insert(Parameter.__table__).values(key='commission_rate', value='0.02'),
+           insert(NobleRank.__table__).values(name='Bronze', level=1, bonus_rate_id=1))
+    await cache.ensure_fresh(database)
+    assert cache.snapshot.version == 1
+    assert cache.bonus_rate(1) == Decimal('0.0100')
+    assert cache.bonus_rate(2) == Decimal('0')
+    assert cache.parameter('commission_rate') == '0.02'
+    assert cache.noble_ranks[0]['name'] == 'Bronze'
+    assert cache.noble_ranks[0]['bonus_rate'] == Decimal('0.0100')
+
+    # Versione invariata: un solo SELECT sul contatore, nessuna ricarica
+    queries = _count_queries(database)
+    snapshot = cache.snapshot
+    await cache.ensure_fresh(database)
+    await database.engine.dispose()
+    assert cache.snapshot is snapshot
+    assert len(queries) == 1 and 'config_versions' in queries[0]
+
+
+async def test_reads_between_checks_hit_no_database(db_path, database):
+    cache = ConfigCache(check_interval=3600)
+    await cache.ensure_fresh(database)
+    queries = _count_queries(database)
+
+    _write(db_path, insert(Parameter.__table__).values(key='transformation_rate', value='1.5'))
+    await cache.ensure_fresh(database)
+    assert queries == []
+    assert cache.parameter('transformation_rate') is None
+
+    cache.invalidate()
+    await cache.ensure_fresh(database)
+    await database.engine.dispose()
+    assert cache.parameter('transformation_rate') == '1.5'
+
+
+async def test_missing_tables_keep_last_snapshot(tmp_path, caplog):
+    database = DatabaseManager(f"sqlite+aiosqlite:///{tmp_path / 'empty.db'}")
+    database.engine.sync_engine.echo = False
+    cache = ConfigCache()
+    await cache.ensure_fresh(database)
+    await database.engine.dispose()
+    assert cache.bonus_rate(1) == Decimal('0.007')
+    assert 'using default bonus rates' in caplog.text
+
+
+async def test_noble_bonus_uses_default_rates_per_level(tmp_path, monkeypatch, caplog):
+    from app.services import blockchain_noble_service as noble
+    database = DatabaseManager(f"sqlite+aiosqlite:///{tmp_path / 'empty.db'}")
+    database.engine.sync_engine.echo = False
+    monkeypatch.setattr(noble, 'db', database)
+    monkeypatch.setattr(noble, 'config_cache', ConfigCache())
+    service = noble.ServizioNobileBlockchain(
+        blockchain_service=SimpleNamespace(w3=SimpleNamespace()))
+
+    bonuses = {}
+    for rank in (1, 2, 3, 4):
+        async def verify(address, min_rank, rank=rank):
+            return {'is_valid': True, 'current_rank': rank}
+        monkeypatch.setattr(service, 'verify_noble_status', verify)
+        result = await service.calculate_noble_bonus('0xabc', Decimal('1000'))
+        bonuses[rank] = result['bonus_amount']
+    await database.engine.dispose()
+
+    # Stessi valori della tabella fissa precedente: 0.7%, 0.5%, 0.5%
+    assert bonuses == {1: Decimal('7.00'), 2: Decimal('5.00'), 3: Decimal('5.00'),
+                       4: Decimal('0.00')}
+    assert 'using default bonus rates' in caplog.text
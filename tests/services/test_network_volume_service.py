@@ -0,0 +1,100 @@
+import pytest
+from decimal import Decimal
+from datetime import datetime
+from sqlalchemy import create_engine, insert, text
+from app.database import DatabaseManager
+from app.models.models import (NobleRelation, Transaction, TransactionType,
+                               GoldTransformation)
+from app.models.network_volume import NetworkVolume
+from app.services.network_volume_service import NetworkVolumeService, record_volumes
+
+pytestmark = [pytest.mark.asyncio]
+
+# 1 <- 2 <- 3 <- 4 <- 5: il 4° livello (1 per l'utente 5) non conta
+RELATIONS = [{'referrer_id': referred - level, 'referred_id': referred, 'level': level}
+             for referred in range(2, 6) for level in range(1, 4) if referred - level >= 1]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'volumes.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for table in (NobleRelation, Transaction, GoldTransformation, NetworkVolume):
+            table.__table__.create(conn)
+        conn.execute(insert(NobleRelation.__table__), RELATIONS)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+def _volumes(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT user_id, personal_volume, network_volume FROM network_volumes "
+            "ORDER BY user_id")).all()
+    engine.dispose()
+    return {user_id: (Decimal(str(p)), Decimal(str(n))) for user_id, p, n in rows}
+
+
+async def test_record_volumes_updates_buyer_and_three_levels(db_path, database):
+    async with database.get_async_session() as session:
+        await record_volumes(session, [(5, Decimal('100.00')), (3, Decimal('40.50'))])
+    async with database.get_async_session() as session:
+        await record_volumes(session, [(5, Decimal('10.00'))])
+
+    assert _volumes(db_path) == {
+        1: (Decimal('0'), Decimal('40.50')),
+        2: (Decimal('0'), Decimal('150.50')),
+        3: (Decimal('40.50'), Decimal('110.00')),
+        4: (Decimal('0'), Decimal('110.00')),
+        5: (Decimal('110.00'), Decimal('0')),
+    }
+    assert await NetworkVolumeService.get_volume(3, database) == {
+        'personal': Decimal('40.50'), 'network': Decimal('110.00'),
+        'total': Decimal('150.50')}
+    assert (await NetworkVolumeService.get_volume(99, database))['total'] == 0
+    await database.engine.dispose()
+
+
+async def test_volumes_roll_back_with_the_transaction(db_path, database):
+    with pytest.raises(RuntimeError):
+        async with database.get_async_session() as session:
+            await record_volumes(session, [(5, Decimal('100.00'))])
+            raise RuntimeError("purchase failed")
+    await database.engine.dispose()
+    assert _volumes(db_path) == {}
+
+
+async def test_rebuild_matches_incremental_counters(db_path, database):
+    now = datetime.utcnow()
+    purchases = [(5, Decimal('100.00')), (3, Decimal('40.50')), (2, Decimal('7.25'))]
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(insert(Transaction.__table__), [
+            {'user_id': u, 'amount': a, 'transaction_type': TransactionType.GOLD_PURCHASE,
+             'status': 'completed', 'date': now} for u, a in purchases[:2]] + [
+            {'user_id': 4, 'amount': Decimal('999'), 'transaction_type': TransactionType.DEPOSIT,
+             'status': 'completed', 'date': now}])
+        conn.execute(insert(GoldTransformation.__table__), [
+            {'user_id': 2, 'euro_amount': Decimal('7.25'), 'gold_grams': Decimal('0.08'),
+             'fixing_price': Decimal('85.13'), 'status': 'verified', 'created_at': now},
+            {'user_id': 2, 'euro_amount': Decimal('50'), 'gold_grams': Decimal('0.5'),
+             'fixing_price': Decimal('85.13'), 'status': 'failed', 'created_at': now}])
+    engine.dispose()
+
+    async with database.get_async_session() as session:
+        await record_volumes(session, purchases)
+    incremental = _volumes(db_path)
+
+    result = await NetworkVolumeService.rebuild(database)
+    await database.engine.dispose()
+    assert result['status'] == 'success' and result['users'] == 5
+    assert _volumes(db_path) == incremental
@@ -0,0 +1,125 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, text
+from app.database import DatabaseManager
+from app.models.config_version import ConfigVersion
+from app.models.models import BonusRate, NobleRank, NobleRelation, Parameter, User
+from app.models.network_volume import NetworkVolume
+from app.models.rank import RankChange
+from app.models.referral_interval import ReferralInterval
+from app.services.config_cache import config_cache
+from app.services.mock_blockchain_service import MockBlockchainService
+from app.services.network_volume_service import record_volumes
+from app.services.rank_engine import RankEngine
+from app.services.referral_service import ReferralService
+
+pytestmark = [pytest.mark.asyncio]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'ranks.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for table in (User, Parameter, BonusRate, NobleRank, ConfigVersion,
+                      NobleRelation, NetworkVolume, RankChange, ReferralInterval):
+            table.__table__.create(conn)
+        conn.execute(insert(User.__table__), [
+            {'id': u, 'customer_code': f"C{u}", 'email': f"u{u}@x", 'password_hash': 'x',
+             'name': f"Utente {u}", 'tax_code': f"TX{u}"} for u in range(1, 9)])
+        # Id diversi dai livelli, per distinguere le due cose
+        conn.execute(insert(NobleRank.__table__), [
+            {'id': level * 10, 'name': name, 'level': level}
+            for level, name in ((1, 'Bronze'), (2, 'Silver'), (3, 'Gold'))])
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    config_cache.invalidate()
+    yield manager
+    config_cache.invalidate()
+
+
+def _scalar(db_path, query):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        value = conn.execute(text(query)).scalar()
+    engine.dispose()
+    return value
+
+
+async def _purchase(database, user_id, amount):
+    async with database.get_async_session() as session:
+        await record_volumes(session, [(user_id, Decimal(amount))])
+
+
+async def test_only_dirty_users_are_evaluated(db_path, database):
+    # 1 <- 2 <- 3 <- 4 <- 5
+    pairs = [(1, 2), (2, 3), (3, 4), (4, 5)]
+    await ReferralService().import_referrals(pairs, database=database)
+    engine = RankEngine(database, batch_size=2)
+
+    first = await engine.recompute()
+    assert first['evaluated'] == 4 and first['changed'] == 0
+    assert (await engine.recompute())['evaluated'] == 0
+
+    # Acquisto di 5: dirty l'acquirente e i 3 livelli sopra, non l'utente 1
+    await _purchase(database, 5, '6000')
+    result = await engine.recompute()
+    assert result['evaluated'] == 4
+    assert sorted((c['user_id'], c['previous_rank'], c['new_rank'])
+                  for c in result['changes']) == [(2, 0, 1), (3, 0, 1), (4, 0, 1), (5, 0, 1)]
+
+    # Sotto la soglia successiva: rivalutati ma nessun cambio
+    await _purchase(database, 5, '100')
+    assert (await engine.recompute())['changed'] == 0
+    await _purchase(database, 4, '20000')
+    result = await engine.recompute()
+    await database.engine.dispose()
+    assert {(c['user_id'], c['new_rank']) for c in result['changes']} == {(4, 3), (3, 3), (2, 3), (1, 2)}
+    assert _scalar(db_path, "SELECT COUNT(*) FROM rank_changes") == 8
+    assert _scalar(db_path, "SELECT noble_rank_id FROM users WHERE id = 4") == 30
+    assert _scalar(db_path, "SELECT noble_rank_id FROM users WHERE id = 1") == 20
+
+
+async def test_rank_is_capped_at_the_highest_configured_level(db_path, database):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM noble_ranks WHERE level = 3"))
+    engine.dispose()
+    await _purchase(database, 6, '30000')
+    result = await RankEngine(database).recompute()
+    await database.engine.dispose()
+    assert [(c['user_id'], c['new_rank']) for c in result['changes']] == [(6, 2)]
+    assert _scalar(db_path, "SELECT noble_rank_id FROM users WHERE id = 6") == 20
+
+
+async def test_push_sends_latest_rank_once_per_user(db_path, database):
+    engine = RankEngine(database)
+    await _purchase(database, 7, '6000')
+    await engine.recompute()
+    await _purchase(database, 7, '20000')
+    await _purchase(database, 8, '12000')
+    await engine.recompute()
+
+    sent = []
+    chain = MockBlockchainService()
+
+    async def update_noble_ranks(updates):
+        sent.extend(updates)
+        return [{'status': 'verified', 'transaction_hash': f"0x{i}"} for i, _ in enumerate(updates)]
+    chain.update_noble_ranks = update_noble_ranks
+
+    result = await engine.push_pending(chain, {7: '0xaaa'})
+    assert result == {'status': 'success', 'pushed': 1, 'failed': 0, 'unknown': 0,
+                      'skipped': 1}
+    assert sent == [('0xaaa', 3)]
+    assert _scalar(db_path, "SELECT COUNT(*) FROM rank_changes WHERE pushed_at IS NULL") == 1
+
+    result = await engine.push_pending(chain, {7: '0xaaa', 8: '0xbbb'})
+    await database.engine.dispose()
+    assert result['pushed'] == 1 and sent[-1] == ('0xbbb', 2)
@@ -0,0 +1,94 @@
+import pytest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, text
+from app.database import DatabaseManager
+from app.models.models import Transaction, TransactionType
+from app.utils.monitoring.receipt_reconciler import ReceiptReconciler
+from tests.performance.rpc_stand_in import StandInNode, _receipt
+
+pytestmark = [pytest.mark.asyncio]
+
+NOW = datetime(2026, 10, 16, 12, 0)
+
+
+def _hash(tx_id, outcome):
+    return '0x' + f'{tx_id:062x}' + outcome
+
+
+def _receipt_for(params):
+    """Ultimo byte dell'hash: 01 riuscita, 00 fallita, ff non minata, ee errore del nodo"""
+    outcome = params[0][-2:]
+    if outcome == 'ee':
+        raise ValueError('header not found')
+    if outcome == 'ff':
+        return None
+    return dict(_receipt(params[0]), status='0x1' if outcome == '01' else '0x0')
+
+
+@pytest.fixture
+def node():
+    with StandInNode(latency=0.001,
+                     methods={'eth_getTransactionReceipt': _receipt_for}) as stand_in:
+        yield stand_in
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'receipts.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        Transaction.__table__.create(conn)
+        outcomes = ['01', '00', 'ff', 'ee']
+        rows = [{'id': tx_id, 'status': 'pending', 'date': NOW - timedelta(hours=2),
+                 'blockchain_tx': _hash(tx_id, outcomes[tx_id % 4])} for tx_id in range(1, 33)]
+        # Troppo recente, senza hash, già confermata
+        rows += [{'id': 33, 'status': 'pending', 'date': NOW - timedelta(minutes=5),
+                  'blockchain_tx': _hash(33, '01')},
+                 {'id': 34, 'status': 'pending', 'date': NOW - timedelta(hours=2),
+                  'blockchain_tx': None},
+                 {'id': 35, 'status': 'completed', 'date': NOW - timedelta(hours=2),
+                  'blockchain_tx': _hash(35, '00')}]
+        conn.execute(insert(Transaction.__table__), [
+            dict(row, user_id=1, amount=Decimal('10'),
+                 transaction_type=TransactionType.GOLD_PURCHASE) for row in rows])
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+def _statuses(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        rows = dict(conn.execute(text("SELECT id, status FROM transactions")).all())
+    engine.dispose()
+    return rows
+
+
+async def test_pending_transactions_are_reconciled_per_page(db_path, database, node):
+    reconciler = ReceiptReconciler(node.url, database, page_size=10, batch_size=4,
+                                   max_concurrency=2)
+    result = await reconciler.run(now=NOW)
+
+    assert result['status'] == 'success'
+    assert (result['checked'], result['completed'], result['failed'],
+            result['still_pending'], result['rpc_errors']) == (32, 8, 8, 16, 8)
+    # Pagine da 10, 10, 10 e 2 hash, in batch da al più 4
+    assert node.requests == 10 and reconciler.metrics['rpc_batches'] == 10
+
+    statuses = _statuses(db_path)
+    assert all(statuses[tx_id] == {0: 'completed', 1: 'failed'}.get(tx_id % 4, 'pending')
+               for tx_id in range(1, 33))
+    assert (statuses[33], statuses[34], statuses[35]) == ('pending', 'pending', 'completed')
+
+    # Il giro successivo rilegge solo quelle rimaste in attesa
+    again = await reconciler.run(now=NOW)
+    await database.engine.dispose()
+    assert again['checked'] == 16 and again['completed'] == 0
+    assert reconciler.metrics['runs'] == 2 and reconciler.metrics['checked'] == 48
@@ -0,0 +1,112 @@
+import pytest
+from sqlalchemy import create_engine, insert, text
+from app.database import DatabaseManager
+from app.models.models import NobleRelation
+from app.models.referral_interval import ReferralInterval
+from app.models.network_volume import NetworkVolume
+from app.services.referral_service import ReferralService, plan_referral_import
+from tests.performance.synthetic_population import PopulationSpec, parent_of, upline
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'referrals.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        NobleRelation.__table__.create(conn)
+        ReferralInterval.__table__.create(conn)
+        NetworkVolume.__table__.create(conn)
+        # Albero esistente 1 <- 2 <- 3
+        conn.execute(insert(NobleRelation.__table__), [
+            {'referrer_id': 1, 'referred_id': 2, 'level': 1},
+            {'referrer_id': 2, 'referred_id': 3, 'level': 1},
+            {'referrer_id': 1, 'referred_id': 3, 'level': 2}])
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+def _relations(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        rows = set(conn.execute(text(
+            "SELECT referrer_id, referred_id, level FROM noble_relations")).all())
+    engine.dispose()
+    return rows
+
+
+def test_plan_rejects_self_referrals_conflicts_and_cycles():
+    parents = {2: 1, 3: 2}
+    rows, rejected = plan_referral_import(
+        [(4, 4), (9, 2), (5, 6), (7, 6), (6, 8), (8, 1), (1, 3)], parents, 3)
+
+    assert {(r['referred_id'], r['reason']) for r in rejected} == {
+        (4, 'self_referral'), (2, 'already_referred'), (3, 'already_referred'),
+        (6, 'conflicting_referrer')}
+    # Valide: 5 <- 6 <- 8 <- 1 (1 era una radice con downline 2, 3)
+    assert sorted(rows) == [(5, 1, 3), (5, 6, 1), (5, 8, 2), (6, 1, 2), (6, 2, 3),
+                            (6, 8, 1), (8, 1, 1), (8, 2, 2), (8, 3, 3)]
+
+    # 1 -> 3 chiude 1 <- 2 <- 3 <- 1; 10 <- 11 <- 10 è un ciclo tra nuove coppie
+    rows, rejected = plan_referral_import([(3, 1), (10, 11), (11, 10), (3, 12)], parents, 3)
+    assert {(r['referred_id'], r['reason']) for r in rejected} == {
+        (1, 'cycle'), (10, 'cycle'), (11, 'cycle')}
+    assert sorted(rows) == [(1, 12, 3), (2, 12, 2), (3, 12, 1)]
+
+
+def test_plan_links_existing_downline_of_referred_user():
+    # 5 ha già la downline 5 <- 6 <- 7: collegarlo a 4 crea anche (4, 6, 2) e (4, 7, 3)
+    assert plan_referral_import([(4, 5)], {6: 5, 7: 6}, 3) == (
+        [(4, 5, 1), (4, 6, 2), (4, 7, 3)], [])
+    # Oltre il 3° livello la downline non riceve righe
+    rows, _ = plan_referral_import([(3, 4), (2, 3)], {5: 4, 6: 5, 7: 6}, 3)
+    assert sorted(rows) == [(2, 3, 1), (2, 4, 2), (2, 5, 3), (3, 4, 1), (3, 5, 2),
+                            (3, 6, 3)]
+
+
+@pytest.mark.asyncio
+async def test_import_writes_closure_rows_in_one_transaction(db_path, database):
+    result = await ReferralService().import_referrals(
+        [(3, 4), (4, 5), (4, 6), (3, 4)], database=database, chunk_size=2)
+
+    assert result['status'] == 'success'
+    assert result['referrals'] == 3 and result['inserted'] == 9
+    assert _relations(db_path) >= {
+        (3, 4, 1), (2, 4, 2), (1, 4, 3),
+        (4, 5, 1), (3, 5, 2), (2, 5, 3),
+        (4, 6, 1), (3, 6, 2), (2, 6, 3)}
+
+    rejected = await ReferralService().import_referrals(
+        [(6, 7), (7, 1)], database=database)
+    await database.engine.dispose()
+    assert rejected['status'] == 'error' and rejected['inserted'] == 0
+    assert len(_relations(db_path)) == 12
+
+
+@pytest.mark.asyncio
+async def test_import_matches_synthetic_forest(tmp_path):
+    spec = PopulationSpec(users=2000, depth=4, fan_out=5)
+    path = tmp_path / 'forest.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        NobleRelation.__table__.create(conn)
+        ReferralInterval.__table__.create(conn)
+        NetworkVolume.__table__.create(conn)
+    engine.dispose()
+    database = DatabaseManager(f"sqlite+aiosqlite:///{path}")
+    database.engine.sync_engine.echo = False
+
+    pairs = [(parent_of(u, spec), u) for u in range(1, spec.users + 1)
+             if parent_of(u, spec) is not None]
+    result = await ReferralService().import_referrals(pairs, database=database)
+    await database.engine.dispose()
+
+    assert result['status'] == 'success' and result['rows_per_second'] > 0
+    assert _relations(path) == {(referrer, u, level) for u in range(1, spec.users + 1)
+                                for referrer, level in upline(u, spec)}
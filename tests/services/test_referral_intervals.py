@@ -0,0 +1,174 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, text
+from app.database import DatabaseManager
+from app.models.models import NobleRelation, GoldAccount, User
+from app.models.referral_interval import ReferralInterval
+from app.models.network_volume import NetworkVolume
+from app.services import referral_intervals as intervals
+from app.services.referral_intervals import ReferralIntervalTree, layout_subtree
+from app.services.referral_service import ReferralService
+from tests.performance.synthetic_population import PopulationSpec, parent_of
+
+SPEC = PopulationSpec(users=400, depth=3, fan_out=4)
+
+
+def _descendants(user_id):
+    return {u for u in range(1, SPEC.users + 1) if u != user_id and _is_below(u, user_id)}
+
+
+def _is_below(user_id, ancestor):
+    parent = parent_of(user_id, SPEC)
+    while parent is not None:
+        if parent == ancestor:
+            return True
+        parent = parent_of(parent, SPEC)
+    return False
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'intervals.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for table in (NobleRelation, ReferralInterval, GoldAccount, NetworkVolume):
+            table.__table__.create(conn)
+        conn.execute(insert(GoldAccount.__table__),
+                     [{'user_id': u, 'balance': Decimal('0.5000')} for u in range(1, SPEC.users + 1)])
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+def _intervals(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        rows = {r.user_id: r for r in conn.execute(text("SELECT * FROM referral_intervals"))}
+    engine.dispose()
+    return rows
+
+
+def _assert_nested(rows):
+    for user_id, row in rows.items():
+        below = {u for u, r in rows.items()
+                 if r.root_id == row.root_id and row.lft < r.lft <= row.rgt}
+        expected = {u for u in rows if u != user_id and _chain_contains(rows, u, user_id)}
+        assert below == expected
+        if row.parent_id is not None:
+            assert row.depth == rows[row.parent_id].depth + 1
+
+
+def _chain_contains(rows, user_id, ancestor):
+    parent = rows[user_id].parent_id
+    while parent is not None:
+        if parent == ancestor:
+            return True
+        parent = rows[parent].parent_id
+    return False
+
+
+def test_layout_leaves_room_for_new_children():
+    children = {1: [2, 3], 2: [4]}
+    rows = {r.user_id: r for r in layout_subtree(1, children, 1, 0, 1023)}
+    assert rows[1].lft == 0 and rows[1].rgt == 1023
+    assert rows[2].lft == 1 and rows[3].lft > rows[2].rgt
+    # Spazio interno diviso per 3 utenti sotto 1 più un posto libero
+    assert rows[2].rgt - rows[2].lft + 1 == 1022 * 2 // 4
+    assert rows[1].rgt - rows[1].next_child + 1 >= 1022 // 4
+    with pytest.raises(intervals.IntervalExhausted):
+        layout_subtree(1, {1: list(range(2, 100))}, 1, 0, 1023)
+
+
+def test_layout_fits_deep_chains():
+    depth = 2000
+    chain = {user_id: [user_id + 1] for user_id in range(1, depth)}
+    rows = {r.user_id: r for r in layout_subtree(1, chain, 1)}
+    assert len(rows) == depth and rows[depth].depth == depth - 1
+    # L'ampiezza cala con la dimensione del sottoalbero, non con la profondità
+    assert rows[depth].rgt - rows[depth].lft + 1 >= intervals.ROOT_SPAN // (2 * depth)
+    assert all(rows[u + 1].lft > rows[u].lft and rows[u + 1].rgt <= rows[u].rgt
+               for u in range(1, depth))
+
+
+@pytest.mark.asyncio
+async def test_import_builds_intervals_matching_the_forest(db_path, database):
+    pairs = [(parent_of(u, SPEC), u) for u in range(1, SPEC.users + 1)
+             if parent_of(u, SPEC) is not None]
+    assert (await ReferralService().import_referrals(pairs, database=database))['status'] == 'success'
+
+    tree = ReferralIntervalTree(database)
+    assert await tree.downline_size(1) == len(_descendants(1))
+    assert await tree.downline_size(2) == len(_descendants(2))
+    assert await tree.subtree_sum(1, GoldAccount.__table__.c.balance) == pytest.approx(
+        0.5 * len(_descendants(1)))
+    assert await tree.subtree_sum(1, GoldAccount.__table__.c.balance, max_depth=1) == 2.0
+    await database.engine.dispose()
+    _assert_nested(_intervals(db_path))
+
+
+@pytest.mark.asyncio
+async def test_online_inserts_relayout_only_when_space_runs_out(db_path, database, monkeypatch):
+    monkeypatch.setattr(intervals, 'ROOT_SPAN', 2 ** 16)
+    tree = ReferralIntervalTree(database)
+    async with database.get_async_session() as session:
+        for user_id in range(2, 40):
+            await tree.add(session, 1, user_id)
+        for user_id in range(40, 45):
+            await tree.add(session, 2, user_id)
+        # Un utente già radice di un albero viene agganciato con tutta la sua downline
+        await tree.add(session, 100, 101)
+        await tree.add(session, 101, 102)
+        await tree.add(session, 44, 100)
+        with pytest.raises(ValueError):
+            await tree.add(session, 3, 101)
+
+    rows = _intervals(db_path)
+    assert len(rows) == 47
+    assert {r.root_id for r in rows.values()} == {1}
+    assert rows[102].depth == 5
+    _assert_nested(rows)
+    assert await tree.downline_size(2) == 8
+    assert await tree.downline_size(102) == 0
+    await database.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_import_of_a_deep_chain(db_path, database):
+    pairs = [(user_id, user_id + 1) for user_id in range(1, SPEC.users)]
+    result = await ReferralService().import_referrals(pairs, database=database)
+    assert result['status'] == 'success'
+
+    tree = ReferralIntervalTree(database)
+    assert await tree.downline_size(1) == SPEC.users - 1
+    assert await tree.downline_size(SPEC.users - 10) == 10
+    async with database.get_async_session() as session:
+        await tree.add(session, SPEC.users, SPEC.users + 1)
+    assert await tree.downline_size(1) == SPEC.users
+    await database.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_active_affiliates_within_depth(db_path, database):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        User.__table__.create(conn)
+        conn.execute(insert(User.__table__), [
+            {'id': u, 'customer_code': f"C{u}", 'email': f"u{u}@x", 'password_hash': 'x',
+             'name': f"Utente {u}", 'tax_code': f"TX{u}", 'is_active': u != 3}
+            for u in range(1, 6)])
+    engine.dispose()
+    tree = ReferralIntervalTree(database)
+    async with database.get_async_session() as session:
+        for referrer, referred in [(1, 2), (2, 3), (3, 4), (4, 5)]:
+            await tree.add(session, referrer, referred)
+
+    assert await tree.active_affiliates(1, max_depth=3) == 2
+    assert await tree.active_affiliates(1, max_depth=4) == 3
+    assert await tree.active_affiliates(99) == 0
+    await database.engine.dispose()
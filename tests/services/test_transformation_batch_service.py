@@ -0,0 +1,174 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, text
+from web3 import Web3
+from app.database import DatabaseManager
+from app.models.models import GoldTransformation
+from app.models.transformation_batch import TransformationBatch, TransformationLeaf
+from app.services.mock_blockchain_service import MockBlockchainService
+from app.services.transformation_batch_service import (MerkleBatchRecorder, build_levels,
+                                                       leaf_hash, proof_for, verify_proof)
+
+NOW = datetime(2026, 10, 16, 12, 0)
+ADDRESSES = {1: '0x' + '11' * 20, 2: '0x' + '22' * 20}
+
+
+class RejectingChain:
+
+    async def submit_transformation_root(self, merkle_root, leaf_count):
+        raise ValueError("Blockchain connection not initialized")
+
+
+class RootLookup:
+    """Legge transformationRoots da `roots`; i reinvii vengono registrati"""
+
+    def __init__(self, roots=()):
+        self.roots = dict(roots)
+        self.submitted = []
+
+    async def transformation_root_committed_at(self, merkle_root):
+        return self.roots.get(Web3.to_hex(merkle_root), 0)
+
+    async def submit_transformation_root(self, merkle_root, leaf_count):
+        self.submitted.append(Web3.to_hex(merkle_root))
+        return await MockBlockchainService().submit_transformation_root(merkle_root, leaf_count)
+
+
+class TimeoutChain:
+
+    async def submit_transformation_root(self, merkle_root, leaf_count):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result({'status': 'timeout', 'message': 'Receipt timeout',
+                           'transaction_hash': '0xabc'})
+        return future
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'batches.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for table in (GoldTransformation, TransformationBatch, TransformationLeaf):
+            table.__table__.create(conn)
+        # 5: non approvata, 6: utente senza indirizzo, 7: dopo la finestra
+        conn.execute(insert(GoldTransformation.__table__), [
+            {'id': tid, 'user_id': user_id, 'euro_amount': Decimal(euro),
+             'gold_grams': Decimal(grams), 'fixing_price': Decimal('85.1300'),
+             'status': status, 'blockchain_status': 'pending', 'created_at': created_at}
+            for tid, user_id, euro, grams, status, created_at in [
+                (1, 1, '100.00', '1.1747', 'completed', NOW - timedelta(days=3)),
+                (2, 2, '250.50', '2.9426', 'verified', NOW - timedelta(days=2)),
+                (3, 1, '100.00', '1.1747', 'completed', NOW - timedelta(days=1)),
+                (4, 2, '10.00', '0.1175', 'completed', NOW - timedelta(hours=1)),
+                (5, 1, '99.00', '1.1629', 'pending', NOW - timedelta(hours=1)),
+                (6, 3, '50.00', '0.5873', 'completed', NOW - timedelta(hours=1)),
+                (7, 1, '20.00', '0.2349', 'completed', NOW + timedelta(hours=1)),
+            ]])
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+def _statuses(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        rows = dict(conn.execute(text(
+            "SELECT id, blockchain_status FROM gold_transformations")).all())
+    engine.dispose()
+    return rows
+
+
+def test_every_leaf_has_a_valid_proof():
+    for size in range(1, 12):
+        leaves = [leaf_hash(i, ADDRESSES[1], 100 * i, 10 * i) for i in range(size)]
+        levels = build_levels(leaves)
+        root = levels[-1][0]
+        for index, leaf in enumerate(leaves):
+            assert verify_proof(leaf, proof_for(levels, index), root)
+        # Importo alterato: la prova non vale più
+        forged = leaf_hash(0, ADDRESSES[1], 101, 0)
+        assert not verify_proof(forged, proof_for(levels, 0), root)
+
+
+@pytest.mark.asyncio
+async def test_window_is_batched_and_roots_committed(db_path, database):
+    recorder = MerkleBatchRecorder(database, max_leaves=3)
+    result = await recorder.record(MockBlockchainService(), ADDRESSES, until=NOW)
+
+    assert result['status'] == 'success'
+    assert [batch['leaves'] for batch in result['batches']] == [3, 1]
+    assert result['skipped'] == 1 and result['committed'] == 2
+    assert _statuses(db_path) == {1: 'confirmed', 2: 'confirmed', 3: 'confirmed',
+                                  4: 'confirmed', 5: 'pending', 6: 'pending', 7: 'pending'}
+
+    proof = await recorder.get_proof(2, user_id=2)
+    assert proof['status'] == 'success' and proof['batch_status'] == 'committed'
+    assert (proof['euro_cents'], proof['gold_units']) == (25050, 29426)
+    leaf = leaf_hash(2, proof['address'], proof['euro_cents'], proof['gold_units'])
+    assert Web3.to_hex(leaf) == proof['leaf']
+    assert verify_proof(leaf, [Web3.to_bytes(hexstr=node) for node in proof['proof']],
+                        Web3.to_bytes(hexstr=proof['merkle_root']))
+
+    # Trasformazioni identiche danno foglie diverse; niente prove per altri utenti
+    assert (await recorder.get_proof(3))['leaf'] != (await recorder.get_proof(1))['leaf']
+    assert (await recorder.get_proof(2, user_id=1))['status'] == 'error'
+    assert (await recorder.get_proof(5))['status'] == 'error'
+
+    # Finestra già chiusa: niente nuovi lotti
+    again = await recorder.record(MockBlockchainService(), ADDRESSES, until=NOW)
+    await database.engine.dispose()
+    assert again['batches'] == [] and again['committed'] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_roots_are_retried(db_path, database):
+    recorder = MerkleBatchRecorder(database)
+    failed = await recorder.record(RejectingChain(), ADDRESSES, until=NOW)
+    assert failed['status'] == 'partial' and failed['failed'] == 1
+    assert _statuses(db_path)[1] == 'batched'
+    assert (await recorder.get_proof(1))['batch_status'] == 'failed'
+
+    retried = await recorder.record(MockBlockchainService(), ADDRESSES, until=NOW)
+    await database.engine.dispose()
+    assert retried['batches'] == [] and retried['committed'] == 1
+    assert _statuses(db_path)[4] == 'confirmed'
+
+
+@pytest.mark.asyncio
+async def test_receipt_timeout_is_not_a_failure(db_path, database):
+    recorder = MerkleBatchRecorder(database)
+    result = await recorder.record(TimeoutChain(), ADDRESSES, until=NOW)
+    assert result['status'] == 'partial'
+    assert (result['failed'], result['unconfirmed']) == (0, 1)
+    proof = await recorder.get_proof(1)
+    assert proof['batch_status'] == 'unconfirmed' and proof['transaction_hash'] == '0xabc'
+
+    # Radice minata dopo il timeout: confermata senza reinvio
+    chain = RootLookup({proof['merkle_root']: 1760616000})
+    again = await recorder.record(chain, ADDRESSES, until=NOW)
+    await database.engine.dispose()
+    assert again['committed'] == 1 and chain.submitted == []
+    assert _statuses(db_path)[1] == 'confirmed'
+    assert (await recorder.get_proof(1))['transaction_hash'] == '0xabc'
+
+
+@pytest.mark.asyncio
+async def test_failed_root_is_resubmitted_only_when_not_on_chain(db_path, database):
+    recorder = MerkleBatchRecorder(database, max_leaves=3)
+    await recorder.record(RejectingChain(), ADDRESSES, until=NOW)
+    roots = [(await recorder.get_proof(tid))['merkle_root'] for tid in (1, 4)]
+
+    # Il primo lotto era stato registrato nonostante l'errore riportato
+    chain = RootLookup({roots[0]: 1760616000})
+    result = await recorder.record(chain, ADDRESSES, until=NOW)
+    await database.engine.dispose()
+    assert result['committed'] == 2 and chain.submitted == [roots[1]]
+    assert _statuses(db_path)[1] == 'confirmed' and _statuses(db_path)[4] == 'confirmed'
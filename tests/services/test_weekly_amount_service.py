@@ -0,0 +1,95 @@
+import pytest
+from decimal import Decimal
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from app.database import DatabaseManager
+from app.models.weekly_amount import WeeklyAmount, WeeklyUserTotal
+from app.services.weekly_amount_service import (WeeklyAmountService, week_bounds,
+                                                 mark_weeks_processed)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'weekly.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        WeeklyAmount.__table__.create(conn)
+        WeeklyUserTotal.__table__.create(conn)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def database(db_path):
+    manager = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    manager.engine.sync_engine.echo = False
+    return manager
+
+
+def _rows(db_path, query):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        rows = conn.execute(text(query)).all()
+    engine.dispose()
+    return rows
+
+
+@pytest.mark.asyncio
+async def test_record_amount_updates_running_total(db_path, database):
+    for amount in ('100.00', '50.25', '0.75'):
+        result = await WeeklyAmountService.record_amount(1, Decimal(amount), database=database)
+        assert result['status'] == 'success'
+    await WeeklyAmountService.record_amount(2, Decimal('10.00'), database=database)
+
+    assert len(_rows(db_path, "SELECT id FROM weekly_amounts")) == 4
+    assert _rows(db_path, "SELECT user_id, total, deposits FROM weekly_user_totals "
+                          "ORDER BY user_id") == [(1, 151, 3), (2, 10, 1)]
+    assert await WeeklyAmountService.get_user_weekly_total(
+        1, database=database) == Decimal('151.00')
+    assert await WeeklyAmountService.get_user_weekly_total(
+        3, database=database) == Decimal('0')
+
+
+@pytest.mark.asyncio
+async def test_pending_totals_and_mark_week(database):
+    await WeeklyAmountService.record_amount(1, Decimal('20.00'), database=database)
+    await WeeklyAmountService.record_amount(1, Decimal('30.00'), database=database)
+    await WeeklyAmountService.record_amount(2, Decimal('5.00'), database=database)
+
+    pending = await WeeklyAmountService.get_pending_amounts(database=database)
+    assert [(p['user_id'], p['deposits']) for p in pending] == [(1, 2), (2, 1)]
+
+    assert await WeeklyAmountService.mark_as_processed(
+        datetime.utcnow(), database=database) == 2
+    assert await WeeklyAmountService.get_pending_amounts(database=database) == []
+
+
+@pytest.mark.asyncio
+async def test_weekly_job_closes_every_week_up_to_now(db_path, database):
+    await WeeklyAmountService.record_amount(1, Decimal('20.00'), database=database)
+    this_week, _ = week_bounds(datetime.utcnow())
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(WeeklyUserTotal.__table__.insert(), [
+            {'user_id': 1, 'week_start': this_week - timedelta(days=7),
+             'week_end': this_week - timedelta(microseconds=1),
+             'total': Decimal('5.00'), 'deposits': 1, 'processed': False}])
+    engine.dispose()
+
+    # Il job converte l'intero saldo: si chiude anche la settimana in corso
+    async with database.get_async_session() as session:
+        assert await mark_weeks_processed(session, datetime.utcnow()) == 2
+    assert await WeeklyAmountService.get_pending_amounts(database=database) == []
+    assert _rows(db_path, "SELECT processed FROM weekly_amounts") == [(1,)]
+
+    # Un versamento successivo riapre la settimana solo per il nuovo importo
+    await WeeklyAmountService.record_amount(1, Decimal('7.00'), database=database)
+    pending = await WeeklyAmountService.get_pending_amounts(database=database)
+    assert [(p['week_start'], p['total'], p['deposits']) for p in pending] == [
+        (this_week, Decimal('7.00'), 1)]
+
+
+def test_week_bounds_start_on_monday_midnight():
+    start, end = week_bounds(datetime(2026, 10, 18, 15, 30))
+    assert start == datetime(2026, 10, 12)
+    assert end == datetime(2026, 10, 18, 23, 59, 59, 999999)
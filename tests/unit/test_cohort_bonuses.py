@@ -0,0 +1,125 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, text
+from app.database import DatabaseManager
+from app.models.models import NobleRelation, GoldAccount, BonusTransaction, GoldReward
+from app.models.affiliate_bonus import AffiliateBonusWeek
+from app.services.bonus_distribution_service import BonusDistributionService
+from app.services.gold.fixed_point import rate_share
+from app.services.referral_index import ReferralIndex
+from app.services.referral_service import resolve_uplines
+
+# Utente 1 in cima, 2..6 diretti di 1, 7..11 diretti di 2
+PARENTS = {**{u: 1 for u in range(2, 7)}, **{u: 2 for u in range(7, 12)}}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'cohort.db'
+    engine = create_engine(f"sqlite:///{path}")
+    relations = []
+    for user_id, parent in PARENTS.items():
+        relations.append({'referrer_id': parent, 'referred_id': user_id, 'level': 1})
+        if parent in PARENTS:
+            relations.append({'referrer_id': PARENTS[parent],
+                              'referred_id': user_id, 'level': 2})
+    with engine.begin() as conn:
+        for table in (NobleRelation, GoldAccount, BonusTransaction, GoldReward,
+                      AffiliateBonusWeek):
+            table.__table__.create(conn)
+        conn.execute(insert(NobleRelation.__table__), relations)
+        conn.execute(insert(GoldAccount.__table__),
+                     [{'user_id': u, 'balance': Decimal('1.0000')} for u in range(1, 12)])
+    engine.dispose()
+    return path
+
+
+def test_rate_share_matches_decimal_quantize():
+    grams = [Decimal('0.0001') * n for n in range(0, 5000, 7)] + [Decimal('12.5000')]
+    units = [int(g * 10000) for g in grams]
+    expected = [int((g * Decimal('0.005')).quantize(Decimal('0.0001')) * 10000)
+                for g in grams]
+    assert rate_share(units, (5, 1000)).tolist() == expected
+
+
+@pytest.mark.asyncio
+async def test_cohort_matches_single_purchase_bonuses(db_path):
+    database = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    service = BonusDistributionService(database=database, index=ReferralIndex())
+    purchases = [(u, Decimal('3.3333') * u) for u in range(2, 12)] + [(7, Decimal('0.0071'))]
+
+    expected = {}
+    for user_id, grams in purchases:
+        bonuses = await service.calculate_purchase_bonuses(user_id, grams)
+        for beneficiary, bonus in bonuses.items():
+            if bonus['type'] == 'upline':
+                expected[beneficiary] = expected.get(beneficiary, Decimal('0')) + bonus['amount']
+
+    cohort = await service.calculate_cohort_bonuses(purchases)
+    await database.engine.dispose()
+    assert {u: c['amount'] for u, c in cohort.items()} == expected
+    assert cohort[1]['purchases'] == 11 and cohort[2]['purchases'] == 6
+
+
+@pytest.mark.asyncio
+async def test_sql_upline_matches_index(db_path):
+    database = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    indexed = BonusDistributionService(database=database, index=ReferralIndex())
+    fallback = BonusDistributionService(database=database, use_index=False)
+    purchases = [(u, Decimal('1.2345') * u) for u in range(1, 12)] + [(99, Decimal('5'))]
+
+    for user_id, grams in purchases:
+        assert (await fallback.calculate_purchase_bonuses(user_id, grams)
+                == await indexed.calculate_purchase_bonuses(user_id, grams))
+    assert (await fallback.calculate_cohort_bonuses(purchases)
+            == await indexed.calculate_cohort_bonuses(purchases))
+
+    # Lista grande: stessa risposta passando dalla tabella temporanea, riusabile
+    async with database.get_async_session() as session:
+        direct = sorted(await resolve_uplines(session, range(1, 12)))
+        via_temp = sorted(await resolve_uplines(session, range(1, 12), temp_threshold=0))
+        again = sorted(await resolve_uplines(session, [7, 8], temp_threshold=0))
+    await database.engine.dispose()
+    assert via_temp == direct and len(direct) == 15
+    assert again == [(7, 1, 2), (7, 2, 1), (8, 1, 2), (8, 2, 1)]
+
+
+@pytest.mark.asyncio
+async def test_distribute_one_credit_per_beneficiary(db_path):
+    database = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    service = BonusDistributionService(database=database, index=ReferralIndex())
+    purchases = [(7, Decimal('10'))] * 500
+
+    result = await service.distribute_cohort_bonuses(purchases)
+    await database.engine.dispose()
+    assert result['status'] == 'success' and result['beneficiaries'] == 2
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        balances = dict(conn.execute(text(
+            "SELECT user_id, balance FROM gold_accounts WHERE user_id IN (1, 2)")).all())
+        assert balances == {1: pytest.approx(26.0), 2: pytest.approx(36.0)}
+        assert conn.execute(text("SELECT COUNT(*) FROM bonus_transactions")).scalar() == 2
+        assert conn.execute(text("SELECT COUNT(*), SUM(reward_amount) FROM gold_rewards")).one() == (2, 60.0)
+        assert conn.execute(text(
+            "SELECT user_id, level, amount, bonuses FROM affiliate_bonus_weeks ORDER BY user_id")
+        ).all() == [(1, 2, 25.0, 500), (2, 1, 35.0, 500)]
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_missing_gold_account_rolls_back(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM gold_accounts WHERE user_id = 1"))
+    database = DatabaseManager(f"sqlite+aiosqlite:///{db_path}")
+    service = BonusDistributionService(database=database, index=ReferralIndex())
+
+    result = await service.distribute_cohort_bonuses([(7, Decimal('10'))])
+    await database.engine.dispose()
+    assert result['status'] == 'error'
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM bonus_transactions")).scalar() == 0
+        assert conn.execute(text("SELECT COUNT(*) FROM affiliate_bonus_weeks")).scalar() == 0
+        assert conn.execute(text("SELECT balance FROM gold_accounts WHERE user_id = 2")).scalar() == 1.0
+    engine.dispose()
@@ -0,0 +1,92 @@
+import random
+import pytest
+import numpy as np
+from decimal import Decimal, ROUND_DOWN
+from app.services.gold import fixed_point
+
+SAMPLES = 20000
+EDGE_CENTS = [0, 1, 99, 100, 10001, 87700, 100000, 99999999, 10_000_000_000]
+EDGE_PRICES = [Decimal('0.0001'), Decimal('1'), Decimal('50.00'),
+               Decimal('85.13'), Decimal('1800.00'), Decimal('2345.6789')]
+
+
+def _decimal_weekly_distribution(balance: Decimal, fixing_price: Decimal):
+    """Percorso Decimal di WeeklyGoldDistribution con troncamento a 0.0001 g"""
+    net_amount = balance - balance * Decimal('0.05')
+    total_gold = (net_amount / fixing_price).quantize(Decimal('0.0001'), rounding=ROUND_DOWN)
+    affiliate = (total_gold * Decimal('0.017')).quantize(Decimal('0.0001'), rounding=ROUND_DOWN)
+    return total_gold, affiliate, total_gold - affiliate, balance * Decimal('0.067')
+
+
+def _decimal_weekly_transformation(balance: Decimal, fixing_price: Decimal):
+    """Percorso Decimal di WeeklyProcessor in centesimi di grammo"""
+    gold = (balance / fixing_price).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+    net_gold = (gold * (1 - Decimal('0.05'))).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+    return gold, net_gold
+
+
+def _decimal_transformation(amount: Decimal, fixing_price: Decimal):
+    """Percorso Decimal di TransformationService.execute_transformation"""
+    spread = amount * (Decimal('5.0') + Decimal('1.7')) / Decimal('100')
+    gold = ((amount - spread) / fixing_price).quantize(Decimal('0.0001'), rounding=ROUND_DOWN)
+    return spread, gold
+
+
+def _samples():
+    rng = random.Random(20241219)
+    cents = EDGE_CENTS + [rng.randint(0, 10_000_000_000) for _ in range(SAMPLES)]
+    prices = EDGE_PRICES + [Decimal(rng.randint(1, 100_000_000)).scaleb(-4)
+                            for _ in range(8)]
+    return cents, prices
+
+
+def test_weekly_distribution_matches_decimal_path():
+    cents, prices = _samples()
+    for price in prices:
+        result = fixed_point.weekly_distribution(
+            np.array(cents), fixed_point.price_to_units(price))
+        for i, c in enumerate(cents):
+            total, affiliate, client, fee = _decimal_weekly_distribution(
+                Decimal(c).scaleb(-2), price)
+            assert fixed_point.units_to_decimal(result.total_gold[i]) == total
+            assert fixed_point.units_to_decimal(result.affiliate_gold[i]) == affiliate
+            assert fixed_point.units_to_decimal(result.client_gold[i]) == client
+            assert fixed_point.units_to_decimal(result.fee[i], -5) == fee
+
+
+def test_weekly_transformation_matches_decimal_path():
+    cents, prices = _samples()
+    for price in prices:
+        result = fixed_point.weekly_transformation(
+            np.array(cents), fixed_point.price_to_units(price))
+        for i, c in enumerate(cents):
+            gold, net_gold = _decimal_weekly_transformation(Decimal(c).scaleb(-2), price)
+            assert fixed_point.units_to_decimal(result.gold[i]) == gold
+            assert fixed_point.units_to_decimal(result.net_gold[i]) == net_gold
+
+
+def test_transformation_spread_matches_decimal_path():
+    cents, prices = _samples()
+    for price in prices:
+        result = fixed_point.transformation_spread(
+            np.array(cents), fixed_point.price_to_units(price))
+        for i, c in enumerate(cents):
+            spread, gold = _decimal_transformation(Decimal(c).scaleb(-2), price)
+            assert fixed_point.units_to_decimal(result.spread[i], -5) == spread
+            assert fixed_point.units_to_decimal(result.gold[i]) == gold
+
+
+def test_to_cents_truncates():
+    assert fixed_point.to_cents(Decimal('100.019')) == 10001
+    assert fixed_point.to_cents(Decimal('0.009')) == 0
+
+
+@pytest.mark.parametrize("price", [Decimal('0'), Decimal('-1'), Decimal('85.12345')])
+def test_invalid_fixing_price(price):
+    with pytest.raises(ValueError):
+        fixed_point.price_to_units(price)
+
+
+def test_negative_balance_rejected():
+    with pytest.raises(ValueError):
+        fixed_point.weekly_distribution(np.array([-1]), 851300)
@@ -0,0 +1,69 @@
+import pytest
+from decimal import Decimal
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.models.models import Transaction, GoldTransformation, TransactionType
+from app.services.ledger_writer import LedgerWriter, IdRange
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ledger.db'}")
+    with engine.begin() as conn:
+        Transaction.__table__.create(conn)
+        GoldTransformation.__table__.create(conn)
+    yield engine
+    engine.dispose()
+
+
+def _transaction(user_id):
+    return {'user_id': user_id, 'amount': Decimal('10.00') + user_id,
+            'transaction_type': TransactionType.GOLD_PURCHASE,
+            'status': 'completed', 'date': datetime(2026, 10, 12)}
+
+
+def test_sync_write_in_batches_returns_id_range(engine):
+    writer = LedgerWriter('transactions', batch_size=7)
+    with engine.begin() as conn:
+        first = writer.write_sync(conn, (_transaction(i) for i in range(1, 24)))
+        second = writer.write_sync(conn, [_transaction(99)])
+
+    assert first == IdRange(1, 23, 23) and first.contiguous
+    assert second == IdRange(24, 24, 1)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*), SUM(amount) FROM transactions")).one() == (24, 615.0)
+
+
+def test_write_ids_returns_exact_ids(engine):
+    writer = LedgerWriter('transactions', batch_size=3)
+    with engine.begin() as conn:
+        writer.write_sync(conn, [_transaction(1), _transaction(2)])
+        ids = writer.write_ids_sync(conn, [_transaction(i) for i in range(3, 10)])
+        writer.write_sync(conn, [_transaction(10)])
+
+    # Gli id della riga precedente e successiva non rientrano
+    assert sorted(ids) == list(range(3, 10))
+
+
+def test_tuple_rows_need_columns(engine):
+    columns = ['user_id', 'euro_amount', 'gold_grams', 'fixing_price', 'status']
+    writer = LedgerWriter('gold_transformations', batch_size=2, columns=columns)
+    rows = [(i, Decimal('100.00'), Decimal('1.1159'), Decimal('85.13'), 'verified')
+            for i in range(1, 6)]
+    with engine.begin() as conn:
+        assert writer.write_sync(conn, rows) == IdRange(1, 5, 5)
+        assert writer.write_sync(conn, []) == IdRange(None, None, 0)
+
+    with pytest.raises(ValueError):
+        LedgerWriter('gold_transformations').write_sync(None, rows)
+
+
+@pytest.mark.asyncio
+async def test_async_write(tmp_path, engine):
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ledger.db'}")
+    async with async_engine.begin() as conn:
+        id_range = await LedgerWriter(batch_size=50).write(
+            conn, [_transaction(i) for i in range(1, 121)])
+    await async_engine.dispose()
+    assert id_range == IdRange(1, 120, 120)
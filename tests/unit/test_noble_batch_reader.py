@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from eth_abi import encode
+from web3 import Web3
+from app.services.noble_batch_reader import FIELDS, NobleBatchReader
+from app.utils.web3_provider import close_pooled_sessions
+from tests.performance.rpc_stand_in import StandInNode
+
+CONTRACT = '0x' + '99' * 20
+REVERTING = Web3.to_checksum_address('0x' + 'ee' * 20)
+SELECTORS = {Web3.to_hex(selector): name for name, selector in FIELDS}
+
+
+class Chain:
+    """Rango = ultimo byte dell'indirizzo, premi = rango ether"""
+
+    def __init__(self):
+        self.block = 100
+
+    def eth_call(self, params):
+        data = params[0]['data']
+        address = Web3.to_checksum_address('0x' + data[-40:])
+        if address == REVERTING:
+            raise ValueError('execution reverted')
+        rank = int(data[-2:], 16)
+        value = rank if SELECTORS[data[:10]] == 'rank' else rank * 10 ** 18
+        return Web3.to_hex(encode(['uint256'], [value]))
+
+
+@pytest.fixture
+def chain():
+    return Chain()
+
+
+@pytest.fixture
+def node(chain):
+    methods = {'eth_call': chain.eth_call, 'eth_blockNumber': lambda params: hex(chain.block)}
+    with StandInNode(latency=0.001, methods=methods) as stand_in:
+        yield stand_in
+
+
+def _address(rank):
+    return '0x' + '10' * 19 + f'{rank:02x}'
+
+
+def test_reads_are_batched_and_cached_per_block(node, chain):
+    addresses = [_address(rank) for rank in range(1, 26)] + [_address(3)]
+
+    async def scenario():
+        reader = NobleBatchReader(node.url, CONTRACT, chunk_size=10, max_concurrency=2)
+        try:
+            first = await reader.read(addresses + [REVERTING])
+            requests_after_first = node.requests
+            cached = await reader.read(addresses[:5])
+            chain.block += 1
+            new_block = await reader.read(addresses[:5])
+            return reader, first, requests_after_first, cached, new_block
+        finally:
+            await close_pooled_sessions()
+
+    node.requests = 0
+    reader, first, requests_after_first, cached, new_block = asyncio.run(scenario())
+
+    values = first['values']
+    assert first['block_number'] == 100 and len(values) == 26
+    assert values[Web3.to_checksum_address(_address(7))] == {'rank': 7,
+                                                             'total_rewards': 7 * 10 ** 18}
+    assert 'reverted' in values[REVERTING]['error']
+    # 1 blockNumber + 3 batch da al più 10 indirizzi (2 eth_call ciascuno)
+    assert requests_after_first == 4
+
+    # Stesso blocco: solo blockNumber; nuovo blocco: si rilegge
+    assert node.requests - requests_after_first == 1 + 1 + 1
+    assert cached['values'] == {address: values[address] for address in cached['values']}
+    assert new_block['block_number'] == 101
+    assert reader.stats['batches'] == 4 and reader.stats['cache_hits'] == 5
@@ -0,0 +1,101 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, insert
+from app.database import DatabaseManager
+from app.models.models import NobleRelation
+from app.services.referral_index import ReferralIndex
+
+# Catena 1 <- 2 <- 3 <- 4 <- 5 (ogni utente è referrer del successivo)
+CHAIN = [(1, 2), (2, 3), (3, 4), (4, 5)]
+
+
+def _relations(pairs):
+    rows = []
+    for referrer, referred in pairs:
+        for level in range(1, 4):
+            if referred - level >= 1:
+                rows.append({'referrer_id': referred - level,
+                             'referred_id': referred, 'level': level})
+    return rows
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / 'referrals.db'
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        NobleRelation.__table__.create(conn)
+        conn.execute(insert(NobleRelation.__table__), _relations(CHAIN))
+    engine.dispose()
+    return DatabaseManager(f"sqlite+aiosqlite:///{path}")
+
+
+@pytest.mark.asyncio
+async def test_load_builds_upline_and_downline(database):
+    index = ReferralIndex(capacity=2, fetch_size=3)
+    assert await index.load(database) == 9
+    await database.engine.dispose()
+
+    assert index.upline(5) == [(4, 1), (3, 2), (2, 3)]
+    assert index.upline(2) == [(1, 1)]
+    assert index.upline(1) == [] and index.upline(10 ** 6) == []
+    # L'ultima relazione di 2 come referrer è quella di livello 3 verso 5
+    assert index.downline_level(2) == 3
+    assert index.downline_level(4) == 1
+    assert index.downline_level(5) == 0
+    assert index.ancestors.shape[0] >= 6
+
+
+@pytest.mark.asyncio
+async def test_add_referral_and_refresh(database):
+    index = ReferralIndex()
+    await index.load(database)
+
+    index.add_referral(5, 6)
+    assert index.upline(6) == [(5, 1), (4, 2), (3, 3)]
+    assert index.downline_level(3) == 3
+
+    engine = create_engine(f"sqlite:///{database.engine.url.database}")
+    with engine.begin() as conn:
+        conn.execute(insert(NobleRelation.__table__),
+                     [{'referrer_id': 1, 'referred_id': 2000, 'level': 1}])
+    engine.dispose()
+
+    assert await index.refresh(database) == 1
+    assert await index.refresh(database) == 0
+    await database.engine.dispose()
+    assert index.upline(2000) == [(1, 1)]
+    assert index.downline_level(1) == 1
+
+
+def test_add_referral_propagates_to_existing_downline():
+    index = ReferralIndex(capacity=4)
+    for referrer, referred in [(5, 6), (6, 7), (7, 8)]:
+        index.add_referral(referrer, referred)
+
+    # 5 ha già la downline 6 <- 7 <- 8: il nuovo referrer 4 sale fino al 3° livello
+    index.add_referral(4, 5)
+    assert index.upline(6) == [(5, 1), (4, 2)]
+    assert index.upline(7) == [(6, 1), (5, 2), (4, 3)]
+    assert index.upline(8) == [(7, 1), (6, 2), (5, 3)]
+    assert index.downline_level(4) == 3
+
+    index.add_referral(3, 4)
+    assert index.upline(5) == [(4, 1), (3, 2)]
+    assert index.upline(6) == [(5, 1), (4, 2), (3, 3)]
+    assert index.upline(7) == [(6, 1), (5, 2), (4, 3)]
+
+
+@pytest.mark.asyncio
+async def test_purchase_bonuses_from_index(database):
+    from app.services.bonus_distribution_service import BonusDistributionService
+    service = BonusDistributionService(database=database, index=ReferralIndex())
+    bonuses = await service.calculate_purchase_bonuses(5, Decimal('100'))
+    await database.engine.dispose()
+
+    assert {user_id: (b['level'], b['amount'], b['type'])
+            for user_id, b in bonuses.items()} == {
+        4: (1, Decimal('0.7000'), 'upline'),
+        3: (2, Decimal('0.5000'), 'upline'),
+        2: (3, Decimal('0.5000'), 'upline'),
+    }
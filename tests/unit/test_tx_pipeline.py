@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+import rlp
+from types import SimpleNamespace
+from eth_account import Account
+from web3.exceptions import TransactionNotFound
+from app.services.tx_pipeline import NonceManager, TransactionPipeline, pipeline_for
+
+KEY = '0x' + '11' * 32
+ACCOUNT = Account.from_key(KEY)
+
+
+class FakeNode:
+    """Nodo minimo: mina in ordine di nonce una transazione per ogni poll"""
+
+    def __init__(self, start_nonce=5, fail_sends=()):
+        self.confirmed = start_nonce
+        self.mempool = {}
+        self.receipts = {}
+        self.fail_sends = set(fail_sends)
+        self.sends = 0
+        self.max_mempool = 0
+        self.eth = SimpleNamespace(
+            gas_price=30, account=Account,
+            get_transaction_count=self.get_transaction_count,
+            send_raw_transaction=self.send_raw_transaction,
+            get_transaction_receipt=self.get_transaction_receipt)
+
+    def get_transaction_count(self, address, block):
+        return self.confirmed + (len(self.mempool) if block == 'pending' else 0)
+
+    def send_raw_transaction(self, raw):
+        self.sends += 1
+        if self.sends in self.fail_sends:
+            raise ValueError('connection reset')
+        nonce = int.from_bytes(rlp.decode(raw)[0], 'big')
+        if nonce < self.confirmed or nonce in self.mempool:
+            raise ValueError('nonce too low')
+        tx_hash = bytes([len(self.receipts) + len(self.mempool)]) + raw[-31:]
+        self.mempool[nonce] = tx_hash
+        self.max_mempool = max(self.max_mempool, len(self.mempool))
+        return tx_hash
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash in self.receipts:
+            return self.receipts[tx_hash]
+        if self.mempool.get(self.confirmed) == tx_hash:
+            del self.mempool[self.confirmed]
+            self.receipts[tx_hash] = SimpleNamespace(
+                status=1, transactionHash=tx_hash, blockNumber=100 + self.confirmed)
+            self.confirmed += 1
+            return self.receipts[tx_hash]
+        raise TransactionNotFound('pending')
+
+
+class Call:
+    def build_transaction(self, params):
+        return {**params, 'to': '0x' + '22' * 20, 'data': '0x', 'chainId': 1}
+
+
+@pytest.mark.asyncio
+async def test_many_transactions_in_flight_with_contiguous_nonces():
+    node = FakeNode()
+    pipeline = TransactionPipeline(node, ACCOUNT, KEY, max_in_flight=8, poll_interval=0)
+
+    futures = [await pipeline.submit(Call()) for _ in range(30)]
+    results = await asyncio.gather(*futures)
+    await pipeline.close()
+
+    assert [r['status'] for r in results] == ['completed'] * 30
+    assert [r['block_number'] for r in results] == list(range(105, 135))
+    assert node.max_mempool == 8
+    assert pipeline.stats == {'submitted': 30, 'confirmed': 30, 'failed': 0, 'timeout': 0}
+
+
+@pytest.mark.asyncio
+async def test_failed_broadcast_releases_nonce_for_next_submission():
+    node = FakeNode(fail_sends={2})
+    pipeline = TransactionPipeline(node, ACCOUNT, KEY, poll_interval=0)
+
+    futures = [await pipeline.submit(Call()) for _ in range(4)]
+    results = await asyncio.gather(*futures)
+    await pipeline.close()
+
+    assert [r['status'] for r in results] == ['completed', 'error', 'completed', 'completed']
+    # Il nonce 6 lasciato libero dall'invio fallito viene riusato: nessun buco
+    assert node.confirmed == 8 and not node.mempool
+
+
+@pytest.mark.asyncio
+async def test_resync_after_external_sender_and_dropped_transactions():
+    node = FakeNode(start_nonce=0)
+    pipeline = TransactionPipeline(node, ACCOUNT, KEY, poll_interval=0)
+    await (await pipeline.submit(Call()))
+
+    node.confirmed += 2  # due transazioni inviate da un altro processo
+    result = await (await pipeline.submit(Call()))
+    await pipeline.close()
+    assert result['status'] == 'completed' and result['block_number'] == 103
+
+    counts = iter([4, 4])
+    nonces = NonceManager(lambda: next(counts))
+    assert [await nonces.reserve() for _ in range(3)] == [4, 5, 6]
+    await nonces.resync(in_flight=[6])  # 4 e 5 scartati dal mempool
+    assert [await nonces.reserve() for _ in range(3)] == [4, 5, 7]
+
+
+@pytest.mark.asyncio
+async def test_missing_receipt_is_reported_as_timeout_not_failure():
+    node = FakeNode()
+    node.eth.get_transaction_receipt = lambda tx_hash: None  # mai minata
+    pipeline = TransactionPipeline(node, ACCOUNT, KEY, poll_interval=0, receipt_timeout=0)
+
+    result = await (await pipeline.submit(Call()))
+    await pipeline.close()
+
+    assert result['status'] == 'timeout' and result['transaction_hash']
+    assert pipeline.stats['timeout'] == 1 and pipeline.stats['failed'] == 0
+    # Ancora nel mempool: il nonce non diventa un buco da riusare
+    assert await pipeline.nonces.reserve() == 6
+
+
+def test_one_pipeline_per_account_address():
+    node = FakeNode()
+    first = pipeline_for(node, ACCOUNT, KEY, poll_interval=0)
+    assert pipeline_for(FakeNode(), ACCOUNT, KEY) is first
+    other = Account.create()
+    assert pipeline_for(node, other, other.key.hex()) is not first
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from web3 import AsyncWeb3, Web3
+from app.utils.web3_provider import (PROVIDER_ASYNC, close_pooled_sessions, create_web3,
+                                     install_pooled_session, provider_mode, resolve)
+from tests.performance.rpc_stand_in import BLOCK_NUMBER, StandInNode
+
+
+@pytest.fixture(scope='module')
+def node():
+    with StandInNode(latency=0.01) as stand_in:
+        yield stand_in
+
+
+def test_provider_mode_from_configuration(monkeypatch):
+    monkeypatch.delenv('WEB3_PROVIDER', raising=False)
+    assert isinstance(create_web3('http://127.0.0.1:8545'), Web3)
+
+    monkeypatch.setenv('WEB3_PROVIDER', 'ASYNC')
+    assert provider_mode() == PROVIDER_ASYNC
+    assert isinstance(create_web3('http://127.0.0.1:8545'), AsyncWeb3)
+
+    monkeypatch.setenv('WEB3_PROVIDER', 'websocket')
+    with pytest.raises(ValueError):
+        provider_mode()
+
+
+def test_sync_and_async_clients_read_the_same_values(node):
+    sync_client = create_web3(node.url, mode='sync')
+
+    async def read():
+        client = create_web3(node.url, mode='async')
+        await install_pooled_session(client)
+        try:
+            return (await resolve(client.eth.block_number),
+                    await resolve(sync_client.eth.block_number))
+        finally:
+            await close_pooled_sessions()
+
+    assert asyncio.run(read()) == (BLOCK_NUMBER, BLOCK_NUMBER)
+
+
+def test_async_calls_share_the_pooled_session(node):
+    async def burst():
+        client = create_web3(node.url, mode='async')
+        await install_pooled_session(client, pool_size=20)
+        try:
+            await resolve(client.eth.chain_id)
+            start = asyncio.get_running_loop().time()
+            await asyncio.gather(*(resolve(client.eth.block_number) for _ in range(20)))
+            return asyncio.get_running_loop().time() - start
+        finally:
+            await close_pooled_sessions()
+
+    # 20 chiamate da 10 ms in volo insieme, non una dopo l'altra
+    assert asyncio.run(burst()) < 0.15